@@ -0,0 +1,105 @@
+"""
+Helpers for driving bot-ui.py through Streamlit's AppTest against the fake API.
+"""
+import ast
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOGFILE", os.devnull)
+warnings.filterwarnings("ignore")
+
+from streamlit.runtime import Runtime
+from streamlit.testing.v1 import AppTest, app_test
+from fake_openai import FakeOpenAI
+
+
+def startFakeApi(**kwargs) -> FakeOpenAI:
+    """
+    Starts the fake API and points the app's environment at it.
+
+    Unless the benchmark chose its own, the conversation database and image
+    cache go to a temporary directory, so runs never touch the developer's.
+    Call it before anything imports util, which reads these at import.
+    """
+    server = FakeOpenAI(**kwargs).start()
+    scratch = tempfile.mkdtemp(prefix="bench-")
+    os.environ.setdefault("CONVERSATION_DB", os.path.join(scratch, "conversations.db"))
+    os.environ.setdefault("IMAGE_CACHE_DIR", os.path.join(scratch, "image_cache"))
+    os.environ.update(
+        OPENAI_API_KEY="fake",
+        OPENAI_BASE_URL=server.base_url,
+        OPENAI_ASSISTANT_ID="asst_fake",
+    )
+    return server
+
+
+def newSession(timeout: float = 60, assistant: str = None) -> AppTest:
+    """Opens a new browser session on bot-ui.py, on ?assistant= if given, and waits for the greeting."""
+    at = AppTest.from_file(os.path.join(ROOT, "bot-ui.py"), default_timeout=timeout)
+    if assistant:
+        at.query_params["assistant"] = assistant
+    return at.run()
+
+
+def playTurn(at: AppTest, turn: int) -> AppTest:
+    """Answers the latest bot message, clicking a button if there is one."""
+    buttons = [b for b in at.button if not b.disabled]
+    if buttons:
+        return waitForTurn(buttons[0].click().run())
+    return waitForTurn(at.chat_input[0].set_value(f"answer {turn}").run())
+
+
+def waitForTurn(at: AppTest) -> AppTest:
+    """
+    Reruns the app once a background turn (ORCHESTRATION=background) has been answered.
+
+    A browser follows the turn with the live tail's timer, which only reruns
+    the fragment. AppTest can't run fragments on their own, and a full rerun
+    per poll would bill the history to every poll, so this watches the job
+    and reruns once it is done.
+    """
+    interval = float(os.environ.get("ORCHESTRATION_POLL_INTERVAL", 0.25))
+    while not at.exception and "turnJob" in at.session_state:
+        job = at.session_state["turnJob"]
+        while not job.done:
+            time.sleep(interval)
+        at.run()
+    return at
+
+
+def allowConcurrentSessions() -> None:
+    """
+    Lets several AppTests run at once from different threads.
+
+    Each AppTest run installs a mock Runtime singleton and clears it when it
+    finishes, which pulls the runtime out from under any other run still in
+    progress. This keeps handing out the last mock instead. Every run also
+    gets one shared ScriptCache, as in a real server, and ast.parse is
+    serialized, since parsing on several threads at once can fail on 3.11.
+    """
+    pinned = {}
+    scriptCache = app_test.ScriptCache()
+    app_test.ScriptCache = lambda: scriptCache
+    parse, parseLock = ast.parse, threading.Lock()
+
+    def lockedParse(*args, **kwargs):
+        with parseLock:
+            return parse(*args, **kwargs)
+
+    ast.parse = lockedParse
+
+    def instance(cls):
+        if cls._instance is not None:
+            pinned["runtime"] = cls._instance
+        if "runtime" not in pinned:
+            raise RuntimeError("Runtime hasn't been created!")
+        return pinned["runtime"]
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or "runtime" in pinned)
@@ -0,0 +1,129 @@
+"""
+Compares util.event_codec with pydantic's model_dump_json/model_validate_json
+for encoding speed and size, per event and for a whole session history.
+
+Run from the repository root:
+    python benchmarks/bench_codec.py --turns 50
+"""
+import argparse
+import os
+import sys
+import timeit
+import warnings
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOGFILE", os.devnull)
+warnings.filterwarnings("ignore")
+
+from util import event_codec
+from util.pydantic_classes import (
+    BotButtonMessage,
+    BotImageMessage,
+    BotMessage,
+    BotTextMessage,
+    Choice,
+    Event,
+)
+
+
+def makeHistory(turns: int):
+    """Builds a quiz-like history: text, buttons and the odd image, with user replies."""
+    history = []
+    userId, conversationId = Event.gen_userId(), Event.gen_convId()
+    for turn in range(turns):
+        replies = [
+            BotMessage(
+                type="text",
+                payload=BotTextMessage(
+                    text=f"Question {turn}: which of these best describes your ideal weekend? " * 2
+                ),
+            ),
+            BotMessage(
+                type="button",
+                payload=BotButtonMessage(
+                    text="Pick one",
+                    choices=[Choice(label=f"Option {c}", value=c) for c in "abcd"],
+                    active=False,
+                ),
+            ),
+        ]
+        if turn % 5 == 0:
+            replies.append(
+                BotMessage(
+                    type="image",
+                    payload=BotImageMessage(cacheKey=f"{turn:064x}"),
+                )
+            )
+        history.append(
+            {
+                "role": "assistant",
+                "content": Event(
+                    userId=userId,
+                    conversationId=conversationId,
+                    direction="outgoing",
+                    botReply=replies,
+                ),
+            }
+        )
+        history.append(
+            {
+                "role": "user",
+                "content": Event(
+                    userId=userId,
+                    conversationId=conversationId,
+                    direction="incoming",
+                    payload={"type": "button", "text": "b"},
+                ),
+            }
+        )
+    return history
+
+
+def timeIt(fn, number: int) -> float:
+    """Returns the best per-call time in microseconds over a few repeats."""
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    history = makeHistory(args.turns)
+    events = [m["content"] for m in history]
+    backend = "msgpack" if event_codec.msgpack else "json"
+    print(f"codec backend: {backend}, {len(events)} events")
+
+    pydanticDumps = [e.model_dump_json().encode() for e in events]
+    codecDumps = [event_codec.dumps(e) for e in events]
+    n = args.number
+    rows = [
+        (
+            "event dumps",
+            timeIt(lambda: [e.model_dump_json() for e in events], n // 10) / len(events),
+            timeIt(lambda: [event_codec.dumps(e) for e in events], n // 10) / len(events),
+        ),
+        (
+            "event loads",
+            timeIt(lambda: [Event.model_validate_json(d) for d in pydanticDumps], n // 10) / len(events),
+            timeIt(lambda: [event_codec.loads(d) for d in codecDumps], n // 10) / len(events),
+        ),
+    ]
+    print(f"{'':<14}{'pydantic':>12}{'codec':>12}")
+    for name, before, after in rows:
+        print(f"{name:<14}{before:>10.1f}us{after:>10.1f}us  {before / after:.1f}x")
+
+    pydanticHistory = b"\n".join(pydanticDumps)
+    codecHistory = event_codec.dumpsHistory(history)
+    print(
+        f"history size  pydantic={len(pydanticHistory) / 1024:.1f}KiB "
+        f"(zlib {len(zlib.compress(pydanticHistory)) / 1024:.1f}KiB)  "
+        f"codec={len(codecHistory) / 1024:.1f}KiB "
+        f"(zlib {len(zlib.compress(codecHistory)) / 1024:.1f}KiB)"
+    )
+    print(
+        f"history dumps codec={timeIt(lambda: event_codec.dumpsHistory(history), n // 10) / 1000:.2f}ms "
+        f"loads codec={timeIt(lambda: event_codec.loadsHistory(codecHistory), n // 10) / 1000:.2f}ms"
+    )
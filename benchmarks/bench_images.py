@@ -0,0 +1,115 @@
+"""
+Measures what showing one generated image costs on every rerun, for each way
+makeImage can deliver it. A DALL-E-sized image (a noisy 1024x1024 PNG) is
+generated through the fake API and then drawn by a one-image script:
+
+- remote URL: the hosted URL goes to st.image and the browser fetches it
+- cached bytes: the full PNG from the image cache goes to st.image
+- thumbnail bytes: the thumbnail from the image store goes to st.image
+- static URL: the thumbnail is loaded from the image store by URL
+  (server.enableStaticServing), linking to the full-size image
+
+Per rerun it reports the bytes the server hands to Streamlit's media file
+manager, the size of the element protos sent to the browser, the script run
+time, and the image bytes the browser downloads to show the image.
+
+Run from the repository root:
+    python benchmarks/bench_images.py --reruns 20
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("IMAGE_CACHE_DIR", tempfile.mkdtemp(prefix="bench-image-cache-"))
+
+from app_session import startFakeApi
+from streamlit import config
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.testing.v1 import AppTest
+
+# Newer Streamlit versions warn about use_column_width on every st.image call
+logging.getLogger("streamlit.deprecation_util").addFilter(
+    lambda record: "use_column_width" not in record.getMessage()
+)
+
+
+def drawImage():
+    import streamlit as st
+    from util.make_elements import makeImage
+
+    makeImage(st.session_state["payload"])
+
+
+def protoBytes(node) -> int:
+    """Sums the serialized size of the element protos under an AppTest node."""
+    size = node.proto.ByteSize() if getattr(node, "proto", None) is not None else 0
+    return size + sum(protoBytes(child) for child in getattr(node, "children", {}).values())
+
+
+def measure(payload, staticServing: bool, reruns: int):
+    """Reruns the one-image script and returns per-rerun media bytes, proto bytes and run time."""
+    config.set_option("server.enableStaticServing", staticServing)
+    mediaBytes = []
+    add = MediaFileManager.add
+
+    def countingAdd(self, data, *args, **kwargs):
+        mediaBytes[-1] += len(data) if isinstance(data, bytes) else 0
+        return add(self, data, *args, **kwargs)
+
+    MediaFileManager.add = countingAdd
+    try:
+        at = AppTest.from_function(drawImage, default_timeout=60)
+        at.session_state["payload"] = payload
+        times, protos = [], []
+        for _ in range(reruns + 1):
+            mediaBytes.append(0)
+            start = time.perf_counter()
+            at.run()
+            times.append(time.perf_counter() - start)
+            protos.append(protoBytes(at._tree))
+            assert not at.exception, at.exception
+    finally:
+        MediaFileManager.add = add
+    # The first run also imports and registers everything, so it is left out
+    return mediaBytes[1:], protos[1:], times[1:]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--size", type=int, default=1024, help="Width and height of the fake image")
+    args = parser.parse_args()
+
+    server = startFakeApi(imageSize=args.size, imageLatency=0)
+    from util.generate_image import generateImage
+    from util.image_store import imageStore
+    from util.pydantic_classes import BotImageMessage
+
+    generated = generateImage("a lighthouse at dusk")
+    thumbnail = imageStore.read(generated.thumbnail)
+    print(
+        f"original {len(server.imageBytes)} bytes, "
+        f"thumbnail {len(thumbnail)} bytes ({generated.thumbnail.rsplit('.', 1)[-1]})"
+    )
+    variants = [
+        ("remote URL", BotImageMessage(url=generated.url), False, len(server.imageBytes)),
+        # st.image re-encodes bytes, and the browser downloads what it hands to the media file manager
+        ("cached bytes", BotImageMessage(cacheKey=generated.cacheKey), False, None),
+        ("thumbnail bytes", generated, False, None),
+        ("static URL", generated, True, len(thumbnail)),
+    ]
+    print(
+        f"{'':>16} {'media B/rerun':>14} {'proto B/rerun':>14} {'rerun p50':>10} {'image B shown':>14}"
+    )
+    for label, payload, staticServing, shownBytes in variants:
+        mediaBytes, protos, times = measure(payload, staticServing, args.reruns)
+        print(
+            f"{label:>16} {statistics.mean(mediaBytes):>14.0f} {statistics.mean(protos):>14.0f}"
+            f" {statistics.median(times) * 1000:>8.1f}ms {shownBytes or mediaBytes[0]:>14}"
+        )
+    server.stop()
@@ -0,0 +1,205 @@
+"""
+Load-tests one bot-ui.py process with many concurrent simulated sessions.
+
+Every session is its own AppTest driven from a worker thread. Like browser
+sessions in one Streamlit server, they share the process, the OpenAI client
+and every st.cache_resource. Each session opens the app and then plays
+`--turns` turns against the fake API, which can inject latency, tool calls,
+429s and failed runs. Reported:
+
+- throughput: completed turns per second across all sessions
+- startup / turn latency percentiles (wall time of each AppTest run); with
+  --opener-pool, startups take ready greetings until the pool runs dry
+- errored turns: turns that raised or showed the run-failed apology
+- memory per session: growth in process RSS, and the pickled session state
+- API calls per turn, by endpoint
+
+With --assistants, that many assistants are provisioned and sessions are
+spread over them with ?assistant=, as when one process hosts many bots.
+
+Run from the repository root:
+    python benchmarks/bench_load.py --sessions 20 --turns 5
+    python benchmarks/bench_load.py --sessions 50 --rate-limit-rate 0.05 --run-failure-rate 0.05
+"""
+import argparse
+import gc
+import logging
+import os
+import pickle
+import resource
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app_session import allowConcurrentSessions, newSession, playTurn, startFakeApi
+from util.logger import logger
+from util.tracing import percentile
+
+
+def rssKiB() -> int:
+    """Returns the process's current resident set size in KiB."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        # Peak rather than current RSS, but close enough off Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def stateBytes(at) -> int:
+    """Returns the pickled size of a session's state, widgets excluded."""
+    state = at._session_state._state
+    return len(pickle.dumps(dict(state.filtered_state), protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def turnFailed(at) -> bool:
+    """Whether the last turn raised or ended in the run-failed apology."""
+    if at.exception:
+        return True
+    messages = at.session_state["messages"]
+    if not messages:
+        return True
+    reply = messages[-1]["content"].botReply
+    return any(
+        r.type.value == "text" and r.payload.text.startswith("Sorry, there was an error")
+        for r in reply
+    )
+
+
+class Results:
+    """Thread-safe collection of per-session measurements."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.startups = []
+        self.turns = []
+        self.errors = 0
+        self.stateBytes = []
+        self.sessions = []
+
+    def add(self, name: str, value) -> None:
+        with self.lock:
+            getattr(self, name).append(value)
+
+    def error(self) -> None:
+        with self.lock:
+            self.errors += 1
+
+
+def runSession(results: Results, turns: int, think: float, assistant: str = None) -> None:
+    """Opens one session and plays its turns, recording timings."""
+    start = time.perf_counter()
+    try:
+        at = newSession(assistant=assistant)
+    except Exception as e:
+        logger.warning(f"Session failed to start: {e}")
+        results.error()
+        return
+    results.add("startups", time.perf_counter() - start)
+    for turn in range(turns):
+        time.sleep(think)
+        start = time.perf_counter()
+        try:
+            at = playTurn(at, turn)
+        except Exception as e:
+            logger.warning(f"Turn failed: {e}")
+            results.error()
+            continue
+        results.add("turns", time.perf_counter() - start)
+        if turnFailed(at):
+            results.error()
+    results.add("stateBytes", stateBytes(at))
+    # Kept alive until the end so RSS reflects every open session
+    results.add("sessions", at)
+
+
+def describe(label: str, values) -> str:
+    if not values:
+        return f"{label}: n/a"
+    values = sorted(values)
+    return (
+        f"{label}: p50={percentile(values, 50) * 1000:.0f}ms "
+        f"p95={percentile(values, 95) * 1000:.0f}ms "
+        f"p99={percentile(values, 99) * 1000:.0f}ms max={max(values) * 1000:.0f}ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--think", type=float, default=0.0, help="seconds between a session's turns")
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--token-interval", type=float, default=0.01)
+    parser.add_argument("--tool-call-rate", type=float, default=0.5)
+    parser.add_argument("--image-rate", type=float, default=0.2)
+    parser.add_argument("--image-latency", type=float, default=1.0)
+    parser.add_argument("--parallel-tool-calls", type=int, default=1)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--run-failure-rate", type=float, default=0.0)
+    parser.add_argument("--opener-pool", type=int, default=0, help="ready greetings to keep (OPENER_POOL_SIZE)")
+    parser.add_argument("--orchestration", choices=["inline", "background"], default="inline")
+    parser.add_argument("--assistants", type=int, default=0, help="assistants to spread sessions over with ?assistant=")
+    parser.add_argument("--pool-fill-wait", type=float, default=5.0, help="seconds to let the opener pool fill")
+    args = parser.parse_args()
+
+    os.environ["OPENER_POOL_SIZE"] = str(args.opener_pool)
+    os.environ["ORCHESTRATION"] = args.orchestration
+    logger.setLevel(logging.WARNING)
+    allowConcurrentSessions()
+    server = startFakeApi(
+        ttft=args.ttft,
+        tokens=args.tokens,
+        tokenInterval=args.token_interval,
+        toolCallRate=args.tool_call_rate,
+        imageRate=args.image_rate,
+        imageLatency=args.image_latency,
+        parallelToolCalls=args.parallel_tool_calls,
+        rateLimitRate=args.rate_limit_rate,
+        runFailureRate=args.run_failure_rate,
+    )
+    keys = [None]
+    if args.assistants:
+        from util.openai_client import getClient
+        from util.provisioning import AssistantSpec, loadTools, provision
+
+        tools = loadTools(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "oai_tools.json"))
+        keys = [f"bot-{i:03d}" for i in range(args.assistants)]
+        provision(getClient(), [AssistantSpec(key=key, name=key, tools=tools) for key in keys])
+    try:
+        # One warm-up session so imports and process-wide caches aren't billed to the load
+        runSession(Results(), 1, 0)
+        # and, with an opener pool, time for it to fill
+        time.sleep(args.pool_fill_wait if args.opener_pool else 0)
+        gc.collect()
+        server.calls.clear()
+        results = Results()
+        rssBefore = rssKiB()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            for i in range(args.sessions):
+                pool.submit(runSession, results, args.turns, args.think, keys[i % len(keys)])
+        elapsed = time.perf_counter() - start
+        gc.collect()
+        rssGrowth = rssKiB() - rssBefore
+    finally:
+        server.stop()
+
+    turns = len(results.turns)
+    print(
+        f"sessions={args.sessions} turns={turns} elapsed={elapsed:.1f}s "
+        f"throughput={turns / elapsed:.1f} turns/s errors={results.errors}"
+    )
+    print(describe("startup", results.startups))
+    print(describe("turn", results.turns))
+    if results.stateBytes:
+        print(
+            f"memory/session: rss~{rssGrowth / max(len(results.sessions), 1):.0f}KiB "
+            f"state={statistics.mean(results.stateBytes) / 1024:.1f}KiB"
+        )
+    calls = dict(sorted(server.calls.items()))
+    total = sum(n for k, n in calls.items() if k != "rate_limited")
+    # Each session's greeting counts as a turn too
+    print(f"api calls/turn={total / max(turns + len(results.startups), 1):.2f} {calls}")
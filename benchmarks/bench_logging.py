@@ -0,0 +1,72 @@
+"""
+Measures bot-ui.py rerun time with logging off, with a synchronous file
+handler (the old util/logger setup), with the queue-backed handler and with
+the queue-backed handler sampling 1% of the per-message render lines.
+
+Run from the repository root:
+    python benchmarks/bench_logging.py --turns 20 --reruns 20
+"""
+import argparse
+import logging
+import queue
+import statistics
+import tempfile
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from app_session import newSession, playTurn, startFakeApi
+from util.logger import SamplingFilter, logger
+
+
+def configure(mode: str, path: str):
+    """Swaps the app logger's handlers for the given mode; returns a listener to stop, if any."""
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    if mode == "off":
+        logger.setLevel(logging.WARNING)
+        return None
+    fileHandler = logging.FileHandler(path)
+    fileHandler.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+    if mode == "sync":
+        logger.addHandler(fileHandler)
+        return None
+    handler = QueueHandler(queue.SimpleQueue())
+    if mode == "sampled":
+        handler.addFilter(SamplingFilter({"render": 0.01}))
+    listener = QueueListener(handler.queue, fileHandler)
+    listener.start()
+    logger.addHandler(handler)
+    return listener
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--reruns", type=int, default=20)
+    args = parser.parse_args()
+
+    server = startFakeApi(ttft=0.01, tokens=30, tokenInterval=0, toolCallRate=0.5)
+    try:
+        configure("off", "")
+        at = newSession()
+        for turn in range(args.turns):
+            at = playTurn(at, turn)
+        with tempfile.NamedTemporaryFile(suffix=".log") as f:
+            for mode in ("off", "sync", "queue", "sampled"):
+                listener = configure(mode, f.name)
+                times = []
+                for _ in range(args.reruns):
+                    start = time.perf_counter()
+                    at.run()
+                    times.append(time.perf_counter() - start)
+                if listener:
+                    listener.stop()
+                print(
+                    f"logging {mode:<7} rerun p50={statistics.median(times) * 1000:.1f}ms "
+                    f"max={max(times) * 1000:.1f}ms"
+                )
+    finally:
+        server.stop()
@@ -0,0 +1,111 @@
+"""
+Measures the pydantic model work one chat turn does to answer the user's
+Event: a button reply from a tool call, a streamed text reply, the bot's
+Event, and dumping it. The user's Event is the same in every case (and mostly
+nanoid calls), so it is built once up front. Compared:
+
+- validated: the bot's Event rebuilt from the user's model_dump()
+- from dicts: payloads given as dicts, as when reading JSON, so BotMessage
+  has to pick the payload class
+- replyWith: the app's path, answering with Event.replyWith()
+
+Run from the repository root:
+    python benchmarks/bench_models.py
+"""
+import argparse
+import os
+import sys
+import timeit
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOGFILE", os.devnull)
+warnings.filterwarnings("ignore")
+
+from util.pydantic_classes import (
+    BotButtonMessage,
+    BotMessage,
+    BotTextMessage,
+    Choice,
+    Event,
+)
+
+CHOICES = [{"label": f"Option {c}", "value": c} for c in "abcd"]
+TEXT = "Which of these best describes your ideal weekend? " * 3
+
+
+def validatedTurn(user: Event) -> Event:
+    botReply = [
+        BotMessage(
+            type="button",
+            payload=BotButtonMessage(
+                text="Pick one",
+                choices=[Choice(label=c["label"], value=c["value"]) for c in CHOICES],
+            ),
+        ),
+        BotMessage(type="text", payload=BotTextMessage(text=TEXT, useMarkdown=True)),
+    ]
+    eventDict = user.model_dump()
+    eventDict["botReply"] = botReply
+    eventDict["direction"] = "outgoing"
+    return Event(**eventDict)
+
+
+def dictTurn(user: Event) -> Event:
+    eventDict = user.model_dump()
+    eventDict["botReply"] = [
+        {"type": "button", "payload": {"text": "Pick one", "choices": CHOICES}},
+        {"type": "text", "payload": {"text": TEXT, "useMarkdown": True}},
+    ]
+    eventDict["direction"] = "outgoing"
+    return Event(**eventDict)
+
+
+def replyTurn(user: Event) -> Event:
+    botReply = [
+        BotMessage(
+            type="button",
+            payload=BotButtonMessage(
+                text="Pick one",
+                choices=[Choice(label=c["label"], value=c["value"]) for c in CHOICES],
+            ),
+        ),
+        BotMessage(type="text", payload=BotTextMessage(text=TEXT, useMarkdown=True)),
+    ]
+    return user.replyWith(botReply)
+
+
+def timeInterleaved(functions, number: int, rounds: int):
+    """
+    Returns each function's best per-call time in microseconds.
+
+    The functions take turns round by round, so drifting CPU speed affects them all alike.
+    """
+    best = [float("inf")] * len(functions)
+    for _ in range(rounds):
+        for i, function in enumerate(functions):
+            best[i] = min(best[i], timeit.timeit(function, number=number) / number * 1e6)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=30)
+    args = parser.parse_args()
+
+    user = Event(direction="incoming", payload={"type": "text", "text": "hello"})
+    expected = validatedTurn(user).model_dump()
+    turns = [("validated", validatedTurn), ("from dicts", dictTurn)]
+    if hasattr(Event, "replyWith"):
+        turns.append(("replyWith", replyTurn))
+    functions = []
+    for label, turn in turns:
+        event = turn(user)
+        assert event.model_dump() == expected, label
+        functions += [lambda turn=turn: turn(user), event.model_dump, event.model_dump_json]
+    times = timeInterleaved(functions, args.number, args.rounds)
+    print(f"{'':>12} {'build':>9} {'dump':>9} {'dump_json':>10}")
+    for i, (label, _) in enumerate(turns):
+        build, dump, dumpJson = times[i * 3 : i * 3 + 3]
+        print(f"{label:>12} {build:>7.1f}us {dump:>7.1f}us {dumpJson:>8.1f}us")
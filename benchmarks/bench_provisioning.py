@@ -0,0 +1,81 @@
+"""
+Measures deploying a fleet of assistants against the fake API, where every
+assistants call takes `--latency` seconds:
+
+- create each: the old make-assistant.py, one create per assistant per deploy
+- first deploy: util.provisioning on an empty account
+- redeploy: the same manifest again, which should write nothing
+- N changed: the manifest with a few assistants' instructions edited
+
+Run from the repository root:
+    python benchmarks/bench_provisioning.py --assistants 40
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app_session import startFakeApi
+
+
+def makeSpecs(count: int, edited: int = 0):
+    from util.provisioning import AssistantSpec, loadTools
+
+    tools = loadTools(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "oai_tools.json"))
+    return [
+        AssistantSpec(
+            key=f"quiz-{i:03d}",
+            name=f"Quiz bot {i}",
+            description="Short, zany quizzes",
+            instructions=f"You write quizzes about topic {i}." + (" Be brief." if i < edited else ""),
+            tools=tools,
+        )
+        for i in range(count)
+    ]
+
+
+def timed(server, label: str, deploy) -> None:
+    before = dict(server.calls)
+    start = time.perf_counter()
+    results = deploy()
+    elapsed = time.perf_counter() - start
+    calls = {k: v - before.get(k, 0) for k, v in server.calls.items() if v != before.get(k, 0)}
+    actions = {}
+    for result in results:
+        actions[result.action] = actions.get(result.action, 0) + 1
+    print(
+        f"{label:>14} {elapsed:>7.2f}s  assistants in account: {len(server.assistants):>4}"
+        f"  actions: {actions}  calls: {calls}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--assistants", type=int, default=40)
+    parser.add_argument("--changed", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds per assistants API call")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    server = startFakeApi(assistantLatency=args.latency)
+    from util.openai_client import getClient
+    from util.provisioning import ProvisionResult, provision
+
+    client = getClient()
+    specs = makeSpecs(args.assistants)
+
+    def createEach():
+        return [
+            ProvisionResult(spec.key, "create", client.beta.assistants.create(**spec.apiParams()).id)
+            for spec in specs
+        ]
+
+    timed(server, "create each", createEach)
+    server.assistants.clear()
+    timed(server, "first deploy", lambda: provision(client, specs, workers=args.workers))
+    timed(server, "redeploy", lambda: provision(client, specs, workers=args.workers))
+    edited = makeSpecs(args.assistants, edited=args.changed)
+    timed(server, f"{args.changed} changed", lambda: provision(client, edited, workers=args.workers))
+    server.stop()
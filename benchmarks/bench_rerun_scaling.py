@@ -0,0 +1,63 @@
+"""
+Measures how bot-ui.py rerun time grows with conversation length, with the
+history render cache on and off.
+
+"history" is the render.history span (drawing all past messages); "rerun" is
+the whole AppTest run, which also includes Streamlit's own per-run overhead.
+On Streamlit versions with st.fragment, clicking a button only reruns the live
+tail and skips render.history entirely. AppTest always runs the full script,
+so "fragment" is estimated as rerun minus history; it is what a button turn
+costs and should stay flat as the conversation grows.
+
+Run from the repository root:
+    python benchmarks/bench_rerun_scaling.py --lengths 10 25 50 --reruns 10
+"""
+import argparse
+import logging
+import os
+import statistics
+import time
+
+from app_session import newSession, playTurn, startFakeApi
+from util.logger import logger
+from util.tracing import memoryExporter
+
+
+def measure(at, reruns: int):
+    memoryExporter.spans.clear()
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - start)
+    history = [s.duration for s in memoryExporter.spans if s.name == "render.history"]
+    return statistics.median(times), statistics.median(history)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 25, 50])
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    server = startFakeApi(ttft=0.01, tokens=30, tokenInterval=0, toolCallRate=0.5)
+    try:
+        at = newSession()
+        turns = 0
+        for length in sorted(args.lengths):
+            while turns < length:
+                at = playTurn(at, turns)
+                turns += 1
+            for mode in ("false", "true"):
+                os.environ["RENDER_CACHE"] = mode
+                at.run()  # warm the cache
+                rerun, history = measure(at, args.reruns)
+                label = "cached" if mode == "true" else "uncached"
+                print(
+                    f"turns={length:<4} {label:<9} rerun p50={rerun * 1000:.1f}ms "
+                    f"history p50={history * 1000:.1f}ms "
+                    f"fragment~{(rerun - history) * 1000:.1f}ms"
+                )
+    finally:
+        server.stop()
@@ -0,0 +1,93 @@
+"""
+Compares time-to-first-token and total turn latency of the old fixed 1 second
+polling loop against util.run_engine (streaming and backoff polling) using the
+local fake Assistants API.
+
+Run from the repository root:
+    python benchmarks/bench_run_latency.py --turns 10 --ttft 0.3
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOGFILE", os.devnull)
+
+import logging
+import warnings
+import openai
+from fake_openai import FakeOpenAI
+from util import run_engine
+from util.openai_client import connectionStats, makeHttpClient
+
+logging.getLogger("streamlit-frontend").setLevel(logging.WARNING)
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+def legacyTurn(client, threadId, assistantId):
+    """The loop bot-ui.py used before the run engine: create, then poll every second."""
+    start = time.perf_counter()
+    run = client.beta.threads.runs.create(thread_id=threadId, assistant_id=assistantId)
+    run = client.beta.threads.runs.retrieve(run_id=run.id, thread_id=threadId)
+    while run.status == "in_progress" or run.status == "queued":
+        time.sleep(1)
+        run = client.beta.threads.runs.retrieve(run_id=run.id, thread_id=threadId)
+    done = time.perf_counter() - start
+    # Nothing is visible until the run is done
+    return done, done
+
+
+def engineTurn(client, threadId, assistantId):
+    start = time.perf_counter()
+    first = []
+
+    def onTextDelta(text):
+        if not first:
+            first.append(time.perf_counter() - start)
+
+    run_engine.createRun(client, threadId, assistantId, onTextDelta)
+    done = time.perf_counter() - start
+    return (first[0] if first else done), done
+
+
+def bench(name, turn, server, turns):
+    client = openai.Client(
+        api_key="fake", base_url=server.base_url, http_client=makeHttpClient()
+    )
+    server.calls.clear()
+    ttfts, totals = [], []
+    for _ in range(turns):
+        thread = client.beta.threads.create(messages=[{"role": "user", "content": "Hello"}])
+        ttft, total = turn(client, thread.id, "asst_fake")
+        ttfts.append(ttft)
+        totals.append(total)
+    calls = sum(n for k, n in server.calls.items() if k != "threads.create")
+    print(
+        f"{name:<18} ttft p50={statistics.median(ttfts):.3f}s "
+        f"total p50={statistics.median(totals):.3f}s "
+        f"max={max(totals):.3f}s api calls/turn={calls / turns:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    args = parser.parse_args()
+
+    server = FakeOpenAI(
+        ttft=args.ttft, tokens=args.tokens, tokenInterval=args.token_interval
+    ).start()
+    try:
+        bench("legacy 1s polling", legacyTurn, server, args.turns)
+        run_engine.USE_STREAMING = False
+        bench("backoff polling", engineTurn, server, args.turns)
+        run_engine.USE_STREAMING = True
+        bench("streaming", engineTurn, server, args.turns)
+    finally:
+        server.stop()
+    print(f"connections: {connectionStats.snapshot()}")
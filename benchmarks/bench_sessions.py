@@ -0,0 +1,116 @@
+"""
+Measures how much memory idle sessions hold and what util.session_manager
+gets back by dropping them, using bot-ui.py driven through AppTest against
+the fake API.
+
+`--sessions` sessions each play `--turns` turns and then go idle. Reported:
+
+- held: Python heap taken by the sessions (tracemalloc), which includes
+  AppTest's own copy of every page it was sent
+- after eviction: heap freed once a sweep has dropped the idle sessions,
+  against the session manager's estimate of what they held
+- rehydrate: time of the first rerun of a dropped session, which reloads it
+  from the conversation store, against an ordinary rerun
+- continue: every rehydrated session plays one more turn, and its history is
+  checked against what it showed before it was dropped
+
+Run from the repository root:
+    python benchmarks/bench_sessions.py --sessions 20 --turns 10
+"""
+import argparse
+import gc
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import logging
+from app_session import newSession, playTurn, startFakeApi
+
+
+def chatTexts(at):
+    return [m.markdown[0].value if m.markdown else "" for m in at.chat_message]
+
+
+def heapBytes() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--idle", type=float, default=1.0, help="SESSION_IDLE_TTL for the run, in seconds")
+    args = parser.parse_args()
+
+    os.environ["SESSION_IDLE_TTL"] = str(args.idle)
+    os.environ["SESSION_SWEEP_INTERVAL"] = "0"
+    server = startFakeApi(ttft=0.05, tokens=40, tokenInterval=0.0, toolCallRate=0.5)
+    from util.session_manager import SESSION_MEMORY_FACTOR, sessionManager
+
+    # Only the manager's sweeps are of interest; turn them off until every session is built
+    sessionManager.idleTtl = float("inf")
+    logging.getLogger("streamlit-frontend").setLevel(logging.WARNING)
+
+    tracemalloc.start()
+    # Imports and process-wide caches are filled by the first session, which isn't counted
+    warmup = newSession()
+    playTurn(warmup, 0)
+    baseline = heapBytes()
+    sessions = []
+    for _ in range(args.sessions):
+        at = newSession()
+        for turn in range(args.turns):
+            at = playTurn(at, turn)
+        sessions.append(at)
+    held = heapBytes() - baseline
+    estimated = sessionManager.stats()["estimatedBytes"]
+    print(
+        f"held:            {held / 1024:.0f} KiB heap for {args.sessions} sessions of {args.turns} turns"
+        f" ({held / args.sessions / 1024:.0f} KiB each)"
+    )
+
+    before = [chatTexts(at) for at in sessions]
+    reruns = []
+    for at in sessions[:5]:
+        start = time.perf_counter()
+        at.run()
+        reruns.append(time.perf_counter() - start)
+
+    sessionManager.idleTtl = args.idle
+    time.sleep(args.idle)
+    # Any session's next run sweeps; a new session stands in for another user arriving
+    sessions.append(newSession())
+    # No more sweeps, so each session below is rehydrated exactly once
+    sessionManager.idleTtl = float("inf")
+    freed = held - (heapBytes() - baseline)
+    factor = freed / (estimated / SESSION_MEMORY_FACTOR)
+    print(
+        f"after eviction:  {sessionManager.stats()['evicted']} sessions dropped, {freed / 1024:.0f} KiB freed,"
+        f" estimated {estimated / 1024:.0f} KiB (measured SESSION_MEMORY_FACTOR {factor:.0f})"
+    )
+
+    rehydrations = []
+    for at in sessions[: args.sessions]:
+        start = time.perf_counter()
+        at.run()
+        rehydrations.append(time.perf_counter() - start)
+    print(
+        f"rehydrate:       p50={statistics.median(rehydrations) * 1000:.0f}ms"
+        f" max={max(rehydrations) * 1000:.0f}ms, ordinary rerun p50={statistics.median(reruns) * 1000:.0f}ms"
+    )
+
+    intact = sum(chatTexts(at) == texts for at, texts in zip(sessions, before))
+    continued = 0
+    for at in sessions[: args.sessions]:
+        count = len(at.chat_message)
+        at = playTurn(at, args.turns)
+        continued += not at.exception and len(at.chat_message) == count + 2
+    tracemalloc.stop()
+    print(f"continue:        {intact}/{args.sessions} histories intact, {continued}/{args.sessions} played another turn")
+    print(f"sessions: {sessionManager.stats()}")
+    server.stop()
@@ -0,0 +1,73 @@
+"""
+Measures cold-start time-to-first-paint of bot-ui.py against the local fake
+Assistants API, plus the API calls a session makes at startup and on a rerun.
+
+"First paint" is when the script renders the chat input (the page shell);
+"greeting" is when the first AppTest run returns with the greeting on screen.
+Before the startup fast path these were the same moment.
+
+Run from the repository root:
+    python benchmarks/bench_startup.py --sessions 10 --ttft 0.5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOGFILE", os.devnull)
+warnings.filterwarnings("ignore")
+
+import logging
+import streamlit
+from streamlit.testing.v1 import AppTest
+from app_session import startFakeApi
+
+logging.getLogger("streamlit-frontend").setLevel(logging.WARNING)
+
+
+def instrumentFirstPaint(marks):
+    """Wraps st.chat_input so the first call in a script run is timestamped."""
+    original = streamlit.chat_input
+
+    def chat_input(*args, **kwargs):
+        if not marks:
+            marks.append(time.perf_counter())
+        return original(*args, **kwargs)
+
+    streamlit.chat_input = chat_input
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--ttft", type=float, default=0.5)
+    args = parser.parse_args()
+
+    server = startFakeApi(ttft=args.ttft, tokens=10, tokenInterval=0.01)
+    marks = []
+    instrumentFirstPaint(marks)
+    paints, greetings, startupCalls, rerunCalls = [], [], [], []
+    try:
+        for _ in range(args.sessions):
+            marks.clear()
+            server.calls.clear()
+            start = time.perf_counter()
+            at = AppTest.from_file(os.path.join(ROOT, "bot-ui.py"), default_timeout=60)
+            at.run()
+            greetings.append(time.perf_counter() - start)
+            paints.append(marks[0] - start)
+            startupCalls.append(sum(server.calls.values()))
+            server.calls.clear()
+            at.run()
+            rerunCalls.append(sum(server.calls.values()))
+    finally:
+        server.stop()
+
+    print(f"first paint   p50={statistics.median(paints):.3f}s max={max(paints):.3f}s")
+    print(f"greeting      p50={statistics.median(greetings):.3f}s max={max(greetings):.3f}s")
+    print(f"startup calls first session={startupCalls[0]} later sessions={statistics.mean(startupCalls[1:] or startupCalls):.1f}")
+    print(f"rerun calls   mean={statistics.mean(rerunCalls):.1f}")
@@ -0,0 +1,179 @@
+"""
+Measures what happens to a conversation when a turn is cut off halfway, the
+way Streamlit stops a script run when the user clicks or types while the bot
+is still answering, and when two tabs answer on the same thread at once.
+
+Turns are driven through bot-ui.py's getBotResponse against the fake API,
+which, like the real one, rejects new messages and runs while a run is active:
+
+- new input: a turn is stopped mid-stream and the user sends something else
+- same input: a turn is stopped mid-stream and the script reruns with the same message
+- two tabs: a second turn starts on the thread while the first is still streaming
+
+Each is played `--trials` times with the old turn logic (no run tracking) and
+with util.run_tracker. Reported per scenario: turns that ended in an error,
+latency of the follow-up turn, runs created, runs cancelled, and seconds the
+cut-off run kept generating an answer nobody would see.
+
+Run from the repository root:
+    python benchmarks/bench_supersede.py --trials 5
+"""
+import argparse
+import os
+import runpy
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOGFILE", os.devnull)
+
+import logging
+import warnings
+from app_session import startFakeApi
+
+warnings.filterwarnings("ignore")
+
+
+class ScriptStopped(BaseException):
+    """Stands in for Streamlit's RerunException, which isn't an Exception either."""
+
+
+def legacyResponse(app, userEvent, onTextDelta, state):
+    """The turn logic bot-ui.py used before run tracking: trust state["runId"] and go."""
+    client = app["client"]
+    run = app["waitForRun"](client, state["threadId"], state["runId"])
+    if run.status == "requires_action":
+        run = app["submitToolOutputs"](
+            client,
+            state["threadId"],
+            state["runId"],
+            [{"tool_call_id": c.id, "output": str(userEvent.payload)} for c in run.required_action.submit_tool_outputs.tool_calls],
+            onTextDelta,
+        )
+    elif run.status == "completed":
+        client.beta.threads.messages.create(
+            thread_id=state["threadId"], content=str(userEvent.payload), role="user"
+        )
+        run = app["createRun"](client, state["threadId"], state["assistantId"], onTextDelta)
+        state["runId"] = run.id
+    return run
+
+
+def newConversation(app):
+    """Opens a thread whose greeting run has finished, like a session after its first page load."""
+    client = app["client"]
+    thread = client.beta.threads.create(messages=[{"role": "user", "content": "Hello"}])
+    run = app["createRun"](client, thread.id, os.environ["OPENAI_ASSISTANT_ID"])
+    return {
+        "threadId": thread.id,
+        "runId": run.id,
+        "assistantId": os.environ["OPENAI_ASSISTANT_ID"],
+        "pendingToolOutputs": [],
+    }
+
+
+def stopAfter(deltas: int):
+    seen = []
+
+    def onTextDelta(text):
+        seen.append(text)
+        if len(seen) >= deltas:
+            raise ScriptStopped()
+
+    return onTextDelta
+
+
+def playScenario(app, server, scenario: str, tracked: bool, cutAfter: int):
+    """Plays one trial and returns (error, follow-up latency, runs created, runs cancelled, wasted seconds)."""
+    Event = app["Event"]
+    respond = (
+        (lambda e, cb, s: app["getBotResponse"](e, cb, s))
+        if tracked
+        else (lambda e, cb, s: legacyResponse(app, e, cb, s))
+    )
+    state = newConversation(app)
+    runsBefore = set(server.runs)
+    first = Event(payload={"text": "first answer"})
+    error = None
+    start = None
+    if scenario == "two tabs":
+        # The other tab's turn works on its own copy of the session, as a background turn would
+        other = dict(state)
+        outcome = {}
+
+        def otherTab():
+            try:
+                respond(first, None, other)
+            except Exception as e:
+                outcome["error"] = e
+
+        worker = threading.Thread(target=otherTab)
+        worker.start()
+        time.sleep(server.ttft + cutAfter * server.tokenInterval)
+        start = time.monotonic()
+        try:
+            respond(Event(payload={"text": "second answer"}), None, state)
+        except Exception as e:
+            error = e
+        latency = time.monotonic() - start
+        worker.join()
+        if tracked and not isinstance(outcome.get("error"), app["RunSuperseded"]):
+            error = error or outcome.get("error") or RuntimeError("stale reply was delivered")
+    else:
+        try:
+            respond(first, stopAfter(cutAfter), state)
+        except ScriptStopped:
+            pass
+        start = time.monotonic()
+        followUp = first if scenario == "same input" else Event(payload={"text": "second answer"})
+        try:
+            respond(followUp, None, state)
+        except Exception as e:
+            error = e
+        latency = time.monotonic() - start
+    created = [server.runs[r] for r in server.runs if r not in runsBefore]
+    cancelled = [r for r in created if r.cancelledAt is not None]
+    # The cut-off run is the first one this trial created; unless its answer was used, count how long it ran past the cut
+    abandoned = created[0]
+    ended = abandoned.cancelledAt if abandoned.cancelledAt is not None else abandoned.startedAt + abandoned.duration
+    wasted = 0.0 if abandoned.id == state["runId"] else max(0.0, ended - start)
+    return error, latency, len(created), len(cancelled), wasted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--token-interval", type=float, default=0.05)
+    parser.add_argument("--cut-after", type=int, default=5, help="Streamed words before the turn is cut off")
+    args = parser.parse_args()
+
+    server = startFakeApi(ttft=args.ttft, tokens=args.tokens, tokenInterval=args.token_interval)
+    app = runpy.run_path(os.path.join(ROOT, "bot-ui.py"), run_name="bot_ui")
+    logging.getLogger("streamlit-frontend").setLevel(logging.CRITICAL)
+    from util.pydantic_classes import Event
+    from util.run_tracker import RunSuperseded, runTracker
+
+    app.update(Event=Event, RunSuperseded=RunSuperseded)
+    print(f"{'scenario':>11} {'variant':>8} {'errors':>7} {'latency p50':>12} {'runs':>5} {'cancelled':>10} {'wasted s':>9}")
+    for scenario in ("new input", "same input", "two tabs"):
+        for tracked in (False, True):
+            results = [
+                playScenario(app, server, scenario, tracked, args.cut_after)
+                for _ in range(args.trials)
+            ]
+            errors = sum(1 for r in results if r[0] is not None)
+            print(
+                f"{scenario:>11} {'tracked' if tracked else 'legacy':>8} {errors:>4}/{len(results):<2}"
+                f" {statistics.median(r[1] for r in results) * 1000:>10.0f}ms"
+                f" {sum(r[2] for r in results) / len(results):>5.1f}"
+                f" {sum(r[3] for r in results) / len(results):>10.1f}"
+                f" {sum(r[4] for r in results) / len(results):>9.2f}"
+            )
+    print(f"tracker: {runTracker.stats()}  calls: {server.calls}")
+    server.stop()
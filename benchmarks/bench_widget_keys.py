@@ -0,0 +1,84 @@
+"""
+Measures session-state size, widget churn and rerun cost over a long
+conversation with the old per-rerun nanoid button keys and with stable keys.
+
+The render cache is turned off so every historical button group goes through
+makeButtons, which is the worst case for both modes. "churn" is the number of
+button keys in a rerun that did not exist in the previous rerun; each one is a
+widget the frontend has to tear down and recreate.
+
+Run from the repository root:
+    python benchmarks/bench_widget_keys.py --turns 50 --reruns 10
+"""
+import argparse
+import logging
+import os
+import pickle
+import statistics
+import time
+
+from app_session import newSession, playTurn, startFakeApi
+from util import make_elements
+from util.logger import logger
+
+stableMakeButtons = make_elements.makeButtons
+
+
+def nanoidMakeButtons(payload, onClick, key=None):
+    """makeButtons as it was: disabled widgets with a fresh key every rerun."""
+    with make_elements.st.container() as c:
+        make_elements.st.markdown(payload.text)
+        cols = make_elements.st.columns([1] * len(payload.choices) + [6 - len(payload.choices)])
+        for i in range(len(cols) - 1):
+            with cols[i]:
+                make_elements.st.button(
+                    label=payload.choices[i].label,
+                    key=make_elements.generate(size=8),
+                    disabled=not (payload.active),
+                    on_click=onClick,
+                    args=[{"type": "button", "text": payload.choices[i].value}],
+                )
+    return c
+
+
+def sessionStateSize(at):
+    """Returns the number of entries (including widget state) and the pickled size of the state."""
+    state = at._session_state._state
+    values = {k: v for k, v in state.filtered_state.items() if k != "renderCache"}
+    return len(state._keys()), len(pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    os.environ["RENDER_CACHE"] = "false"
+    server = startFakeApi(ttft=0.01, tokens=30, tokenInterval=0, toolCallRate=0.6)
+    try:
+        at = newSession()
+        for turn in range(args.turns):
+            at = playTurn(at, turn)
+        for mode, impl in (("nanoid", nanoidMakeButtons), ("stable", stableMakeButtons)):
+            make_elements.makeButtons = impl
+            at.run()
+            previous = {b.key for b in at.button}
+            times, churn = [], []
+            for _ in range(args.reruns):
+                start = time.perf_counter()
+                at.run()
+                times.append(time.perf_counter() - start)
+                keys = {b.key for b in at.button}
+                churn.append(len(keys - previous))
+                previous = keys
+            entries, size = sessionStateSize(at)
+            print(
+                f"{mode:<7} turns={args.turns} buttons={len(at.button)} "
+                f"churn/rerun={statistics.mean(churn):.0f} "
+                f"state entries={entries} size={size / 1024:.1f}KiB "
+                f"rerun p50={statistics.median(times) * 1000:.1f}ms"
+            )
+    finally:
+        server.stop()
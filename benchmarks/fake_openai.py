@@ -0,0 +1,680 @@
+"""
+A local stand-in for the OpenAI threads/runs/messages endpoints.
+
+Runs are scripted instead of generated: every run waits `ttft` seconds, then
+streams `tokens` words `tokenInterval` seconds apart. With probability
+`toolCallRate` it stops with a tool call instead of text, or after its text
+with `toolPreamble`; `imageRate` of those tool calls are `generate_image`,
+the rest `show_buttons`. A tool-calling run
+asks for `parallelToolCalls` calls at once, and submitting outputs fails with
+400 unless every one of them is answered, like the real API. Image generation
+takes `imageLatency` seconds, and the generated image is an `imageSize` pixel
+square PNG (pass 1024 for one about as heavy as a DALL-E 3 image).
+Assistants can be created, listed and updated; each of those calls takes
+`assistantLatency` seconds.
+
+Like the real API, a thread takes no new messages or runs while a run on it
+is active, and answers 400 instead. Runs can be cancelled; a cancelled run
+stays `cancelling` for `cancelLatency` seconds and stops streaming.
+
+Failures can be injected: `rateLimitRate` of API requests get an HTTP 429,
+and `runFailureRate` of runs end as `failed` with `rate_limit_exceeded`. It supports both the polling API (retrieve) and
+the streaming API (stream=true).
+
+Usage:
+    server = FakeOpenAI(ttft=0.3).start()
+    client = openai.Client(api_key="fake", base_url=server.base_url)
+    ...
+    server.stop()
+"""
+import json
+import operator
+import os
+import random
+import socket
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+TOOLS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "oai_tools.json")
+
+
+def _now() -> int:
+    return int(time.time())
+
+
+def makePng(width: int, height: int, noise: bool = False) -> bytes:
+    """
+    Builds an RGB PNG standing in for a generated image.
+
+    It is a solid colour, or with noise, a gradient with grain that compresses
+    about as badly as a photo-like image does.
+    """
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    if noise:
+        # Gradient values stay under 0xC0 and grain under 0x40, so they add without overflowing
+        rowBytes = width * 3
+        grain = random.Random(width).randbytes(rowBytes * height)
+        grain = grain.translate(bytes(i & 0x3F for i in range(256)))
+        rows = b"".join(
+            b"\x00"
+            + bytes(
+                map(
+                    operator.add,
+                    bytes((x + y) * 0xBF // (width + height) for x in range(width) for _ in range(3)),
+                    grain[y * rowBytes : (y + 1) * rowBytes],
+                )
+            )
+            for y in range(height)
+        )
+    else:
+        rows = b"".join(b"\x00" + b"\xcc\x66\x99" * width for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+# Statuses in which a run keeps its thread from taking new messages or runs
+ACTIVE_STATUSES = ("queued", "in_progress", "requires_action", "cancelling")
+
+
+class FakeRun:
+    """A scripted run whose status depends on how long ago it was started."""
+
+    def __init__(self, server, threadId: str, assistantId: str):
+        self.server = server
+        self.id = server.newId("run")
+        self.threadId = threadId
+        self.assistantId = assistantId
+        self.startedAt = time.monotonic()
+        self.fail = server.random.random() < server.runFailureRate
+        self.useTool = not self.fail and server.random.random() < server.toolCallRate
+        self.toolCalls = [
+            (
+                server.newId("call"),
+                "generate_image"
+                if server.random.random() < server.imageRate
+                else "show_buttons",
+            )
+            for _ in range(server.parallelToolCalls)
+        ]
+        self.words = [f"word{i}" for i in range(server.tokens)]
+        self.messageId = server.newId("msg")
+        self.status = "queued"
+        self.finished = False
+        self.cancelledAt = None
+
+    @property
+    def duration(self) -> float:
+        if self.fail or (self.useTool and not self.server.toolPreamble):
+            return self.server.ttft
+        return self.server.ttft + self.server.tokenInterval * len(self.words)
+
+    def refresh(self) -> None:
+        """Moves the run forward according to the wall clock."""
+        if self.status == "cancelling":
+            if time.monotonic() - self.cancelledAt >= self.server.cancelLatency:
+                self.status = "cancelled"
+        elif self.status in ("queued", "in_progress"):
+            if time.monotonic() - self.startedAt >= self.duration:
+                self.finish()
+            else:
+                self.status = "in_progress"
+
+    def finish(self) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        if self.fail:
+            self.status = "failed"
+        elif self.useTool:
+            self.status = "requires_action"
+            if self.server.toolPreamble:
+                self.server.addMessage(
+                    self.threadId, "assistant", " ".join(self.words), self.messageId, self.id
+                )
+        else:
+            self.status = "completed"
+            self.server.addMessage(
+                self.threadId, "assistant", " ".join(self.words), self.messageId, self.id
+            )
+
+    def cancel(self) -> bool:
+        """Starts cancelling the run, unless it has already stopped."""
+        if self.status not in ("queued", "in_progress", "requires_action"):
+            return False
+        self.finished = True
+        self.cancelledAt = time.monotonic()
+        self.status = "cancelling"
+        return True
+
+    @property
+    def cancelled(self) -> bool:
+        return self.status in ("cancelling", "cancelled")
+
+    def restart(self) -> None:
+        """Called after tool outputs are submitted; the run resumes with text."""
+        self.startedAt = time.monotonic()
+        self.useTool = False
+        self.finished = False
+        self.messageId = self.server.newId("msg")
+        self.status = "queued"
+
+    def toolArguments(self, toolName: str) -> str:
+        if toolName == "generate_image":
+            return json.dumps({"prompt": "A cat taking a quiz"})
+        return json.dumps(
+            {
+                "text": "Pick one",
+                "choices": [
+                    {"label": "A", "value": "a"},
+                    {"label": "B", "value": "b"},
+                ],
+            }
+        )
+
+    def toDict(self) -> dict:
+        requiredAction = None
+        if self.status == "requires_action":
+            requiredAction = {
+                "type": "submit_tool_outputs",
+                "submit_tool_outputs": {
+                    "tool_calls": [
+                        {
+                            "id": callId,
+                            "type": "function",
+                            "function": {
+                                "name": toolName,
+                                "arguments": self.toolArguments(toolName),
+                            },
+                        }
+                        for callId, toolName in self.toolCalls
+                    ]
+                },
+            }
+        return {
+            "id": self.id,
+            "object": "thread.run",
+            "created_at": _now(),
+            "thread_id": self.threadId,
+            "assistant_id": self.assistantId,
+            "status": self.status,
+            "required_action": requiredAction,
+            "last_error": {
+                "code": "rate_limit_exceeded",
+                "message": "Rate limit reached for requests",
+            }
+            if self.status == "failed"
+            else None,
+            "model": "fake-model",
+            "instructions": "",
+            "tools": [],
+            "metadata": {},
+            "parallel_tool_calls": True,
+        }
+
+
+class FakeOpenAI:
+    """Owns the fake API state and the HTTP server thread."""
+
+    def __init__(
+        self,
+        ttft: float = 0.3,
+        tokens: int = 20,
+        tokenInterval: float = 0.02,
+        toolCallRate: float = 0.0,
+        imageRate: float = 0.0,
+        imageLatency: float = 1.0,
+        imageSize: int = 64,
+        assistantLatency: float = 0.0,
+        cancelLatency: float = 0.1,
+        parallelToolCalls: int = 1,
+        toolPreamble: bool = False,
+        rateLimitRate: float = 0.0,
+        runFailureRate: float = 0.0,
+        seed: int = 0,
+        port: int = 0,
+    ):
+        self.ttft = ttft
+        self.tokens = tokens
+        self.tokenInterval = tokenInterval
+        self.toolCallRate = toolCallRate
+        self.imageRate = imageRate
+        self.imageLatency = imageLatency
+        self.parallelToolCalls = parallelToolCalls
+        self.toolPreamble = toolPreamble
+        self.rateLimitRate = rateLimitRate
+        self.runFailureRate = runFailureRate
+        self.random = random.Random(seed)
+        self.imageBytes = makePng(imageSize, imageSize, noise=imageSize > 64)
+        self.assistantLatency = assistantLatency
+        self.cancelLatency = cancelLatency
+        self.assistants = {}
+        # Assistants that weren't created here have the app's tools, as make-assistant.py gives them
+        with open(TOOLS_FILE) as file:
+            self.defaultTools = [{"type": "function", "function": t} for t in json.load(file)]
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.threads = {}
+        self.runs = {}
+        # The latest run on each thread, which is the only one that can be active
+        self.lastRuns = {}
+        self.calls = {}
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handlerClass())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def start(self) -> "FakeOpenAI":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def newId(self, prefix: str) -> str:
+        with self.lock:
+            self.counter += 1
+            return f"{prefix}_{self.counter:08d}"
+
+    def countCall(self, name: str) -> None:
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def addMessage(self, threadId, role, text, messageId=None, runId=None) -> dict:
+        message = {
+            "id": messageId or self.newId("msg"),
+            "object": "thread.message",
+            "created_at": _now(),
+            "thread_id": threadId,
+            "role": role,
+            "status": "completed",
+            "run_id": runId,
+            "assistant_id": None,
+            "attachments": [],
+            "metadata": {},
+            "content": [
+                {"type": "text", "text": {"value": text, "annotations": []}}
+            ],
+        }
+        with self.lock:
+            self.threads[threadId].append(message)
+        return message
+
+    def activeRun(self, threadId: str):
+        """Returns the run that keeps a thread busy, if there is one."""
+        run = self.lastRuns.get(threadId)
+        if run is None:
+            return None
+        run.refresh()
+        return run if run.status in ACTIVE_STATUSES else None
+
+    def _handlerClass(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body are written separately; don't let Nagle delay them
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def _json(self, payload: dict, status: int = 200, headers: dict = {}) -> None:
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _sse(self, run: FakeRun) -> None:
+                """Streams a run from start to its next stopping point, or until the client hangs up."""
+                try:
+                    self._streamRun(run)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Like the real API, the run carries on without anyone listening
+                    server.countCall("stream_abandoned")
+
+            def _streamRun(self, run: FakeRun) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                def emit(event: str, data) -> None:
+                    payload = data if isinstance(data, str) else json.dumps(data)
+                    self.wfile.write(f"event: {event}\ndata: {payload}\n\n".encode())
+                    self.wfile.flush()
+
+                emit("thread.run.created", run.toDict())
+                if not run.cancelled:
+                    run.status = "in_progress"
+                    emit("thread.run.in_progress", run.toDict())
+                    time.sleep(server.ttft)
+                if (not run.useTool or server.toolPreamble) and not run.cancelled:
+                    message = {
+                        "id": run.messageId,
+                        "object": "thread.message",
+                        "created_at": _now(),
+                        "thread_id": run.threadId,
+                        "role": "assistant",
+                        "status": "in_progress",
+                        "run_id": run.id,
+                        "assistant_id": run.assistantId,
+                        "attachments": [],
+                        "metadata": {},
+                        "content": [],
+                    }
+                    emit("thread.message.created", message)
+                    for i, word in enumerate(run.words):
+                        if run.cancelled:
+                            break
+                        text = word if i == 0 else " " + word
+                        emit(
+                            "thread.message.delta",
+                            {
+                                "id": run.messageId,
+                                "object": "thread.message.delta",
+                                "delta": {
+                                    "content": [
+                                        {
+                                            "index": 0,
+                                            "type": "text",
+                                            "text": {"value": text},
+                                        }
+                                    ]
+                                },
+                            },
+                        )
+                        time.sleep(server.tokenInterval)
+                if run.cancelled:
+                    emit("thread.run.cancelling", run.toDict())
+                    time.sleep(max(0.0, run.cancelledAt + server.cancelLatency - time.monotonic()))
+                    run.refresh()
+                    emit("thread.run.cancelled", run.toDict())
+                    emit("done", "[DONE]")
+                    return
+                run.finish()
+                if run.status == "completed":
+                    emit("thread.run.completed", run.toDict())
+                elif run.status == "failed":
+                    emit("thread.run.failed", run.toDict())
+                else:
+                    emit("thread.run.requires_action", run.toDict())
+                emit("done", "[DONE]")
+
+            def _rateLimited(self) -> bool:
+                """Answers with a 429 for `rateLimitRate` of requests."""
+                if server.random.random() >= server.rateLimitRate:
+                    return False
+                server.countCall("rate_limited")
+                self._json(
+                    {
+                        "error": {
+                            "message": "Rate limit reached for requests",
+                            "type": "requests",
+                            "code": "rate_limit_exceeded",
+                        }
+                    },
+                    429,
+                    {"retry-after-ms": "100"},
+                )
+                return True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = url.path.strip("/").split("/")[1:]
+                if parts[:1] != ["files"] and self._rateLimited():
+                    return
+                if parts[:1] == ["files"]:
+                    server.countCall("files.download")
+                    data = server.imageBytes
+                    self.send_response(200)
+                    self.send_header("Content-Type", "image/png")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+                if parts == ["assistants"]:
+                    server.countCall("assistants.list")
+                    time.sleep(server.assistantLatency)
+                    query = parse_qs(url.query)
+                    with server.lock:
+                        assistants = list(server.assistants.values())
+                    if query.get("order", ["desc"])[0] == "desc":
+                        assistants.reverse()
+                    if "after" in query:
+                        ids = [a["id"] for a in assistants]
+                        after = query["after"][0]
+                        assistants = assistants[ids.index(after) + 1 :] if after in ids else []
+                    limit = int(query.get("limit", [20])[0])
+                    page = assistants[:limit]
+                    return self._json(
+                        {
+                            "object": "list",
+                            "data": page,
+                            "first_id": page[0]["id"] if page else None,
+                            "last_id": page[-1]["id"] if page else None,
+                            "has_more": len(assistants) > limit,
+                        }
+                    )
+                if parts[:1] == ["assistants"] and len(parts) == 2:
+                    server.countCall("assistants.retrieve")
+                    if parts[1] in server.assistants:
+                        return self._json(server.assistants[parts[1]])
+                    return self._json(
+                        {
+                            "id": parts[1],
+                            "object": "assistant",
+                            "created_at": _now(),
+                            "name": "Fake Bot",
+                            "model": "fake-model",
+                            "instructions": "",
+                            "tools": server.defaultTools,
+                            "metadata": {},
+                        }
+                    )
+                if parts[:1] == ["threads"] and parts[2:] == ["runs"]:
+                    server.countCall("runs.list")
+                    query = parse_qs(url.query)
+                    with server.lock:
+                        runs = [r for r in server.runs.values() if r.threadId == parts[1]]
+                    if query.get("order", ["desc"])[0] == "desc":
+                        runs.reverse()
+                    limit = int(query.get("limit", [20])[0])
+                    page = []
+                    for run in runs[:limit]:
+                        run.refresh()
+                        page.append(run.toDict())
+                    return self._json(
+                        {
+                            "object": "list",
+                            "data": page,
+                            "first_id": page[0]["id"] if page else None,
+                            "last_id": page[-1]["id"] if page else None,
+                            "has_more": len(runs) > limit,
+                        }
+                    )
+                if parts[:1] == ["threads"] and parts[2:3] == ["runs"] and len(parts) == 4:
+                    server.countCall("runs.retrieve")
+                    run = server.runs[parts[3]]
+                    run.refresh()
+                    return self._json(run.toDict())
+                if parts[:1] == ["threads"] and parts[2:] == ["messages"]:
+                    server.countCall("messages.list")
+                    query = parse_qs(url.query)
+                    messages = list(server.threads[parts[1]])
+                    if query.get("order", ["desc"])[0] == "desc":
+                        messages.reverse()
+                    if "after" in query:
+                        ids = [m["id"] for m in messages]
+                        after = query["after"][0]
+                        messages = messages[ids.index(after) + 1 :] if after in ids else []
+                    limit = int(query.get("limit", [20])[0])
+                    page = messages[:limit]
+                    return self._json(
+                        {
+                            "object": "list",
+                            "data": page,
+                            "first_id": page[0]["id"] if page else None,
+                            "last_id": page[-1]["id"] if page else None,
+                            "has_more": len(messages) > limit,
+                        }
+                    )
+                self._json({"error": {"message": f"Unknown path {url.path}"}}, 404)
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                parts = url.path.strip("/").split("/")[1:]
+                body = self._body()
+                if self._rateLimited():
+                    return
+                if parts == ["images", "generations"]:
+                    server.countCall("images.generate")
+                    time.sleep(server.imageLatency)
+                    return self._json(
+                        {
+                            "created": _now(),
+                            "data": [
+                                {"url": f"{server.base_url}/files/{server.newId('img')}.png"}
+                            ],
+                        }
+                    )
+                if parts == ["assistants"]:
+                    server.countCall("assistants.create")
+                    time.sleep(server.assistantLatency)
+                    assistant = {
+                        "id": server.newId("asst"),
+                        "object": "assistant",
+                        "created_at": _now(),
+                        "name": None,
+                        "description": None,
+                        "model": "",
+                        "instructions": None,
+                        "tools": [],
+                        "metadata": {},
+                        **body,
+                    }
+                    with server.lock:
+                        server.assistants[assistant["id"]] = assistant
+                    return self._json(assistant)
+                if parts[:1] == ["assistants"] and len(parts) == 2:
+                    server.countCall("assistants.update")
+                    time.sleep(server.assistantLatency)
+                    with server.lock:
+                        assistant = server.assistants.get(parts[1])
+                        if assistant is not None:
+                            assistant.update(body)
+                    if assistant is None:
+                        return self._json({"error": {"message": f"No assistant {parts[1]}"}}, 404)
+                    return self._json(assistant)
+                if parts == ["threads"]:
+                    server.countCall("threads.create")
+                    threadId = server.newId("thread")
+                    with server.lock:
+                        server.threads[threadId] = []
+                    for m in body.get("messages", []):
+                        server.addMessage(threadId, m["role"], m["content"])
+                    return self._json(
+                        {
+                            "id": threadId,
+                            "object": "thread",
+                            "created_at": _now(),
+                            "metadata": {},
+                        }
+                    )
+                if parts[:1] == ["threads"] and parts[2:] in (["messages"], ["runs"]):
+                    active = server.activeRun(parts[1])
+                    if active is not None:
+                        server.countCall("active_run_rejected")
+                        return self._json(
+                            {
+                                "error": {
+                                    "message": f"Thread {parts[1]} already has an active run {active.id}.",
+                                    "type": "invalid_request_error",
+                                }
+                            },
+                            400,
+                        )
+                if parts[:1] == ["threads"] and parts[2:] == ["messages"]:
+                    server.countCall("messages.create")
+                    content = body["content"]
+                    if not isinstance(content, str):
+                        content = json.dumps(content)
+                    return self._json(server.addMessage(parts[1], body["role"], content))
+                if parts[:1] == ["threads"] and parts[2:] == ["runs"]:
+                    server.countCall("runs.create")
+                    run = FakeRun(server, parts[1], body["assistant_id"])
+                    with server.lock:
+                        server.runs[run.id] = run
+                        server.lastRuns[parts[1]] = run
+                    if body.get("stream"):
+                        return self._sse(run)
+                    return self._json(run.toDict())
+                if parts[:1] == ["threads"] and parts[2:3] == ["runs"] and parts[4:] == ["cancel"]:
+                    server.countCall("runs.cancel")
+                    run = server.runs[parts[3]]
+                    run.refresh()
+                    if not run.cancel():
+                        return self._json(
+                            {"error": {"message": f"Cannot cancel run with status '{run.status}'."}},
+                            400,
+                        )
+                    return self._json(run.toDict())
+                if (
+                    parts[:1] == ["threads"]
+                    and parts[2:3] == ["runs"]
+                    and parts[4:] == ["submit_tool_outputs"]
+                ):
+                    server.countCall("runs.submit_tool_outputs")
+                    run = server.runs[parts[3]]
+                    answered = {o["tool_call_id"] for o in body.get("tool_outputs", [])}
+                    expected = {callId for callId, _ in run.toolCalls}
+                    if run.status != "requires_action" or answered != expected:
+                        return self._json(
+                            {"error": {"message": "Tool outputs must answer every tool call"}},
+                            400,
+                        )
+                    run.restart()
+                    if body.get("stream"):
+                        return self._sse(run)
+                    return self._json(run.toDict())
+                self._json({"error": {"message": f"Unknown path {url.path}"}}, 404)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    server = FakeOpenAI().start()
+    print(f"Fake OpenAI API listening on {server.base_url}")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
@@ -1,206 +1,315 @@
 import streamlit as st
 from nanoid import generate
-from typing import Dict
+from typing import Any, Callable, Dict, List, MutableMapping, Optional
+from concurrent.futures import ThreadPoolExecutor
 from util.pydantic_classes import (
     Event,
     BotMessageTypes,
     BotMessage,
-    BotButtonMessage,
-    BotImageMessage,
     BotTextMessage,
-    Choice,
 )
 from util.make_elements import (
     makeButtons,
     makeImage,
     makeMarkdown,
     makeText,
+    makeDebugPanel,
+    makePrerendered,
+    isFinalized,
+    prerenderEvent,
+    MarkdownStream,
 )
-from util.generate_image import generateImage
-import json
-import time
-import openai
+from util.generate_image import waitForImages
+from util.run_engine import ENDED_STATUSES, createRun, submitToolOutputs, waitForRun
+from util.run_tracker import RunSuperseded, runTracker
+from util.tool_dispatch import replyOutputs, replyText, resolveToolCalls
+from util.assistant_registry import assistantRegistry
+from util.message_sync import MessageSync
+from util.opener_pool import OpenerPool, prepareOpener
+from util.orchestrator import ORCHESTRATION_POLL_INTERVAL, TurnJob, orchestrator
+from util.openai_client import connectionStats, getClient
+from util.scheduler import currentSession, scheduler
+from util.tracing import memoryExporter, span
+from util.image_cache import imageCache
+from util.image_store import imageStore
+from util.conversation_store import ConversationRecord, conversationStore
+from util.session_manager import sessionManager
+from util import event_codec
+import contextvars
 import os
+import time
 from dotenv import load_dotenv
 from util.logger import logger
 
 load_dotenv()
 
-if os.environ.get("OPENAI_ASSISTANT_NAME"):
-    st.title(os.environ.get("OPENAI_ASSISTANT_NAME"))
-if os.environ.get("BOT_DESCRIPTION"):
-    st.markdown(os.environ.get("BOT_DESCRIPTION"))
-client = openai.Client(api_key=os.environ["OPENAI_API_KEY"])
+client = getClient()
 
-def getBotResponse(userEvent: Event) -> Event:
+
+def getBotResponse(
+    userEvent: Event,
+    onTextDelta: Optional[Callable[[str], None]] = None,
+    state: Optional[MutableMapping[str, Any]] = None,
+    heartbeat: Optional[Callable[[], None]] = None,
+) -> Event:
     """
     Retrieves the bot response for a given user event.
 
     This function uses the new assistants endpoints to get bot response.
+    Each turn holds its thread through runTracker, so a turn that newer input
+    took over is cancelled instead of left running, and its result is dropped.
 
     Args:
     - userEvent: An Event object that contains the user's input.
+    - onTextDelta: Optional callback that receives the reply text as it streams in.
+    - state: The session values to read and update, st.session_state unless the turn runs in the background.
+    - heartbeat: Optional callback run every so often while the turn waits on the API.
 
     Returns:
     - Event: An Event object containing the bot's response.
+
+    Raises:
+    - RunSuperseded: If newer input took the thread over before the reply was ready.
     """
-    # First we need to ensure the run state is ready to receive a new event
-    run = client.beta.threads.runs.retrieve(
-        run_id=st.session_state.runId,
-        thread_id=st.session_state.threadId,
-    )
-    while run.status == "in_progress":
-        logger.debug("Run in progress, waiting....")
-        time.sleep(1)
-        run = client.beta.threads.runs.retrieve(
-            run_id=st.session_state.runId,
-            thread_id=st.session_state.threadId,
-        )
-        logger.debug(f"Current run status is {run.status}")
-    event_dict = userEvent.model_dump()
-    # Then, we actually need to send the user reply to the model
-    if run.status == "failed":
-        # Early termination because run failure, usually because of rate limiting
-        logger.error(f"Run failed: {run.last_error.code}. {run.last_error.message}")
-        event_dict["botReply"] = [
-            BotMessage(
-                type="text",
-                payload=BotTextMessage(
-                    text=f"Sorry, there was an error in the chat: {run.last_error.code}. {run.last_error.message}",
-                    useMarkdown=True,
-                ),
-            ),
-        ]
-        event_dict["direction"] = "outgoing"
-        botEvent = Event(**event_dict)
-        return botEvent
-    
-    if run.status == "requires_action": 
-        # The last message was a tool use, so we have to submit user response as a tool call output
-        logger.debug("Submitting user input as tool output")
-        event_dict["userInput"] = event_dict["payload"]["text"]
-        client.beta.threads.runs.submit_tool_outputs(
-            run_id=st.session_state.runId,
-            thread_id=st.session_state.threadId,
-            tool_outputs=[
-                {
-                    "tool_call_id": run.required_action.submit_tool_outputs.tool_calls[
-                        0
-                    ].id,
-                    "output": str(event_dict["payload"]),
-                }
-            ],
-        )
-        # After submitting the userResponse, wait for processing to complete
-        run = client.beta.threads.runs.retrieve(
-            run_id=st.session_state.runId, thread_id=st.session_state.threadId
-        )
-    if run.status == "completed":
-        # The last message was normal text, so we need to add a new text message
-        logger.debug("Adding text message to thread")
-        client.beta.threads.messages.create(
-            thread_id=st.session_state.threadId,
-            content=str(event_dict['payload']),
-            role="user",
-        )
-        # This is where we start the next run?
-        logger.debug(f"Starting new run...")
-        run = client.beta.threads.runs.create(
-            #run_id=st.session_state.runId,
-            assistant_id=st.session_state.assistantId,
-            thread_id=st.session_state.threadId
+    if state is None:
+        state = st.session_state
+    with runTracker.claim(client, state["threadId"], userEvent.id, heartbeat) as lease:
+        # First we need to ensure the run state is ready to receive a new event
+        # A turn left behind by an earlier script run owns the latest run, which may not be state["runId"] yet
+        runId = lease.resumeRunId or state["runId"]
+        with span("run.retrieve"):
+            run = waitForRun(client, state["threadId"], runId)
+        state["runId"] = run.id
+        # Then, we actually need to send the user reply to the model
+        if lease.delivered:
+            # The input already reached the thread, so this turn only has to collect the answer
+            logger.debug(f"Resuming run {run.id}, which is {run.status}")
+        elif run.status == "requires_action":
+            # The last message was a tool use, so we have to submit user response as a tool call output
+            logger.debug("Submitting user input as tool output")
+            # Outputs of tools that already ran are sent in the same batch as the reply
+            toolOutputs = replyOutputs(
+                run.required_action.submit_tool_outputs.tool_calls,
+                state.pop("pendingToolOutputs", []),
+                userEvent.payload,
             )
-        st.session_state.runId = run.id
-        run = client.beta.threads.runs.retrieve(
-            run_id=st.session_state.runId,
-            thread_id=st.session_state.threadId,
-        )
-    logger.debug(f"Run is now: {run}")
-    # Now that we have sent things to the API, we wait for the response
-    while run.status == "in_progress":
-        logger.debug("Submitted new user input, waiting....")
-        time.sleep(1)
-        run = client.beta.threads.runs.retrieve(
-            run_id=st.session_state.runId,
-            thread_id=st.session_state.threadId,
-        )
-        logger.debug(f"Current run status is {run.status}")
-
-    logger.info("Received payload back from the assistant!")
-    if run.status == "requires_action":
-        for tool_call in run.required_action.submit_tool_outputs.tool_calls:
-            logger.debug(f"Processing tool call {tool_call.function.name}")
-            if tool_call.function.name == "show_buttons":
-                logger.debug("Showing buttons...")
-                args = json.loads(tool_call.function.arguments)
-                text, choices = args["text"], args["choices"]
-                event_dict["botReply"].append(
-                    BotMessage(
-                        type="button",
-                        payload=BotButtonMessage(
-                            text=text,
-                            choices=[
-                                Choice(label=n["label"], value=n["value"])
-                                for n in choices
-                            ],
-                            active=True,
-                        ),
-                    ),
-                )
-            if tool_call.function.name == "generate_image":
-                logger.debug("Generating image...")
-                args = json.loads(tool_call.function.arguments)
-                prompt = args['prompt']
-                event_dict['botReply'].append(
-                    BotMessage(
-                        type="image",
-                        payload=BotImageMessage(
-                            url=generateImage(prompt)
-                        )
-                    )
-                )
-                # Tell the API that the image was successfully generated
-                client.beta.threads.runs.submit_tool_outputs(
-                    run_id=st.session_state.runId,
-                    thread_id=st.session_state.threadId,
-                    tool_outputs=[
-                        {
-                            "tool_call_id": run.required_action.submit_tool_outputs.tool_calls[0].id,
-                            "output": "{\"status\":200}",
-                        }
-                    ],
+            lease.delivered = True
+            # Streams the rest of the run, so this returns as soon as the assistant is done
+            run = submitToolOutputs(
+                client,
+                state["threadId"],
+                state["runId"],
+                toolOutputs,
+                onTextDelta,
+            )
+        elif run.status in ENDED_STATUSES:
+            # The last message was normal text, or its run was cancelled or failed, so we need to add a new text message
+            logger.debug("Adding text message to thread")
+            # Tool outputs for a run that was cancelled can't be sent anymore
+            state.pop("pendingToolOutputs", None)
+            lease.delivered = True
+            with span("messages.create"):
+                client.beta.threads.messages.create(
+                    thread_id=state["threadId"],
+                    content=replyText(userEvent.payload),
+                    role="user",
                 )
-        
-    if run.status == "completed":
-        logger.debug("No required actions, sending messages...")
-        messages = client.beta.threads.messages.list(
-            thread_id=st.session_state.threadId
+            logger.debug(f"Starting new run...")
+            run = createRun(
+                client,
+                state["threadId"],
+                state["assistantId"],
+                onTextDelta,
+            )
+            state["runId"] = run.id
+        logger.debug(f"Run is now: {run}")
+
+        logger.info("Received payload back from the assistant!")
+        run, botReply, state["pendingToolOutputs"] = resolveToolCalls(
+            client,
+            state["threadId"],
+            run,
+            assistantRegistry.get(state["assistantId"]).tools,
+            state.setdefault("messageSync", MessageSync(state["threadId"])),
+            onTextDelta,
         )
-        event_dict["botReply"] = [
-            BotMessage(
-                type="text",
-                payload=BotTextMessage(
-                    text=messages.data[0].content[0].text.value,
-                    useMarkdown=True,
-                ),
-            ),
-        ]
-    if run.status == "failed":
-        # Early termination because run failure, usually because of rate limiting
-        logger.error(f"Run failed: {run.last_error.code}. {run.last_error.message}")
-        event_dict["botReply"] = [
-            BotMessage(
-                type="text",
-                payload=BotTextMessage(
-                    text=f"Sorry, there was an error in the chat: {run.last_error.code}. {run.last_error.message}",
-                    useMarkdown=True,
+        # A rate-limited run is retried as a new run, so keep tracking the latest one
+        state["runId"] = run.id
+        # Newer input may have cancelled the run while it streamed; its reply is no longer wanted
+        lease.checkpoint()
+
+        if run.status == "failed":
+            # Early termination because run failure, usually because of rate limiting
+            logger.error(f"Run failed: {run.last_error.code}. {run.last_error.message}")
+            botReply = [
+                BotMessage(
+                    type="text",
+                    payload=BotTextMessage(
+                        text=f"Sorry, there was an error in the chat: {run.last_error.code}. {run.last_error.message}",
+                        useMarkdown=True,
+                    ),
                 ),
+            ]
+
+        return userEvent.replyWith(botReply)
+
+
+def supersededReply(userEvent: Event) -> Event:
+    """Returns the reply for a turn that newer input took over, so the conversation still reads in order."""
+    return userEvent.replyWith([
+        BotMessage(
+            type="text",
+            payload=BotTextMessage(
+                text="_A newer message took over this conversation, so this one was skipped._",
+                useMarkdown=True,
             ),
-        ]
+        ),
+    ])
+
+
+def queryParam(name: str) -> Optional[str]:
+    """Returns the value of the ?name= URL parameter, "" if it has none, or None if it is absent."""
+    if hasattr(st, "query_params"):
+        return st.query_params.get(name)
+    return st.experimental_get_query_params().get(name, [None])[0]
+
+
+def setQueryParam(name: str, value: str) -> None:
+    """Sets the ?name= URL parameter, keeping the others."""
+    if hasattr(st, "query_params"):
+        st.query_params[name] = value
+    else:
+        params = st.experimental_get_query_params()
+        params[name] = [value]
+        st.experimental_set_query_params(**params)
+
+
+def restoreConversation() -> bool:
+    """
+    Rehydrates the session from the conversation store if the URL names a stored conversation.
 
-    event_dict["direction"] = "outgoing"
-    botEvent = Event(**event_dict)
-    return botEvent
+    This is a single store read and no API calls: the thread, run and history
+    are all reused, so a reload or restart doesn't start a new conversation.
+
+    Returns:
+    - bool: True if the session was restored.
+    """
+    conversationId = queryParam("conversation")
+    if not conversationId:
+        return False
+    with span("store.load"):
+        record = conversationStore.load(conversationId)
+    if record is None or not record.messages:
+        return False
+    logger.info(f"Restoring conversation {conversationId}")
+    messageSync = MessageSync(record.threadId)
+    messageSync.lastSeenId = record.state.get("lastSeenMessageId")
+    st.session_state.userId = record.userId
+    st.session_state.conversationId = record.conversationId
+    st.session_state.assistantId = record.assistantId
+    st.session_state.threadId = record.threadId
+    st.session_state.runId = record.runId
+    st.session_state.messageSync = messageSync
+    st.session_state.pendingToolOutputs = record.state.get("pendingToolOutputs", [])
+    st.session_state.messages = record.messages
+    st.session_state.persisted = {"count": len(record.messages), "versions": {}, "record": ""}
+    return True
+
+
+# Session values restoreConversation rebuilds, which the session manager drops while a session is idle
+SESSION_STATE_KEYS = (
+    "userId",
+    "conversationId",
+    "assistantId",
+    "threadId",
+    "runId",
+    "messageSync",
+    "pendingToolOutputs",
+    "messages",
+    "persisted",
+    "renderCache",
+)
+
+
+def ensureSession() -> bool:
+    """
+    Makes sure the session's conversation is in memory, rehydrating it if the session manager dropped it.
+
+    Returns:
+    - bool: True if the session has a conversation, False if it still has to start one.
+    """
+    sessionManager.enter()
+    return "messages" in st.session_state or restoreConversation()
+
+
+def persistConversation() -> None:
+    """
+    Appends new and changed messages to the conversation store.
+
+    Only the tail of the history changes (buttons get deactivated, images
+    finish), so only new messages, the last two saved ones and any saved while
+    still pending are compared with what was last written. Nothing is written
+    when nothing changed. Afterwards the session reports its size to the
+    session manager, which may drop it from memory once it goes idle.
+    """
+    messages = st.session_state.messages
+    persisted = st.session_state.setdefault(
+        "persisted", {"count": 0, "versions": {}, "record": ""}
+    )
+    versions = persisted["versions"]
+    window = set(range(max(persisted["count"] - 2, 0), len(messages))) | set(versions)
+    changed = {}
+    for seq in sorted(window):
+        dumped = event_codec.dumps(messages[seq]["content"])
+        if versions.get(seq) != dumped:
+            changed[seq] = messages[seq]
+            versions[seq] = dumped
+    messageSync = st.session_state.get("messageSync")
+    record = ConversationRecord(
+        conversationId=st.session_state.conversationId,
+        userId=st.session_state.userId,
+        assistantId=st.session_state.assistantId,
+        threadId=st.session_state.threadId,
+        runId=st.session_state.runId,
+        state={
+            "pendingToolOutputs": st.session_state.get("pendingToolOutputs", []),
+            "lastSeenMessageId": messageSync.lastSeenId if messageSync else None,
+        },
+    )
+    recordJson = record.model_dump_json()
+    if changed or recordJson != persisted["record"]:
+        with span("store.save", messages=len(changed)):
+            conversationStore.save(record, changed)
+        persisted["record"] = recordJson
+    persisted["count"] = len(messages)
+    # Settled messages won't change again, so stop comparing them
+    for seq in list(versions):
+        event = messages[seq]["content"]
+        settled = messages[seq]["role"] == "user" or (
+            isFinalized(event)
+            and not any(
+                r.type == BotMessageTypes.image and r.payload.imageId
+                for r in event.botReply
+            )
+        )
+        if settled and seq < len(messages) - 2:
+            del versions[seq]
+    # Everything is in the store now, so between turns the session can be dropped and restored
+    sessionManager.touch(
+        st.session_state.conversationId,
+        messages,
+        evictable="turnJob" not in st.session_state and messages[-1]["role"] == "assistant",
+        keys=SESSION_STATE_KEYS,
+    )
+
+
+def debugPanelEnabled() -> bool:
+    """
+    Whether to show the debug panel, enabled with ?debug in the URL or DEBUG_PANEL=true.
+    """
+    if os.environ.get("DEBUG_PANEL", "false").lower() == "true":
+        return True
+    return queryParam("debug") is not None
 
 
 def deactivateButtons() -> None:
@@ -224,8 +333,14 @@ def makeUserMessage(userInput: Dict[str, str] = {}) -> Event:
     - userInput: A dictionary containing the user's input text, if available.
 
     Returns:
-    - Event: An Event object representing the user's message.
+    - Event: An Event object representing the user's message, or None if a turn is still being answered.
     """
+    if not ensureSession():
+        # The conversation is gone, so there's nothing to answer; the rerun starts a new one
+        return None
+    if "turnJob" in st.session_state:
+        logger.info("Still answering the last message, ignoring new input")
+        return None
     if not userInput and ("userInput" in st.session_state):
         userInput = {"type": "text", "text": st.session_state['userInput']}
         logger.info(f"User pressed button: {st.session_state['userInput']}")
@@ -241,187 +356,440 @@ def makeUserMessage(userInput: Dict[str, str] = {}) -> Event:
     st.session_state.messages.append({"role": "user", "content": userEvent})
     return userEvent
 
+@st.cache_resource(show_spinner=False)
+def getStartupExecutor() -> ThreadPoolExecutor:
+    """Returns the process-wide pool that produces greeting runs in the background."""
+    return ThreadPoolExecutor(
+        max_workers=int(os.environ.get("STARTUP_WORKERS", 8)),
+        thread_name_prefix="greeting",
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def getOpenerPool() -> OpenerPool:
+    """Returns the process-wide pool of ready greetings, shared by every session."""
+    pool = OpenerPool(lambda assistantId: prepareOpener(client, assistantId))
+    # Start warming as soon as the server is up, so the first sessions already find greetings
+    if assistantRegistry.defaultId:
+        pool.refill(assistantRegistry.defaultId)
+    return pool
+
+
+def startConversation(
+    userId: str,
+    conversationId: str,
+    assistantId: str,
+    threadId: Optional[str] = None,
+    runId: Optional[str] = None,
+    openerPool: Optional[OpenerPool] = None,
+) -> Dict[str, Any]:
+    """
+    Creates the thread and greeting run for a new session and builds the first bot message.
+
+    This runs on a background thread, so it must not touch st.session_state.
+    An existing thread or run is reused instead of creating a new one. A new
+    session takes a ready greeting from the opener pool when it has one.
+
+    Args:
+    - userId: The session's user ID.
+    - conversationId: The session's conversation ID.
+    - assistantId: The ID of the OpenAI assistant.
+    - threadId: The session's thread ID, if it already has one.
+    - runId: The session's run ID, if it already has one.
+    - openerPool: The pool to take a ready greeting from, if any.
+
+    Returns:
+    - Dict: The threadId, runId, messages, messageSync and pendingToolOutputs to store in the session state.
+    """
+    opener = None
+    if openerPool is not None and threadId is None and runId is None:
+        opener = openerPool.take(assistantId)
+    if opener is None:
+        opener = prepareOpener(client, assistantId, threadId, runId)
+    else:
+        logger.debug(f"Took a ready greeting on thread {opener.threadId}")
+    botReply = opener.botReply
+    if opener.status == "failed":
+        botReply = [
+            BotMessage(
+                type="text",
+                payload=BotTextMessage(
+                    text=f"There was an error starting the chat: {opener.lastError.code}. {opener.lastError.message}",
+                    useMarkdown=True,
+                ),
+            )
+        ]
+    messages = []
+    if botReply or opener.status == "completed":
+        messages = [
+            {
+                "role": "assistant",
+                "content": Event(
+                    userId=userId,
+                    conversationId=conversationId,
+                    direction="outgoing",
+                    botReply=botReply,
+                ),
+            }
+        ]
+    return {
+        "threadId": opener.threadId,
+        "runId": opener.runId,
+        "messages": messages,
+        "messageSync": opener.messageSync,
+        "pendingToolOutputs": opener.pendingToolOutputs,
+    }
+
+
+def renderHeader() -> None:
+    """Shows the title and description of the session's assistant, if it has them."""
+    profile = assistantRegistry.get(st.session_state.assistantId)
+    if profile.title:
+        st.title(profile.title)
+    if profile.description:
+        st.markdown(profile.description)
+
+
 def init_session_state():
     """
     Initializes the Streamlit session state with necessary values.
 
-    This includes creating a new thread and run for the OpenAI assistant,
-    generating a new user ID and conversation ID, and preparing the first message.
+    This generates a new user ID and conversation ID, picks the assistant
+    named by ?assistant= (or the default one) and starts preparing the first
+    message in the background. Nothing here waits on a run, and values that
+    already exist in the session are never recreated, so reruns are free.
     """
     logger.debug("Initializing streamlit session...")
-    thread = client.beta.threads.create(messages=[{"role": "user", "content": "Hello"}])
-    assistant = client.beta.assistants.retrieve(assistant_id=os.environ.get("OPENAI_ASSISTANT_ID"))
-    if "threadId" not in st.session_state:
-        st.session_state.threadId = thread.id
-    if "assistantId" not in st.session_state:
-        st.session_state.assistantId = assistant.id
-    if "runId" not in st.session_state:
-        run = client.beta.threads.runs.create(
-            thread_id=thread.id, assistant_id=assistant.id
-        )
-        st.session_state.runId = run.id
     if "userId" not in st.session_state:
         st.session_state.userId = generate(size=12)
+    currentSession.set(st.session_state.userId)
     if "conversationId" not in st.session_state:
         st.session_state.conversationId = generate(size=14)
-    # init the OpenAI agent run
-    run = client.beta.threads.runs.retrieve(
-        run_id=st.session_state.runId, thread_id=st.session_state.threadId
-    )
-    # Wait for run to finish
-    while run.status == "in_progress":
-        logger.debug("Run initializing, waiting...")
-        time.sleep(1)
-        run = client.beta.threads.runs.retrieve(
-            run_id=st.session_state.runId, thread_id=st.session_state.threadId
+    if "assistantId" not in st.session_state:
+        profile = assistantRegistry.resolve(queryParam("assistant"))
+        if profile is None:
+            st.error(f"There is no assistant called {queryParam('assistant')!r} here.")
+            st.stop()
+        st.session_state.assistantId = profile.assistantId
+    if "greeting" not in st.session_state:
+        st.session_state.greeting = getStartupExecutor().submit(
+            contextvars.copy_context().run,
+            startConversation,
+            st.session_state.userId,
+            st.session_state.conversationId,
+            st.session_state.assistantId,
+            st.session_state.get("threadId"),
+            st.session_state.get("runId"),
+            getOpenerPool(),
         )
-        logger.debug(f"Run is {run.status}")
-    # Add the first bot message
-    if "messages" not in st.session_state:
-        if run.status == "requires_action":
-            for tool_call in run.required_action.submit_tool_outputs.tool_calls:
-                logger.debug(f"Processing tool call {tool_call.function.name}")
-                if tool_call.function.name == "show_buttons":
-                    logger.debug("Showing buttons...")
-                    args = json.loads(tool_call.function.arguments)
-                    text, choices = args["text"], args["choices"]
-                    st.session_state.messages = [{
-                        "role":"assistant",
-                        "content":Event(
-                            userId=st.session_state.userId,
-                            conversationId=st.session_state.conversationId,
-                            direction="outgoing",
-                            botReply=[BotMessage(
-                            type="button",
-                            payload=BotButtonMessage(
-                                text=text,
-                                choices=[
-                                    Choice(label=n["label"], value=n["value"])
-                                    for n in choices
-                                ],
-                                active=True,
-                            ),
-                        )],
-                    )}]
-                if tool_call.function.name == "generate_image":
-                    logger.debug("Generating image...")
-                    args = json.loads(tool_call.function.arguments)
-                    prompt = args['prompt']
-                    st.session_state.messages = [
-                        {
-                            "role":"assistant",
-                            "content":Event(
-                                userId=st.session_state.userId,
-                                conversationId=st.session_state.conversationId,
-                                direction="outgoing",
-                                botReply=[BotMessage(
-                            type="image",
-                            payload=BotImageMessage(
-                                url=generateImage(prompt)
-                            )
-                        )]
-                    )}]
-                # Tell the API that the image was successfully generated
-                client.beta.threads.runs.submit_tool_outputs(
-                    run_id=st.session_state.runId,
-                    thread_id=st.session_state.threadId,
-                    tool_outputs=[
-                        {
-                            "tool_call_id": run.required_action.submit_tool_outputs.tool_calls[0].id,
-                            "output": "{\"status\":200}",
-                        }
-                    ],
-                )
-        if run.status == "failed":
-            st.session_state.messages = [
-                {
-                    "role": "assistant",
-                    "content": Event(
-                        userId=st.session_state.userId,
-                        conversationId=st.session_state.conversationId,
-                        direction="outgoing",
-                        botReply=[
-                            BotMessage(
-                                type="text",
-                                payload=BotTextMessage(
-                                    text=f"There was an error starting the chat: {run.last_error.code}. {run.last_error.message}",
-                                    useMarkdown=True,
-                                ),
-                            )
-                        ],
-                    ),
-                }
-            ]
-        if run.status == "completed":
-            logger.debug("Message with no buttons")
-            messages = client.beta.threads.messages.list(
-                thread_id=st.session_state.threadId
-                )
-            st.session_state.messages = [
-                {
-                "role":"assistant",
-                "content": Event(
-                    userId=st.session_state.userId,
-                    conversationId=st.session_state.conversationId,
-                    direction="outgoing",
-                    botReply=[
-                        BotMessage(
-                            type="text",
-                            payload=BotTextMessage(
-                                text=messages.data[0].content[0].text.value,
-                                useMarkdown=True,
-                    ),
-                )]
-                )
-            }]
 
 
-# Initialize messages with welcome message
-if __name__ == "__main__":
-    if "messages" not in st.session_state:
-        with st.chat_message("assistant"):
-            with st.spinner("Loading quiz..."):
-                init_session_state()
-                st.rerun()
-    # Write messages to app
-    for message in st.session_state.messages:
-        if message["role"] != "user":
-            with st.chat_message("assistant"):
-                for reply in message["content"].botReply:
-                    if reply.type == BotMessageTypes.button:
-                        logger.debug("Writing bot button message to chat...")
-                        makeButtons(reply.payload, makeUserMessage)
-                    if reply.type == BotMessageTypes.text:
-                        if reply.payload.useMarkdown:
-                            logger.debug("Writing bot markdown message to chat...")
-                            makeMarkdown(reply.payload)
-                        else:
-                            logger.debug("Writing bot text message to chat...")
-                            makeText(reply.payload)
+def finish_init_session_state():
+    """
+    Waits for the greeting started by init_session_state and stores it in the session.
+    """
+    # Popped first so a failed greeting is retried on the next rerun
+    greeting = st.session_state.pop("greeting")
+    result = greeting.result()
+    st.session_state.threadId = result["threadId"]
+    st.session_state.runId = result["runId"]
+    st.session_state.messages = result["messages"]
+    st.session_state.messageSync = result["messageSync"]
+    st.session_state.pendingToolOutputs = result["pendingToolOutputs"]
+
+
+def renderReply(reply: BotMessage, key: str) -> None:
+    """
+    Writes one bot reply to the chat.
+
+    Args:
+    - reply: The reply to draw.
+    - key: Unique key for the reply's widgets.
+    """
+    if reply.type == BotMessageTypes.button:
+        logger.debug("Writing bot button message to chat...", extra={"sample": "render"})
+        makeButtons(reply.payload, makeUserMessage, key)
+    if reply.type == BotMessageTypes.image:
+        logger.debug("Writing bot image message to chat...", extra={"sample": "render"})
+        makeImage(reply.payload)
+    if reply.type == BotMessageTypes.text:
+        if reply.payload.useMarkdown:
+            logger.debug("Writing bot markdown message to chat...", extra={"sample": "render"})
+            makeMarkdown(reply.payload)
+        else:
+            logger.debug("Writing bot text message to chat...", extra={"sample": "render"})
+            makeText(reply.payload)
+
+
+def renderMessage(message: Dict[str, Any]) -> None:
+    """
+    Writes one message from the session history to the chat.
+
+    Finalized bot events are flattened once by prerenderEvent and drawn from
+    the session's render cache on every later rerun.
+
+    Args:
+    - message: A {"role", "content"} entry of st.session_state.messages.
+    """
+    if message["role"] == "user":
+        with st.chat_message("user"):
+            logger.debug("Writing user message to chat...", extra={"sample": "render"})
+            st.markdown(message["content"].payload["text"])
+        return
+    with st.chat_message("assistant"):
+        event = message["content"]
+        if useRenderCache() and isFinalized(event):
+            renderCache = st.session_state.setdefault("renderCache", {})
+            if event.id not in renderCache:
+                renderCache[event.id] = prerenderEvent(event)
+            makePrerendered(renderCache[event.id])
+            return
+        for i, reply in enumerate(event.botReply):
+            renderReply(reply, f"{event.id}-{i}")
+
+
+def useRenderCache() -> bool:
+    """Whether finalized history is drawn from the render cache (RENDER_CACHE, on by default)."""
+    return os.environ.get("RENDER_CACHE", "true").lower() != "false"
+
+
+def useBackgroundTurns() -> bool:
+    """Whether turns are answered by the orchestrator instead of in the script (ORCHESTRATION=background)."""
+    return os.environ.get("ORCHESTRATION", "inline").lower() == "background"
+
+
+# Session values a turn reads and updates
+TURN_STATE_KEYS = ("threadId", "runId", "assistantId", "pendingToolOutputs", "messageSync")
+
+
+def submitTurn(userEvent: Event) -> TurnJob:
+    """
+    Hands a user's message to the orchestrator to answer in the background.
+
+    The turn works on a copy of the session values it needs, because
+    st.session_state can only be used from the script thread.
+
+    Args:
+    - userEvent: The message to answer.
+
+    Returns:
+    - TurnJob: The job to poll for the answer.
+    """
+    state = {key: st.session_state[key] for key in TURN_STATE_KEYS if key in st.session_state}
+    state["pendingToolOutputs"] = list(state.get("pendingToolOutputs", []))
+
+    def answer(job: TurnJob) -> Event:
+        with span("turn"):
+            return getBotResponse(userEvent, job.onTextDelta, job.state)
+
+    # A session restored while this turn was in flight gets the job already answering it
+    return orchestrator.submit(st.session_state.conversationId, answer, state, key=userEvent.id)
+
+
+def finishTurn(job: TurnJob, userEvent: Event) -> Event:
+    """
+    Copies a finished background turn's session values back and returns its answer.
+
+    Args:
+    - job: The finished job.
+    - userEvent: The message it answered.
+
+    Returns:
+    - Event: The bot's reply, or an apology if the turn failed.
+    """
+    for key in TURN_STATE_KEYS:
+        if key in job.state:
+            st.session_state[key] = job.state[key]
+    if job.event is not None:
+        return job.event
+    if isinstance(job.error, RunSuperseded):
+        return supersededReply(userEvent)
+    return userEvent.replyWith(
+        [
+            BotMessage(
+                type="text",
+                payload=BotTextMessage(
+                    text=f"Sorry, there was an error in the chat: {job.error}",
+                    useMarkdown=True,
+                ),
+            )
+        ]
+    )
+
+
+def turnInFlight() -> bool:
+    """Whether the last message is waiting on a background turn."""
+    return useBackgroundTurns() and st.session_state.messages[-1]["role"] == "user"
+
+
+def pendingImageIds() -> List[str]:
+    """IDs of the images in the history that are still being generated."""
+    return [
+        reply.payload.imageId
+        for message in st.session_state.messages
+        if message["role"] != "user"
+        for reply in message["content"].botReply
+        if reply.type == BotMessageTypes.image and reply.payload.imageId
+    ]
+
+
+def collectTurn() -> None:
+    """Adds a finished background turn's answer to the history."""
+    job = st.session_state.get("turnJob")
+    if job is None or not job.done:
+        return
+    del st.session_state.turnJob
+    userEvent = st.session_state.messages[-1]["content"]
+    st.session_state.messages.append(
+        {"role": "assistant", "content": finishTurn(job, userEvent)}
+    )
+
+
+def pollTurn(polling: bool) -> None:
+    """
+    Shows a background turn's progress and collects its answer when it is done.
+
+    The live tail fragment reruns itself on a timer while a turn is in flight,
+    so no script thread ever blocks on a run and a click can't interrupt one
+    halfway through.
+
+    Args:
+    - polling: Whether the live tail is already rerunning on a timer.
+    """
+    userEvent = st.session_state.messages[-1]["content"]
+    job = st.session_state.get("turnJob")
+    if job is None:
+        job = st.session_state.turnJob = submitTurn(userEvent)
+        if hasattr(st, "fragment") and not polling:
+            # Started from a button in the fragment: a full rerun sets up the timer
+            st.rerun()
+    if job.done:
+        # The full rerun collects it, and draws the chat input enabled again
+        st.rerun()
+    with st.chat_message("assistant"):
+        if job.text:
+            st.markdown(job.text + "▌")
         else:
-            with st.chat_message("user"):
-                logger.debug("Writing user message to chat...")
-                st.markdown(message["content"].payload["text"])
+            st.caption("Thinking...")
+    persistConversation()
+    if not hasattr(st, "fragment"):
+        time.sleep(ORCHESTRATION_POLL_INTERVAL)
+        st.rerun()
+
+
+def renderLiveTail(start: int, polling: bool = False) -> None:
+    """
+    Writes the messages from `start` onwards and answers any pending user input.
+
+    When the installed Streamlit supports fragments this runs as one, so clicking
+    a button in the latest message only reruns the tail and not the whole history.
+
+    Args:
+    - start: Index of the first message in st.session_state.messages that may still change.
+    - polling: Whether the fragment is rerunning on a timer to follow a background turn or pending images.
+    """
+    if not ensureSession():
+        st.rerun()
+    for message in st.session_state.messages[start:]:
+        renderMessage(message)
+    if turnInFlight():
+        pollTurn(polling)
+        return
     if st.session_state.messages[-1]["role"] != "assistant":
         logger.debug("Processing user input...")
-        with st.chat_message("assistant") as msg:
+        with st.chat_message("assistant") as msg, span("turn"):
+            # Touched while the turn waits, which is where Streamlit stops it if the user moves on
+            beat = st.empty()
             with st.spinner("Thinking..."):
-                botEvent = getBotResponse(st.session_state.messages[-1]['content'])
+                # Text is drawn into this placeholder as it streams in
+                textStream = MarkdownStream()
+                userEvent = st.session_state.messages[-1]['content']
+                try:
+                    botEvent = getBotResponse(userEvent, textStream.write, heartbeat=beat.empty)
+                except RunSuperseded:
+                    logger.info("Turn was superseded by newer input")
+                    botEvent = supersededReply(userEvent)
                 st.session_state.messages.append(
                     {"role": "assistant", "content": botEvent}
                 )
-                for reply in botEvent.botReply:
-                    if reply.type == BotMessageTypes.button:
-                        logger.debug("Writing bot button message to chat...")
-                        makeButtons(reply.payload, makeUserMessage)
-                    if reply.type == BotMessageTypes.text:
-                        if reply.payload.useMarkdown:
-                            logger.debug("Writing bot markdown message to chat...")
-                            makeMarkdown(reply.payload)
-                        else:
-                            logger.debug("Writing bot text message to chat...")
-                            makeText(reply.payload)
+            with span("render"):
+                for i, reply in enumerate(botEvent.botReply):
+                    if reply.type == BotMessageTypes.text and textStream.started:
+                        logger.debug("Finalizing streamed bot message...")
+                        textStream.close(reply.payload)
+                        textStream = MarkdownStream()
+                    else:
+                        renderReply(reply, f"{botEvent.id}-{i}")
+                if textStream.started:
+                    # Streamed text no reply accounted for, e.g. from a run that stopped for a tool call
+                    payload = BotTextMessage(text=textStream.text, useMarkdown=True)
+                    textStream.close(payload)
+                    botEvent.botReply.insert(0, BotMessage(type="text", payload=payload))
+    persistConversation()
+    # Everything else is on screen, so now wait for any images still being generated
+    pendingImages = pendingImageIds()
+    if pendingImages and polling:
+        # The fragment's timer reruns the tail until they are done
+        return
+    if pendingImages:
+        logger.debug(f"Waiting for {len(pendingImages)} images...")
+        # Only briefly, so the script thread is free again for the user's next click
+        waitForImages(pendingImages, timeout=ORCHESTRATION_POLL_INTERVAL)
+        st.rerun()
+    elif polling:
+        # Nothing left to follow, so a full rerun turns the timer off
+        st.rerun()
+
+
+# Initialize messages with welcome message
+if __name__ == "__main__":
+    if not ensureSession():
+        init_session_state()
+        renderHeader()
+        # Paint the page shell before waiting on the greeting run
+        st.chat_input("Type your response here", disabled=True)
+        with st.chat_message("assistant"):
+            with st.spinner("Loading quiz..."):
+                finish_init_session_state()
+                # So a reload can find the conversation again
+                setQueryParam("conversation", st.session_state.conversationId)
+                st.rerun()
+    # OpenAI calls are queued per session so no one session can starve the others
+    currentSession.set(st.session_state.userId)
+    renderHeader()
+    collectTurn()
+    # Write messages to app. Only the latest bot message can still have clickable buttons.
+    liveFrom = max(len(st.session_state.messages) - 1, 0)
+    with span("render.history", messages=liveFrom):
+        for message in st.session_state.messages[:liveFrom]:
+            renderMessage(message)
     logger.debug("Waiting for user input...")
     prompt = st.chat_input(
-        "Type your response here", key="userInput", on_submit=makeUserMessage,
+        "Type your response here",
+        key="userInput",
+        on_submit=makeUserMessage,
+        # In the background mode, input waits until the last message is answered
+        disabled=turnInFlight(),
     )
+    if debugPanelEnabled():
+        makeDebugPanel(
+            memoryExporter.stats(),
+            {
+                "OpenAI connections": connectionStats.snapshot(),
+                "Image cache": imageCache.stats(),
+                "Image store": imageStore.stats(),
+                "Rate-limit scheduler": scheduler.stats(),
+                "Opener pool": getOpenerPool().stats(),
+                "Orchestrator": orchestrator.stats(),
+                "Assistants": assistantRegistry.stats(),
+                "Runs": runTracker.stats(),
+                "Sessions": sessionManager.stats(),
+            },
+        )
+    if hasattr(st, "fragment"):
+        polling = turnInFlight() or bool(pendingImageIds())
+        st.fragment(
+            renderLiveTail, run_every=ORCHESTRATION_POLL_INTERVAL if polling else None
+        )(liveFrom, polling)
+    else:
+        renderLiveTail(liveFrom)
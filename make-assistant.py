@@ -1,32 +1,69 @@
-import openai
-import os, json
+import argparse
+import json
+import os
+import sys
 from dotenv import load_dotenv, set_key, find_dotenv
 from util.logger import logger
+from util.openai_client import getClient
+from util.provisioning import (
+    AssistantSpec,
+    PROVISION_WORKERS,
+    loadManifest,
+    loadTools,
+    provision,
+)
 
 dotenv_path = find_dotenv(usecwd=True)
 if not dotenv_path:
     dotenv_path = '.env'  # Set a default path if not found
 load_dotenv()
 
-# Set new values or modify existing ones
-client = openai.Client(api_key = os.environ['OPENAI_API_KEY'])
-name = (name := os.environ.get('OPENAI_ASSISTANT_NAME')) or "My Bot"
-if "ASSISTANT_INSTRUCTIONS" in os.environ:
-    instructions = os.environ["ASSISTANT_INSTRUCTIONS"]
-else:
-    # If not, read the contents of the file into a single string
-    with open("instructions.txt", "r") as file:
-        instructions = file.read()
-with open("oai_tools.json", "r") as file:
-    data = json.load(file)
-# Convert the Python object into a JSON string
-json_string = json.dumps(data)
-assistant = client.beta.assistants.create(
-  name=name,
-  description="Let's have some fun! You will generate short, zany quizzes in the style of mid 2010's buzzfeed quizzicles",
-  instructions = instructions,
-  model="gpt-4-1106-preview",
-  tools=[{"type": "function", "function":func} for func in data],
+parser = argparse.ArgumentParser(
+    description="Creates or updates assistants, only touching the ones whose configuration changed."
+)
+parser.add_argument(
+    "--manifest",
+    help="JSON manifest of assistants to provision. Without it, the one assistant from instructions.txt and oai_tools.json is provisioned and its ID written to .env",
 )
+parser.add_argument("--workers", type=int, default=PROVISION_WORKERS, help="Creates and updates to run at once")
+parser.add_argument("--dry-run", action="store_true", help="Show what would change without changing it")
+parser.add_argument("--output", help="Write the manifest keys and assistant IDs to this JSON file")
+args = parser.parse_args()
+
+if args.manifest:
+    specs = loadManifest(args.manifest)
+else:
+    # Set new values or modify existing ones
+    name = (name := os.environ.get('OPENAI_ASSISTANT_NAME')) or "My Bot"
+    if "ASSISTANT_INSTRUCTIONS" in os.environ:
+        instructions = os.environ["ASSISTANT_INSTRUCTIONS"]
+    else:
+        # If not, read the contents of the file into a single string
+        with open("instructions.txt", "r") as file:
+            instructions = file.read()
+    specs = [
+        AssistantSpec(
+            key=os.environ.get("OPENAI_ASSISTANT_KEY", "default"),
+            name=name,
+            description="Let's have some fun! You will generate short, zany quizzes in the style of mid 2010's buzzfeed quizzicles",
+            instructions=instructions,
+            model="gpt-4-1106-preview",
+            tools=loadTools("oai_tools.json"),
+            # Adopts the assistant an earlier run of this script created, instead of making another
+            assistantId=os.environ.get("OPENAI_ASSISTANT_ID"),
+        )
+    ]
+
+results = provision(getClient(), specs, workers=args.workers, dryRun=args.dry_run)
+for result in results:
+    print(f"{result.action:>9}  {result.key}  {result.assistantId or ''}  {result.error or ''}".rstrip())
 
-set_key(dotenv_path, 'OPENAI_ASSISTANT_ID', assistant.id) 
\ No newline at end of file
+if args.output and not args.dry_run:
+    with open(args.output, "w") as file:
+        json.dump({r.key: r.assistantId for r in results if r.assistantId}, file, indent=2)
+if not args.manifest and not args.dry_run and results[0].assistantId:
+    set_key(dotenv_path, 'OPENAI_ASSISTANT_ID', results[0].assistantId)
+failed = [r.key for r in results if r.action == "failed"]
+if failed:
+    logger.error(f"Provisioning failed for {', '.join(failed)}")
+    sys.exit(1)
@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+from util.openai_client import getClient
+from util.provisioning import MANIFEST_KEY, listManaged
+from util.tool_handlers import toolRegistry
+from util.tool_registry import ToolRegistry
+from util.logger import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds before an assistant's profile is fetched again, so provisioning changes are picked up
+ASSISTANT_REGISTRY_TTL = float(os.environ.get("ASSISTANT_REGISTRY_TTL", 300))
+DEFAULT_ASSISTANT_KEY = "default"
+
+
+class AssistantProfile:
+    """
+    What a session needs to know about the assistant it talks to.
+
+    Attributes:
+        key (str): The manifest key the assistant is routed by, or its ID if it isn't managed.
+        assistantId (str): The OpenAI assistant ID.
+        title (str): Shown as the page title, empty for none.
+        description (str): Shown under the title, empty for none.
+        tools (ToolRegistry): The assistant's tools, with the app's handlers attached.
+        loadedAt (float): When the profile was fetched, in time.monotonic() seconds.
+    """
+
+    __slots__ = ("key", "assistantId", "title", "description", "tools", "loadedAt")
+
+    def __init__(self, key: str, assistantId: str, title: str, description: str, tools: ToolRegistry):
+        self.key = key
+        self.assistantId = assistantId
+        self.title = title
+        self.description = description
+        self.tools = tools
+        self.loadedAt = time.monotonic()
+
+
+class AssistantRegistry:
+    """
+    Process-wide profiles of every assistant this server hosts, so one process can serve many bots.
+
+    Sessions pick an assistant by the manifest key make-assistant.py stores
+    in its metadata, or get the default one (OPENAI_ASSISTANT_ID). Profiles
+    are fetched once per TTL for the whole process. A key that isn't known
+    lists the account's assistants at most once per TTL, so made-up keys
+    can't turn into an API call per page load. Only assistants provisioned
+    with a manifest key can be routed to.
+
+    Attributes:
+        defaultId (str): The assistant sessions get without a key.
+        ttl (float): Seconds before a profile is fetched again.
+    """
+
+    def __init__(self, defaultId: Optional[str], ttl: float = ASSISTANT_REGISTRY_TTL):
+        self.defaultId = defaultId
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # Serializes fetches, so sessions asking for the same assistant at once share one API call
+        self.fetchLock = threading.Lock()
+        self.byKey: Dict[str, AssistantProfile] = {}
+        self.byId: Dict[str, AssistantProfile] = {}
+        self.listedAt: Optional[float] = None
+        self.counters = {"lists": 0, "retrieves": 0, "unknownKeys": 0}
+
+    def makeProfile(self, assistant: Any) -> AssistantProfile:
+        metadata = assistant.metadata or {}
+        schemas = [
+            t.function.model_dump(exclude_none=True)
+            for t in assistant.tools
+            if t.type == "function"
+        ]
+        if assistant.id == self.defaultId:
+            # The default assistant keeps the page header it has always had
+            title = os.environ.get("OPENAI_ASSISTANT_NAME", "")
+            description = os.environ.get("BOT_DESCRIPTION", "")
+        else:
+            title = metadata.get("title") or assistant.name or ""
+            description = metadata.get("description") or assistant.description or ""
+        return AssistantProfile(
+            key=metadata.get(MANIFEST_KEY, assistant.id),
+            assistantId=assistant.id,
+            title=title,
+            description=description,
+            tools=toolRegistry.forSchemas(schemas),
+        )
+
+    def fresh(self, profile: Optional[AssistantProfile]) -> bool:
+        return profile is not None and time.monotonic() - profile.loadedAt < self.ttl
+
+    def store(self, profile: AssistantProfile) -> None:
+        with self.lock:
+            self.byId[profile.assistantId] = profile
+            if profile.key != profile.assistantId:
+                self.byKey[profile.key] = profile
+
+    def get(self, assistantId: str) -> AssistantProfile:
+        """
+        Returns an assistant's profile by ID, fetching it if it isn't cached.
+
+        Args:
+        - assistantId: The OpenAI assistant ID.
+
+        Returns:
+        - AssistantProfile: The profile.
+        """
+        profile = self.byId.get(assistantId)
+        if self.fresh(profile):
+            return profile
+        with self.fetchLock:
+            profile = self.byId.get(assistantId)
+            if self.fresh(profile):
+                return profile
+            logger.debug(f"Retrieving assistant {assistantId}")
+            self.counters["retrieves"] += 1
+            profile = self.makeProfile(getClient().beta.assistants.retrieve(assistant_id=assistantId))
+            self.store(profile)
+            return profile
+
+    def resolve(self, key: Optional[str]) -> Optional[AssistantProfile]:
+        """
+        Finds the assistant a session asked for.
+
+        Args:
+        - key: The manifest key from the URL, or None for the default assistant.
+
+        Returns:
+        - AssistantProfile: The profile, or None if no hosted assistant has that key.
+        """
+        if not key or key == DEFAULT_ASSISTANT_KEY:
+            return self.get(self.defaultId)
+        profile = self.byKey.get(key)
+        if self.fresh(profile):
+            return profile
+        with self.fetchLock:
+            profile = self.byKey.get(key)
+            if self.fresh(profile):
+                return profile
+            if self.listedAt is None or time.monotonic() - self.listedAt >= self.ttl:
+                self.refresh()
+            profile = self.byKey.get(key)
+            if profile is None:
+                self.counters["unknownKeys"] += 1
+            return profile
+
+    def refresh(self) -> None:
+        """Lists the account's assistants and reloads the profile of every one with a manifest key."""
+        logger.debug("Listing assistants")
+        self.counters["lists"] += 1
+        assistants = listManaged(getClient())
+        self.listedAt = time.monotonic()
+        profiles = [
+            self.makeProfile(assistant)
+            for assistant in assistants.values()
+            if MANIFEST_KEY in (assistant.metadata or {}) or assistant.id == self.defaultId
+        ]
+        with self.lock:
+            # Keys whose assistant was deleted stop routing
+            self.byKey.clear()
+        for profile in profiles:
+            self.store(profile)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns how many assistants are loaded and how many list and retrieve calls were made."""
+        with self.lock:
+            return {"assistants": len(self.byId), "routable": len(self.byKey), **self.counters}
+
+
+assistantRegistry = AssistantRegistry(os.environ.get("OPENAI_ASSISTANT_ID"))
@@ -0,0 +1,224 @@
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
+from util import event_codec
+from util.logger import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "sqlite" (default), "none" to turn persistence off, or "package.module:Class" for a custom backend
+CONVERSATION_STORE = os.environ.get("CONVERSATION_STORE", "sqlite")
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Relative paths are taken from the app directory, so the app finds its database wherever it is started from
+CONVERSATION_DB = os.path.join(APP_DIR, os.environ.get("CONVERSATION_DB", ".conversations.db"))
+
+
+class ConversationRecord(BaseModel):
+    """
+    Everything needed to bring a conversation back after a reload or restart.
+
+    Attributes:
+        conversationId (str): The conversation's ID, the key it is stored under.
+        userId (str): The user the conversation belongs to.
+        assistantId (str): The assistant answering in the conversation.
+        threadId (str): The conversation's OpenAI thread.
+        runId (str): The thread's latest run.
+        state (Dict[str, Any]): Other session values, e.g. held tool outputs.
+        messages (List[Dict[str, Any]]): The {"role", "content"} history, filled in on load.
+    """
+
+    conversationId: str
+    userId: str
+    assistantId: str = ""
+    threadId: str = ""
+    runId: str = ""
+    state: Dict[str, Any] = Field({}, description="Other session values to restore")
+    messages: List[Dict[str, Any]] = Field([], description="Message history, oldest first")
+
+
+class ConversationStore:
+    """
+    Interface for conversation persistence backends.
+
+    Messages are addressed by their position (seq) in the history. Saving a
+    seq again appends a new version rather than overwriting, and loading
+    returns the latest version of each.
+    """
+
+    def save(self, record: ConversationRecord, messages: Dict[int, Dict[str, Any]]) -> None:
+        """
+        Upserts the conversation's metadata and appends the given messages.
+
+        Args:
+        - record: The conversation metadata; its messages field is ignored.
+        - messages: New or changed {"role", "content"} messages by seq.
+        """
+        raise NotImplementedError
+
+    def load(self, conversationId: str) -> Optional[ConversationRecord]:
+        """
+        Reads a conversation and its history.
+
+        Args:
+        - conversationId: The conversation to load.
+
+        Returns:
+        - ConversationRecord: The conversation with its messages, or None if it isn't stored.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class NullConversationStore(ConversationStore):
+    """A store that keeps nothing, for when persistence is turned off."""
+
+    def save(self, record: ConversationRecord, messages: Dict[int, Dict[str, Any]]) -> None:
+        pass
+
+    def load(self, conversationId: str) -> Optional[ConversationRecord]:
+        return None
+
+
+class SqliteConversationStore(ConversationStore):
+    """
+    Stores conversations in a local SQLite database.
+
+    Message versions live in a WITHOUT ROWID table clustered on
+    (conversation_id, seq, version), so a conversation's whole history is one
+    contiguous range, read together with its metadata in a single query.
+    Events are stored in the compact event_codec encoding.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        # Streamlit runs every rerun on a new thread, so the connection is shared behind a lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                conversation_id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                assistant_id TEXT,
+                thread_id TEXT,
+                run_id TEXT,
+                state TEXT,
+                updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS conversations_user ON conversations (user_id);
+            CREATE TABLE IF NOT EXISTS events (
+                conversation_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                event BLOB NOT NULL,
+                PRIMARY KEY (conversation_id, seq, version)
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def save(self, record: ConversationRecord, messages: Dict[int, Dict[str, Any]]) -> None:
+        rows = [
+            (
+                record.conversationId,
+                seq,
+                m["role"],
+                event_codec.dumps(m["content"]),
+                record.conversationId,
+                seq,
+            )
+            for seq, m in messages.items()
+        ]
+        with self.lock, self.connection:
+            self.connection.execute(
+                """
+                INSERT INTO conversations VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (conversation_id) DO UPDATE SET
+                    assistant_id = excluded.assistant_id,
+                    thread_id = excluded.thread_id,
+                    run_id = excluded.run_id,
+                    state = excluded.state,
+                    updated_at = excluded.updated_at
+                """,
+                (
+                    record.conversationId,
+                    record.userId,
+                    record.assistantId,
+                    record.threadId,
+                    record.runId,
+                    json.dumps(record.state),
+                    time.time(),
+                ),
+            )
+            self.connection.executemany(
+                """
+                INSERT INTO events
+                SELECT ?, ?, COALESCE(MAX(version) + 1, 0), ?, ?
+                FROM events WHERE conversation_id = ? AND seq = ?
+                """,
+                rows,
+            )
+
+    def load(self, conversationId: str) -> Optional[ConversationRecord]:
+        with self.lock:
+            rows = self.connection.execute(
+                """
+                SELECT c.user_id, c.assistant_id, c.thread_id, c.run_id, c.state,
+                       e.seq, e.role, e.event
+                FROM conversations c
+                LEFT JOIN events e ON e.conversation_id = c.conversation_id
+                WHERE c.conversation_id = ?
+                ORDER BY e.seq, e.version
+                """,
+                (conversationId,),
+            ).fetchall()
+        if not rows:
+            return None
+        userId, assistantId, threadId, runId, state = rows[0][:5]
+        # Rows come in version order, so later versions of a seq replace earlier ones
+        latest = {seq: (role, event) for *_, seq, role, event in rows if seq is not None}
+        return ConversationRecord(
+            conversationId=conversationId,
+            userId=userId,
+            assistantId=assistantId or "",
+            threadId=threadId or "",
+            runId=runId or "",
+            state=json.loads(state or "{}"),
+            messages=[
+                {"role": role, "content": event_codec.loads(event)}
+                for role, event in latest.values()
+            ],
+        )
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+def makeStore() -> ConversationStore:
+    """
+    Builds the conversation store selected by CONVERSATION_STORE.
+
+    Returns:
+    - ConversationStore: The configured backend.
+    """
+    if CONVERSATION_STORE == "none":
+        return NullConversationStore()
+    if CONVERSATION_STORE == "sqlite":
+        return SqliteConversationStore(CONVERSATION_DB)
+    moduleName, _, className = CONVERSATION_STORE.partition(":")
+    return getattr(importlib.import_module(moduleName), className)()
+
+
+conversationStore = makeStore()
+logger.debug(f"Conversation store: {type(conversationStore).__name__}")
@@ -0,0 +1,292 @@
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional
+from util.pydantic_classes import (
+    BotButtonMessage,
+    BotDropdownMessage,
+    BotHTMLMessage,
+    BotImageMessage,
+    BotMessage,
+    BotMessageTypes,
+    BotTextMessage,
+    Choice,
+    Directions,
+    Event,
+)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Models are flattened into positional arrays: field names are implied by position,
+# enums become small integers and, in a history, the user and conversation IDs
+# shared by every event are written once. The arrays are packed with msgpack, a declared
+# dependency, and as compact JSON in installs that lack it; the first byte tells them apart, as it
+# does for plain model_dump_json data, which is still read so older data keeps loading.
+CODEC_VERSION = 1
+EPOCH = datetime(1970, 1, 1)
+MESSAGE_TYPES = list(BotMessageTypes)
+DIRECTIONS = list(Directions)
+# Keyed by both the enum and its value, since defaults are stored unconverted
+MESSAGE_TYPE_INDEX = {
+    **{t: i for i, t in enumerate(MESSAGE_TYPES)},
+    **{t.value: i for i, t in enumerate(MESSAGE_TYPES)},
+}
+DIRECTION_INDEX = {
+    **{d: i for i, d in enumerate(DIRECTIONS)},
+    **{d.value: i for i, d in enumerate(DIRECTIONS)},
+}
+ROLES = ["user", "assistant"]
+ROLE_INDEX = {r: i for i, r in enumerate(ROLES)}
+
+
+def encodeChoices(choices: List[Choice]) -> List[List[str]]:
+    return [[c.label, c.value] for c in choices]
+
+
+def decodeChoices(choices: List[List[str]]) -> List[Choice]:
+    return [Choice.trusted(label=label, value=value) for label, value in choices]
+
+
+# Per message type: payload -> positional list, and back
+PAYLOAD_ENCODERS = [
+    lambda p: [p.text, p.useMarkdown],
+    lambda p: [p.url, p.cacheKey, p.imageId, p.thumbnail, p.original],
+    lambda p: [p.html],
+    lambda p: [p.text, encodeChoices(p.choices), p.active, p.toolCallId],
+    lambda p: [p.text, encodeChoices(p.choices), p.active],
+]
+PAYLOAD_DECODERS = [
+    lambda f: BotTextMessage.trusted(text=f[0], useMarkdown=f[1]),
+    # Images stored before the image store have no renditions
+    lambda f: BotImageMessage.trusted(
+        url=f[0],
+        cacheKey=f[1],
+        imageId=f[2],
+        thumbnail=f[3] if len(f) > 3 else "",
+        original=f[4] if len(f) > 4 else "",
+    ),
+    lambda f: BotHTMLMessage.trusted(html=f[0]),
+    # Buttons stored before tool call tracking answer no call in particular
+    lambda f: BotButtonMessage.trusted(
+        text=f[0],
+        choices=decodeChoices(f[1]),
+        active=f[2],
+        toolCallId=f[3] if len(f) > 3 else "",
+    ),
+    lambda f: BotDropdownMessage.trusted(text=f[0], choices=decodeChoices(f[1]), active=f[2]),
+]
+# Indexed by position in BotMessageTypes
+assert [t.value for t in MESSAGE_TYPES] == ["text", "image", "html", "button", "dropdown"]
+
+
+def encodeTime(value: datetime) -> Any:
+    """Naive (UTC) datetimes become integer microseconds; aware ones keep their offset as ISO text."""
+    if value.tzinfo is not None:
+        return value.isoformat()
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def decodeTime(value: Any) -> datetime:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return EPOCH + timedelta(microseconds=value)
+
+
+def encodeEvent(event: Event, userId: Optional[str] = None, conversationId: Optional[str] = None) -> list:
+    """
+    Flattens an Event into a positional list.
+
+    Args:
+    - event: The event to encode.
+    - userId: If given and equal to the event's, the user ID is left out.
+    - conversationId: If given and equal to the event's, the conversation ID is left out.
+
+    Returns:
+    - list: [userId, conversationId, id, sentOn, direction, payload, botReply].
+    """
+    return [
+        None if event.userId == userId else event.userId,
+        None if event.conversationId == conversationId else event.conversationId,
+        event.id,
+        encodeTime(event.sentOn),
+        DIRECTION_INDEX[event.direction],
+        event.payload,
+        [encodeMessage(m) for m in event.botReply],
+    ]
+
+
+def encodeMessage(message: BotMessage) -> list:
+    typeIndex = MESSAGE_TYPE_INDEX[message.type]
+    return [typeIndex, PAYLOAD_ENCODERS[typeIndex](message.payload)]
+
+
+def decodeEvent(fields: list, userId: Optional[str] = None, conversationId: Optional[str] = None) -> Event:
+    """
+    Rebuilds an Event from encodeEvent's output without re-validating it.
+
+    Args:
+    - fields: The positional list.
+    - userId: The user ID to use where it was left out.
+    - conversationId: The conversation ID to use where it was left out.
+
+    Returns:
+    - Event: The decoded event.
+    """
+    eventUserId, eventConversationId, eventId, sentOn, direction, payload, botReply = fields
+    return Event.trusted(
+        userId=userId if eventUserId is None else eventUserId,
+        conversationId=conversationId if eventConversationId is None else eventConversationId,
+        id=eventId,
+        sentOn=decodeTime(sentOn),
+        direction=DIRECTIONS[direction],
+        payload=payload,
+        botReply=[
+            BotMessage.trusted(type=MESSAGE_TYPES[t], payload=PAYLOAD_DECODERS[t](fields))
+            for t, fields in botReply
+        ],
+    )
+
+
+def pack(value: Any) -> bytes:
+    if msgpack is not None:
+        return msgpack.packb(value, use_bin_type=True)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def unpack(data: bytes) -> Any:
+    # JSON arrays start with "["; msgpack arrays never do
+    if data[:1] == b"[":
+        return json.loads(data)
+    if msgpack is None:
+        raise ValueError("Data was packed with msgpack, which is not installed")
+    return msgpack.unpackb(data, raw=False)
+
+
+def dumps(event: Event) -> bytes:
+    """
+    Encodes one Event.
+
+    Args:
+    - event: The event to encode.
+
+    Returns:
+    - bytes: The compact encoding.
+    """
+    return pack([CODEC_VERSION, encodeEvent(event)])
+
+
+def loads(data: bytes) -> Event:
+    """
+    Decodes one Event written by dumps, or by Event.model_dump_json.
+
+    Args:
+    - data: The encoded event.
+
+    Returns:
+    - Event: The decoded event.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    if data[:1] == b"{":
+        return Event.model_validate_json(data)
+    version, fields = unpack(data)
+    return decodeEvent(fields)
+
+
+def dumpsHistory(messages: List[Dict[str, Any]]) -> bytes:
+    """
+    Encodes a whole {"role", "content"} message history.
+
+    The user and conversation IDs are written once for the history instead of per event.
+
+    Args:
+    - messages: The history, as kept in st.session_state.messages.
+
+    Returns:
+    - bytes: The compact encoding.
+    """
+    first = messages[0]["content"] if messages else None
+    userId = first.userId if first else None
+    conversationId = first.conversationId if first else None
+    return pack(
+        [
+            CODEC_VERSION,
+            userId,
+            conversationId,
+            [
+                [ROLE_INDEX[m["role"]], encodeEvent(m["content"], userId, conversationId)]
+                for m in messages
+            ],
+        ]
+    )
+
+
+def loadsHistory(data: bytes) -> List[Dict[str, Any]]:
+    """
+    Decodes a message history written by dumpsHistory.
+
+    Args:
+    - data: The encoded history.
+
+    Returns:
+    - List[Dict[str, Any]]: The {"role", "content"} messages.
+    """
+    version, userId, conversationId, messages = unpack(data)
+    return [
+        {"role": ROLES[role], "content": decodeEvent(fields, userId, conversationId)}
+        for role, fields in messages
+    ]
+
+
+def iterJsonl(messages: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """
+    Yields one compact JSON line per message, so histories can be streamed out without building them in memory.
+
+    Args:
+    - messages: {"role", "content"} messages.
+
+    Returns:
+    - Iterator[str]: Newline-terminated JSON lines.
+    """
+    for m in messages:
+        yield json.dumps(
+            [CODEC_VERSION, ROLE_INDEX[m["role"]], encodeEvent(m["content"])],
+            separators=(",", ":"),
+        ) + "\n"
+
+
+def exportJsonl(messages: Iterable[Dict[str, Any]], file: IO[str]) -> int:
+    """
+    Writes messages to a text file as JSON lines.
+
+    Args:
+    - messages: {"role", "content"} messages.
+    - file: A file opened for writing text.
+
+    Returns:
+    - int: The number of messages written.
+    """
+    count = 0
+    for line in iterJsonl(messages):
+        file.write(line)
+        count += 1
+    return count
+
+
+def importJsonl(file: IO[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Reads messages written by exportJsonl, one line at a time.
+
+    Args:
+    - file: A file opened for reading text.
+
+    Returns:
+    - Iterator[Dict[str, Any]]: The {"role", "content"} messages.
+    """
+    for line in file:
+        if line.strip():
+            version, role, fields = json.loads(line)
+            yield {"role": ROLES[role], "content": decodeEvent(fields)}
@@ -1,28 +1,178 @@
-import openai
+import contextvars
+import httpx
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Union
+from nanoid import generate
 from util.pydantic_classes import BotImageMessage
+from util.image_cache import imageCache, makeKey
+from util.image_store import imageStore
+from util.logger import logger
+from util.openai_client import getClient, getHttpClient
+from util.tracing import span
 from dotenv import load_dotenv
 
 load_dotenv()
-client = openai.Client(api_key = os.environ.get('OPENAI_API_KEY'))
 
-def generateImage(prompt:str)->BotImageMessage:
+# Images are generated off the script thread so a slow DALL-E call never freezes the chat
+executor = ThreadPoolExecutor(
+   max_workers=int(os.environ.get("IMAGE_WORKERS", 4)),
+   thread_name_prefix="generate-image",
+)
+# Jobs still running; a finished job's result moves to finishedImages until its message is rendered
+pendingImages: Dict[str, Future] = {}
+# Bounded, so results of images nobody comes back for are dropped, oldest first
+finishedImages: "OrderedDict[str, Union[BotImageMessage, Exception]]" = OrderedDict()
+imagesLock = threading.Lock()
+IMAGE_RESULTS_KEPT = int(os.environ.get("IMAGE_RESULTS_KEPT", 1024))
+IMAGE_DOWNLOAD_TIMEOUT = float(os.environ.get("IMAGE_DOWNLOAD_TIMEOUT", 30))
+
+def generateImage(prompt:str, model:str="dall-e-3", size:str="1024x1024")->BotImageMessage:
    """
    Uses the new DALLE-3 API to generate an image based
 
+   Identical requests (after prompt normalization) are served from the image cache.
+   The image and its thumbnail are put in the image store for the browser to load.
+
+   Args:
+    - prompt: What to prompt the image generator with
+    - model: Which image model to use
+    - size: The size of the generated image
+
+    Returns:
+        A BotImageMessage object containing the URL and cache key of the image
+   """
+   key = makeKey(prompt, model, size)
+   cached = imageCache.get(key)
+   if cached is not None:
+      logger.debug(f"Image cache hit for {key[:12]}")
+      return withRenditions(BotImageMessage(cacheKey=key), cached)
+   with span("image.generate", model=model, size=size):
+      img = getClient().images.generate(
+           model=model,
+           prompt=prompt,
+           n=1,
+           size=size,
+           response_format = "url",
+       )
+   url = img.data[0].url
+   # The hosted URL expires, so keep the bytes around instead
+   try:
+      with span("image.download"):
+         response = getHttpClient().get(url, timeout=IMAGE_DOWNLOAD_TIMEOUT)
+         response.raise_for_status()
+      imageCache.put(key, response.content)
+   except httpx.HTTPError as e:
+      logger.warning(f"Could not cache generated image: {e}")
+      return BotImageMessage(url=url)
+   return withRenditions(
+      BotImageMessage(
+         url=url,
+         cacheKey=key,
+      ),
+      response.content,
+   )
+
+def withRenditions(payload:BotImageMessage, data:bytes)->BotImageMessage:
+   """
+   Stores an image's thumbnail and original and points the payload at them.
+
+   Args:
+    - payload: The image message to fill in
+    - data: The full-size image bytes
+
+    Returns:
+        The same payload, which still has its cache key to fall back on if the store fails
+   """
+   try:
+      with span("image.transcode"):
+         # The original is linked from the image cache's copy instead of being stored twice
+         source = imageCache.path(payload.cacheKey) if payload.cacheKey else None
+         payload.thumbnail, payload.original = imageStore.renditions(data, source)
+   except OSError as e:
+      logger.warning(f"Could not store image renditions: {e}")
+   return payload
+
+def generateImageAsync(prompt:str)->BotImageMessage:
+   """
+   Starts generating an image in the background.
+
    Args:
     - prompt: What to prompt the image generator with
 
     Returns:
-        A BotImageMessage object containing the URL of the image
-   """
-   img = client.images.generate(
-        model="dall-e-3",
-        prompt=prompt,
-        n=1,
-        size="1024x1024",
-        response_format = "url",
-    )
-   return BotImageMessage(
-      url=img.data[0].url
-   )
\ No newline at end of file
+        A placeholder BotImageMessage whose imageId tracks the background job
+   """
+   payload = BotImageMessage(imageId=generate(size=12))
+   imageId = payload.imageId
+   # Copy the context so the image spans are attributed to the current turn
+   future = executor.submit(contextvars.copy_context().run, generateImage, prompt)
+   pendingImages[imageId] = future
+   future.add_done_callback(lambda f: finishImage(imageId, f))
+   return payload
+
+def finishImage(imageId:str, future:Future)->None:
+   """
+   Moves a finished job's result from pendingImages to finishedImages.
+
+   Args:
+    - imageId: ID of the image job
+    - future: The job, which must be done
+   """
+   with imagesLock:
+      if pendingImages.pop(imageId, None) is None:
+         return
+      try:
+         finishedImages[imageId] = future.result()
+      except Exception as e:
+         finishedImages[imageId] = e
+      while len(finishedImages) > IMAGE_RESULTS_KEPT:
+         finishedImages.popitem(last=False)
+
+def resolveImage(payload:BotImageMessage)->bool:
+   """
+   Fills in the URL of a placeholder image if its background job has finished.
+
+   Args:
+    - payload: A BotImageMessage, possibly still waiting on its image
+
+    Returns:
+        True if the image is ready (or failed), False if it is still being generated
+   """
+   if not payload.imageId:
+      return True
+   future = pendingImages.get(payload.imageId)
+   if future is not None:
+      if not future.done():
+         return False
+      # Its done-callback may not have run yet
+      finishImage(payload.imageId, future)
+   with imagesLock:
+      result = finishedImages.pop(payload.imageId, None)
+   payload.imageId = ""
+   if result is None:
+      # The job was lost, e.g. because the server restarted
+      logger.error("Image generation job not found")
+   elif isinstance(result, Exception):
+      logger.error(f"Image generation failed: {result}")
+   else:
+      payload.url = result.url
+      payload.cacheKey = result.cacheKey
+      payload.thumbnail = result.thumbnail
+      payload.original = result.original
+   return True
+
+def waitForImages(imageIds:List[str], timeout:Optional[float]=None)->None:
+   """
+   Blocks until at least one of the given background images is done.
+
+   Args:
+    - imageIds: IDs of the pending image jobs to wait on
+    - timeout: Maximum number of seconds to wait
+   """
+   # Jobs finish on worker threads, so look each one up only once
+   futures = [f for f in (pendingImages.get(i) for i in imageIds) if f is not None]
+   if futures:
+      wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
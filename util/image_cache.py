@@ -0,0 +1,197 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from util.logger import logger
+
+load_dotenv()
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Relative paths are taken from the app directory, like the other on-disk stores
+IMAGE_CACHE_DIR = os.path.join(APP_DIR, os.environ.get("IMAGE_CACHE_DIR", ".image_cache"))
+
+
+def normalizePrompt(prompt: str) -> str:
+    """Lowercases a prompt and collapses whitespace so trivial variations share a cache entry."""
+    return " ".join(prompt.lower().split())
+
+
+def makeKey(prompt: str, model: str, size: str) -> str:
+    """
+    Builds the content address of an image request.
+
+    Args:
+    - prompt: The image prompt, normalized before hashing.
+    - model: The image model, e.g. dall-e-3.
+    - size: The requested image size, e.g. 1024x1024.
+
+    Returns:
+    - str: A hex sha256 digest identifying the request.
+    """
+    raw = "\x1f".join([normalizePrompt(prompt), model, size])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """
+    A two-tier cache of generated image bytes.
+
+    The memory tier is an LRU bounded by total bytes; the disk tier keeps one
+    file per key and is bounded by total bytes as well. Both tiers drop entries
+    older than the TTL. All methods are thread safe.
+
+    Attributes:
+        directory (str): Where the disk tier stores images.
+        memoryBytes (int): Maximum total size of the memory tier.
+        diskBytes (int): Maximum total size of the disk tier.
+        ttl (float): Seconds an entry stays valid, 0 to keep entries forever.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        memoryBytes: int = 64 * 1024 * 1024,
+        diskBytes: int = 1024 * 1024 * 1024,
+        ttl: float = 7 * 24 * 3600,
+    ):
+        self.directory = directory
+        self.memoryBytes = memoryBytes
+        self.diskBytes = diskBytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # key -> (bytes, stored at)
+        self.memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.memoryUsed = 0
+        # key -> (size, stored at), oldest access first
+        self.disk: "OrderedDict[str, tuple]" = OrderedDict()
+        self.diskUsed = 0
+        self.counters = {"memoryHits": 0, "diskHits": 0, "misses": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._loadDiskIndex()
+
+    def path(self, key: str) -> str:
+        """Returns the file the disk tier uses for a key."""
+        return os.path.join(self.directory, f"{key}.png")
+
+    def _loadDiskIndex(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".png"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for mtime, key, size in sorted(entries):
+            self.disk[key] = (size, mtime)
+            self.diskUsed += size
+        self._evictDisk()
+
+    def _expired(self, storedAt: float) -> bool:
+        return self.ttl > 0 and time.time() - storedAt > self.ttl
+
+    def _putMemory(self, key: str, data: bytes, storedAt: float) -> None:
+        if len(data) > self.memoryBytes:
+            return
+        if key in self.memory:
+            self.memoryUsed -= len(self.memory.pop(key)[0])
+        self.memory[key] = (data, storedAt)
+        self.memoryUsed += len(data)
+        while self.memoryUsed > self.memoryBytes:
+            _, (old, _) = self.memory.popitem(last=False)
+            self.memoryUsed -= len(old)
+            self.counters["evictions"] += 1
+
+    def _dropDisk(self, key: str) -> None:
+        size, _ = self.disk.pop(key)
+        self.diskUsed -= size
+        self.counters["evictions"] += 1
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evictDisk(self) -> None:
+        for key, (_, storedAt) in list(self.disk.items()):
+            if self._expired(storedAt):
+                self._dropDisk(key)
+        while self.diskUsed > self.diskBytes and self.disk:
+            self._dropDisk(next(iter(self.disk)))
+
+    def get(self, key: str, record: bool = True) -> Optional[bytes]:
+        """
+        Looks up image bytes, promoting disk hits into the memory tier.
+
+        Args:
+        - key: A key from makeKey.
+        - record: Whether the lookup counts towards the hit/miss counters.
+          Rendering passes False so reruns don't inflate the hit rate.
+
+        Returns:
+        - bytes: The image, or None on a miss.
+        """
+        with self.lock:
+            if key in self.memory:
+                data, storedAt = self.memory[key]
+                if not self._expired(storedAt):
+                    self.memory.move_to_end(key)
+                    self.counters["memoryHits"] += record
+                    return data
+                self.memoryUsed -= len(self.memory.pop(key)[0])
+            if key in self.disk:
+                size, storedAt = self.disk[key]
+                if not self._expired(storedAt):
+                    try:
+                        with open(self.path(key), "rb") as f:
+                            data = f.read()
+                    except FileNotFoundError:
+                        data = None
+                    if data is not None:
+                        self.disk.move_to_end(key)
+                        self._putMemory(key, data, storedAt)
+                        self.counters["diskHits"] += record
+                        return data
+                self._dropDisk(key)
+            self.counters["misses"] += record
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        Stores image bytes in both tiers.
+
+        Args:
+        - key: A key from makeKey.
+        - data: The encoded image.
+        """
+        storedAt = time.time()
+        tmpPath = f"{self.path(key)}.{threading.get_ident()}.tmp"
+        with open(tmpPath, "wb") as f:
+            f.write(data)
+        os.replace(tmpPath, self.path(key))
+        with self.lock:
+            if key in self.disk:
+                self.diskUsed -= self.disk.pop(key)[0]
+            self.disk[key] = (len(data), storedAt)
+            self.diskUsed += len(data)
+            self._putMemory(key, data, storedAt)
+            self._evictDisk()
+        logger.debug(f"Cached image {key[:12]} ({len(data)} bytes)")
+
+    def stats(self) -> Dict[str, int]:
+        """Returns hit/miss counters and the current size of each tier."""
+        with self.lock:
+            return {
+                **self.counters,
+                "memoryEntries": len(self.memory),
+                "memoryBytes": self.memoryUsed,
+                "diskEntries": len(self.disk),
+                "diskBytes": self.diskUsed,
+            }
+
+
+imageCache = ImageCache(
+    directory=IMAGE_CACHE_DIR,
+    memoryBytes=int(float(os.environ.get("IMAGE_CACHE_MEMORY_MB", 64)) * 1024 * 1024),
+    diskBytes=int(float(os.environ.get("IMAGE_CACHE_DISK_MB", 1024)) * 1024 * 1024),
+    ttl=float(os.environ.get("IMAGE_CACHE_TTL", 7 * 24 * 3600)),
+)
@@ -0,0 +1,271 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from PIL import Image, features
+from util.logger import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Streamlit serves the "static" folder next to bot-ui.py under app/static/
+# when server.enableStaticServing is on
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_STORE_DIR = os.path.join(APP_DIR, "static", "images")
+IMAGE_STORE_URL = "app/static/images"
+# About the width of the image column in a chat message
+IMAGE_THUMBNAIL_WIDTH = int(os.environ.get("IMAGE_THUMBNAIL_WIDTH", 512))
+IMAGE_THUMBNAIL_QUALITY = int(os.environ.get("IMAGE_THUMBNAIL_QUALITY", 80))
+# The store is bounded like the image cache's disk tier, by total bytes and by age
+IMAGE_STORE_DISK_BYTES = int(float(os.environ.get("IMAGE_CACHE_DISK_MB", 1024)) * 1024 * 1024)
+IMAGE_STORE_TTL = float(os.environ.get("IMAGE_CACHE_TTL", 7 * 24 * 3600))
+
+EXTENSIONS = {
+    b"\x89PNG": "png",
+    b"\xff\xd8\xff": "jpg",
+    b"GIF8": "gif",
+}
+
+
+def sniffExtension(data: bytes) -> str:
+    """Guesses an image file's extension from its first bytes, defaulting to png."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    for magic, extension in EXTENSIONS.items():
+        if data.startswith(magic):
+            return extension
+    return "png"
+
+
+class ImageStore:
+    """
+    Content-addressed image files that the browser fetches straight from Streamlit's static server.
+
+    Files are named after the sha256 of what they were made from, so a name
+    always refers to the same bytes, every file is written once, and the
+    browser can keep it cached across reruns and sessions. Each image gets its
+    full-size original and a thumbnail downscaled to the chat width, as WebP
+    (JPEG if Pillow was built without WebP). Like the image cache's disk tier,
+    the store is bounded by total bytes, dropping the least recently used files
+    first, and drops files older than the TTL. An original that is already in
+    the image cache is hard-linked from there rather than written again. All
+    methods are thread safe.
+
+    Attributes:
+        directory (str): Where the files are written.
+        urlPrefix (str): The URL path the directory is served under.
+        thumbnailWidth (int): Width thumbnails are downscaled to.
+        quality (int): Thumbnail encoder quality, 0-100.
+        diskBytes (int): Maximum total size of the stored files.
+        ttl (float): Seconds a file is kept, 0 to keep files forever.
+    """
+
+    def __init__(
+        self,
+        directory: str = IMAGE_STORE_DIR,
+        urlPrefix: str = IMAGE_STORE_URL,
+        thumbnailWidth: int = IMAGE_THUMBNAIL_WIDTH,
+        quality: int = IMAGE_THUMBNAIL_QUALITY,
+        diskBytes: int = IMAGE_STORE_DISK_BYTES,
+        ttl: float = IMAGE_STORE_TTL,
+    ):
+        self.directory = directory
+        self.urlPrefix = urlPrefix
+        self.thumbnailWidth = thumbnailWidth
+        self.quality = quality
+        self.diskBytes = diskBytes
+        self.ttl = ttl
+        self.thumbnailFormat = "webp" if features.check("webp") else "jpeg"
+        self.lock = threading.Lock()
+        # name -> (size, stored at), least recently used first
+        self.files: "OrderedDict[str, tuple]" = OrderedDict()
+        self.used = 0
+        self.counters = {
+            "written": 0,
+            "linked": 0,
+            "reused": 0,
+            "transcoded": 0,
+            "evictions": 0,
+            "bytesWritten": 0,
+        }
+        os.makedirs(directory, exist_ok=True)
+        self._loadIndex()
+
+    def _loadIndex(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for mtime, name, size in sorted(entries):
+            self.files[name] = (size, mtime)
+            self.used += size
+        with self.lock:
+            self._evict()
+
+    def _expired(self, storedAt: float) -> bool:
+        return self.ttl > 0 and time.time() - storedAt > self.ttl
+
+    def _drop(self, name: str) -> None:
+        size, _ = self.files.pop(name)
+        self.used -= size
+        self.counters["evictions"] += 1
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        """Drops expired files, then the least recently used ones until the store fits; call with the lock held."""
+        for name, (_, storedAt) in list(self.files.items()):
+            if self._expired(storedAt):
+                self._drop(name)
+        while self.used > self.diskBytes and self.files:
+            self._drop(next(iter(self.files)))
+
+    def path(self, name: str) -> str:
+        """Returns the file a stored name lives in."""
+        return os.path.join(self.directory, os.path.basename(name))
+
+    def url(self, name: str) -> str:
+        """Returns the URL the browser loads a stored name from."""
+        return f"{self.urlPrefix}/{name}"
+
+    def exists(self, name: str) -> bool:
+        """Whether a stored name is still there, counting as a use of it for eviction."""
+        name = os.path.basename(name)
+        with self.lock:
+            if name not in self.files:
+                return False
+            if self._expired(self.files[name][1]):
+                self._drop(name)
+                return False
+            self.files.move_to_end(name)
+        return os.path.exists(self.path(name))
+
+    def read(self, name: str) -> Optional[bytes]:
+        """
+        Reads a stored file.
+
+        Args:
+        - name: A name returned by put or renditions.
+
+        Returns:
+        - bytes: The file's bytes, or None if it is gone.
+        """
+        try:
+            with open(self.path(name), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            if name in self.files:
+                self.files.move_to_end(name)
+        return data
+
+    def write(self, name: str, data: bytes, source: Optional[str] = None) -> None:
+        """
+        Writes a file under its final name atomically, unless it is already there.
+
+        Args:
+        - name: The stored name.
+        - data: The file's bytes.
+        - source: A file that may hold the same bytes, hard-linked instead of writing a copy.
+        """
+        if self.exists(name):
+            with self.lock:
+                self.counters["reused"] += 1
+            return
+        path = self.path(name)
+        tmpPath = f"{path}.{threading.get_ident()}.tmp"
+        linked = source is not None and self.link(source, tmpPath, data)
+        if not linked:
+            with open(tmpPath, "wb") as f:
+                f.write(data)
+        os.replace(tmpPath, path)
+        with self.lock:
+            if name in self.files:
+                self.used -= self.files.pop(name)[0]
+            self.files[name] = (len(data), time.time())
+            self.used += len(data)
+            self.counters["linked" if linked else "written"] += 1
+            self.counters["bytesWritten"] += 0 if linked else len(data)
+            self._evict()
+
+    def link(self, source: str, target: str, data: bytes) -> bool:
+        """Hard-links source to target if it holds exactly data, e.g. an image cache file; True if it did."""
+        try:
+            os.link(source, target)
+        except OSError:
+            return False
+        # The source may have been replaced since data was read, so check what was linked
+        with open(target, "rb") as f:
+            if f.read() == data:
+                return True
+        os.remove(target)
+        return False
+
+    def put(self, data: bytes, source: Optional[str] = None) -> str:
+        """
+        Stores image bytes under their content address.
+
+        Args:
+        - data: The encoded image.
+        - source: A file that may hold the same bytes, hard-linked instead of writing a copy.
+
+        Returns:
+        - str: The stored name, <sha256>.<extension>.
+        """
+        name = f"{hashlib.sha256(data).hexdigest()}.{sniffExtension(data)}"
+        self.write(name, data, source)
+        return name
+
+    def renditions(self, data: bytes, source: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Stores an image's full-size original and its chat-width thumbnail.
+
+        The thumbnail is only transcoded the first time an image is seen.
+
+        Args:
+        - data: The encoded full-size image.
+        - source: A file that may hold the same bytes, to link the original from.
+
+        Returns:
+        - Tuple[str, str]: The stored names of the thumbnail and the original.
+        """
+        original = self.put(data, source)
+        extension = "webp" if self.thumbnailFormat == "webp" else "jpg"
+        thumbnail = f"{original.rsplit('.', 1)[0]}-w{self.thumbnailWidth}.{extension}"
+        if self.exists(thumbnail):
+            with self.lock:
+                self.counters["reused"] += 1
+            return thumbnail, original
+        try:
+            image = Image.open(io.BytesIO(data))
+            if image.width <= self.thumbnailWidth:
+                return original, original
+            height = round(image.height * self.thumbnailWidth / image.width)
+            image = image.convert("RGB").resize(
+                (self.thumbnailWidth, height), Image.Resampling.LANCZOS
+            )
+            out = io.BytesIO()
+            image.save(out, format=self.thumbnailFormat, quality=self.quality)
+        except Exception as e:
+            logger.warning(f"Could not make a thumbnail, using the original: {e}")
+            return original, original
+        self.write(thumbnail, out.getvalue())
+        with self.lock:
+            self.counters["transcoded"] += 1
+        logger.debug(f"Stored thumbnail {thumbnail[:12]} ({len(data)} -> {out.tell()} bytes)")
+        return thumbnail, original
+
+    def stats(self) -> Dict[str, int]:
+        """Returns how many files were written, linked, reused, transcoded and evicted, and the store's size."""
+        with self.lock:
+            return {**self.counters, "files": len(self.files), "bytes": self.used}
+
+
+imageStore = ImageStore()
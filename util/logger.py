@@ -1,26 +1,89 @@
+import atexit
 import logging
 import os
+import queue
+import random
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
+)
+from typing import Dict
 from dotenv import load_dotenv
 
 load_dotenv()
 
+
+class SamplingFilter(logging.Filter):
+    """
+    Drops a fraction of records tagged with a sample key.
+
+    Hot-path lines are logged with extra={"sample": "<key>"}; a record is kept
+    with the probability configured for its key. Untagged records always pass.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(getattr(record, "sample", None), 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+def parseSampleRates(spec: str) -> Dict[str, float]:
+    """Parses LOG_SAMPLE_RATES, e.g. "render=0.01,poll=0.1"."""
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            key, rate = item.split("=", 1)
+            rates[key.strip()] = float(rate)
+    return rates
+
+
+def makeFileHandler(path: str) -> logging.Handler:
+    """Builds a size based rotating handler, or a time based one if LOG_ROTATE_WHEN is set."""
+    backups = int(os.environ.get("LOG_BACKUP_COUNT", 5))
+    if os.environ.get("LOG_ROTATE_WHEN"):
+        return TimedRotatingFileHandler(
+            path, when=os.environ["LOG_ROTATE_WHEN"], backupCount=backups
+        )
+    return RotatingFileHandler(
+        path,
+        maxBytes=int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+        backupCount=backups,
+    )
+
+
 # Create a logger
 logger = logging.getLogger("streamlit-frontend")
 for handler in logger.handlers[:]:
     logger.removeHandler(handler)
     handler.close()
 if not logger.hasHandlers():
-    logger.setLevel(logging.DEBUG)
-    file_handler = logging.FileHandler(os.environ.get("LOGFILE"))
-    console_handler = logging.StreamHandler()
+    logger.setLevel(os.environ.get("LOG_LEVEL", "DEBUG").upper())
 
     # Define the log message format
     formatter = logging.Formatter(
         "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
-    file_handler.setFormatter(formatter)
-    console_handler.setFormatter(formatter)
+    handlers = [logging.StreamHandler()]
+    if os.environ.get("LOGFILE"):
+        handlers.append(makeFileHandler(os.environ["LOGFILE"]))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # The script thread only enqueues records; a listener thread does the I/O
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(
+        SamplingFilter(parseSampleRates(os.environ.get("LOG_SAMPLE_RATES", "")))
+    )
+    listener = QueueListener(
+        queue_handler.queue, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
 
     # Add the handlers to the logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    logger.addHandler(queue_handler)
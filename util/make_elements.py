@@ -2,16 +2,56 @@ import streamlit as st
 from nanoid import generate
 from util.pydantic_classes import (
     BotMessage,
+    BotMessageTypes,
     BotImageMessage,
     BotButtonMessage,
     BotTextMessage,
+    Choice,
+    Event,
 )
-from typing import Callable
+from util.generate_image import resolveImage
+from util.image_cache import imageCache
+from util.image_store import imageStore
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import inspect
+import os
+import time
+
+# Minimum seconds between re-renders of a streaming message
+STREAM_RENDER_INTERVAL = float(os.environ.get("STREAM_RENDER_INTERVAL", 0.1))
+
+def fillWidthArgs() -> Dict[str, Any]:
+    """
+    The st.image arguments that make an image fill its column on the installed Streamlit.
+
+    Newer versions take width="stretch" (their width defaults to "content"),
+    1.40 onwards use_container_width, and older ones only use_column_width.
+    """
+    params = inspect.signature(st.image).parameters
+    if isinstance(params["width"].default, str):
+        return {"width": "stretch"}
+    if "use_container_width" in params:
+        return {"use_container_width": True}
+    return {"use_column_width": True}
+
+
+IMAGE_FILL_WIDTH = fillWidthArgs()
+
+
+def staticServing() -> bool:
+    """Whether Streamlit serves the static folder, so images can be loaded from the image store by URL."""
+    return bool(st.get_option("server.enableStaticServing"))
+
 
 def makeImage(payload: BotImageMessage)-> st.delta_generator.DeltaGenerator:
     """
     Displays an image message in the chat interface.
 
+    Shows a placeholder while the image is still being generated in the background.
+    With static serving on, the thumbnail is loaded from the image store by URL and
+    links to the full-size image, so reruns send the browser a URL instead of the bytes.
+    A thumbnail the store has since dropped falls back to the image cache's bytes.
+
     Args:
     - payload: A BotImageMessage object containing the URL of the image to display.
 
@@ -19,24 +59,66 @@ def makeImage(payload: BotImageMessage)-> st.delta_generator.DeltaGenerator:
     - A Streamlit DeltaGenerator object representing the chat message.
     """
     with st.container() as c:
-        cols =st.cols([1,1]) #image should only take up half of total width
+        cols = st.columns([1,1]) #image should only take up half of total width
         with cols[0]:
-            st.image(urls=payload.url, use_column_width=True)
+            resolveImage(payload)
+            if payload.imageId:
+                st.caption("Generating image...")
+            elif payload.thumbnail and staticServing() and imageStore.exists(payload.thumbnail):
+                st.markdown(
+                    f"[![Generated image]({imageStore.url(payload.thumbnail)})]"
+                    f"({imageStore.url(payload.original or payload.thumbnail)})"
+                )
+            else:
+                data = imageStore.read(payload.thumbnail) if payload.thumbnail else None
+                if data is None and payload.cacheKey:
+                    data = imageCache.get(payload.cacheKey, record=False)
+                if data is not None:
+                    st.image(data, **IMAGE_FILL_WIDTH)
+                elif payload.url:
+                    st.image(payload.url, **IMAGE_FILL_WIDTH)
+                else:
+                    st.caption("Sorry, the image could not be generated.")
     return c
 
 
 
-def makeButtons(payload: BotButtonMessage, onClick:Callable) -> st.delta_generator.DeltaGenerator:
+def buttonsMarkdown(payload: BotButtonMessage) -> str:
+    """Renders a button group that can no longer be clicked as static markdown."""
+    choices = " ".join(f"`{choice.label}`" for choice in payload.choices)
+    return f"{payload.text}\n\n{choices}"
+
+
+def buttonInput(payload: BotButtonMessage, choice: Choice) -> Dict[str, str]:
+    """The user input a button click sends, naming the tool call it answers if the buttons came from one."""
+    userInput = {"type": "button", "text": choice.value}
+    if payload.toolCallId:
+        userInput["toolCallId"] = payload.toolCallId
+    return userInput
+
+
+def makeButtons(payload: BotButtonMessage, onClick:Callable, key: Optional[str] = None) -> st.delta_generator.DeltaGenerator:
     """
     Displays a set of interactive buttons as part of a bot message in the chat interface.
 
+    Buttons that can no longer be clicked are drawn as static text, which is
+    much cheaper for the frontend than a row of disabled widgets.
+
     Args:
     - payload: A BotButtonMessage object containing the text and the choices for the buttons.
+    - onClick: Callback invoked with the chosen value when a button is clicked.
+    - key: A stable prefix for the widget keys, e.g. "<event id>-<reply index>",
+      so the same buttons keep their identity across reruns.
 
     Returns:
     - A Streamlit DeltaGenerator object representing the chat message.
     """
+    if key is None:
+        key = generate(size=8)
     with st.container() as c:
+        if not payload.active:
+            st.markdown(buttonsMarkdown(payload))
+            return c
         st.markdown(payload.text)
         # The idea is to format the columns like [1,1,1, 7] with a 1 for each choice
         # This needs to be replaced by a more robust auto-layout
@@ -46,10 +128,10 @@ def makeButtons(payload: BotButtonMessage, onClick:Callable) -> st.delta_generat
             with cols[i]:
                 st.button(
                     label=payload.choices[i].label,
-                    key=generate(size=8),
+                    key=f"{key}-{i}",
                     disabled=not (payload.active),
                     on_click=onClick,
-                    args=[{"type": "button", "text": payload.choices[i].value}],
+                    args=[buttonInput(payload, payload.choices[i])],
                 )
     return c
 
@@ -81,3 +163,143 @@ def makeMarkdown(payload: BotTextMessage) -> st.delta_generator.DeltaGenerator:
     with st.container() as c:
         st.markdown(payload.text)
     return c
+
+
+def isFinalized(event: Event) -> bool:
+    """
+    Whether an event can no longer change on screen, i.e. it has no clickable buttons.
+
+    Args:
+    - event: A bot Event from the session history.
+
+    Returns:
+    - bool: True if the event can be drawn from a pre-rendered representation.
+    """
+    return not any(
+        reply.type == BotMessageTypes.button and reply.payload.active
+        for reply in event.botReply
+    )
+
+
+def prerenderEvent(event: Event) -> List[Tuple[str, Union[str, BotImageMessage]]]:
+    """
+    Flattens a finalized bot Event into as few render segments as possible.
+
+    Consecutive text and (inactive) button replies are merged into a single
+    markdown string; images stay separate because they are not markdown.
+
+    Args:
+    - event: A finalized bot Event.
+
+    Returns:
+    - A list of ("markdown", text) and ("image", payload) segments.
+    """
+    segments = []
+    parts = []
+    for reply in event.botReply:
+        if reply.type == BotMessageTypes.image:
+            if parts:
+                segments.append(("markdown", "\n\n".join(parts)))
+                parts = []
+            segments.append(("image", reply.payload))
+        elif reply.type == BotMessageTypes.button:
+            parts.append(buttonsMarkdown(reply.payload))
+        elif reply.type == BotMessageTypes.text:
+            if reply.payload.useMarkdown:
+                parts.append(reply.payload.text)
+            else:
+                parts.append(f"```\n{reply.payload.text}\n```")
+    if parts:
+        segments.append(("markdown", "\n\n".join(parts)))
+    return segments
+
+
+def makePrerendered(segments: List[Tuple[str, Union[str, BotImageMessage]]]) -> None:
+    """
+    Displays the segments produced by prerenderEvent.
+
+    Args:
+    - segments: The pre-rendered representation of a bot Event.
+    """
+    for kind, value in segments:
+        if kind == "image":
+            makeImage(value)
+        else:
+            st.markdown(value)
+
+
+class MarkdownStream:
+    """
+    Renders assistant text into a chat bubble while it is still being generated.
+
+    Deltas are buffered and the placeholder is only redrawn every
+    STREAM_RENDER_INTERVAL seconds, so long answers send a handful of frontend
+    updates instead of one per token.
+
+    Attributes:
+        text (str): All of the text received so far.
+    """
+
+    def __init__(self, minInterval: float = STREAM_RENDER_INTERVAL):
+        self.placeholder = st.empty()
+        self.minInterval = minInterval
+        self.text = ""
+        self.lastRender = 0.0
+
+    @property
+    def started(self) -> bool:
+        """Whether any text has been streamed into the placeholder."""
+        return bool(self.text)
+
+    def write(self, delta: str) -> None:
+        """
+        Appends a chunk of text, redrawing the placeholder if the throttle allows it.
+
+        Args:
+        - delta: The next piece of assistant text.
+        """
+        self.text += delta
+        now = time.monotonic()
+        if now - self.lastRender >= self.minInterval:
+            self.placeholder.markdown(self.text + "▌")
+            self.lastRender = now
+
+    def close(self, payload: BotTextMessage) -> st.delta_generator.DeltaGenerator:
+        """
+        Replaces the streamed text with the final message.
+
+        Args:
+        - payload: The finished BotTextMessage, as it will be stored in the session.
+
+        Returns:
+        - A Streamlit DeltaGenerator object representing the chat message.
+        """
+        with self.placeholder.container() as c:
+            if payload.useMarkdown:
+                st.markdown(payload.text)
+            else:
+                st.text(payload.text)
+        return c
+
+
+def makeDebugPanel(phaseStats: List[Dict[str, Any]], metrics: Dict[str, Dict[str, Any]]) -> st.delta_generator.DeltaGenerator:
+    """
+    Displays per-phase latency percentiles and process metrics in the sidebar.
+
+    Args:
+    - phaseStats: Rows of phase, count, p50 and p95, as returned by RingBufferExporter.stats().
+    - metrics: Named groups of counters to show below the latency table.
+
+    Returns:
+    - A Streamlit DeltaGenerator object representing the panel.
+    """
+    with st.sidebar.expander("Debug", expanded=True) as c:
+        st.caption("Turn latency by phase")
+        if phaseStats:
+            st.table(phaseStats)
+        else:
+            st.text("No spans recorded yet")
+        for name, values in metrics.items():
+            st.caption(name)
+            st.json(values)
+    return c
@@ -0,0 +1,89 @@
+import os
+import openai
+from typing import List, Optional
+from openai.types.beta.threads import Message
+from util.pydantic_classes import BotMessage, BotTextMessage
+from util.logger import logger
+from util.tracing import span
+
+MESSAGE_PAGE_SIZE = int(os.environ.get("MESSAGE_PAGE_SIZE", 100))
+
+
+class MessageSync:
+    """
+    Follows a thread's messages and fetches only the new ones.
+
+    The ID of the newest message seen so far is used as an `after` cursor, so
+    each sync downloads just the messages added since the previous one. The
+    messages themselves are handed to the caller and not kept, so a long
+    conversation doesn't grow the session.
+
+    Attributes:
+        threadId (str): The thread being followed.
+        lastSeenId (Optional[str]): ID of the newest message fetched so far.
+    """
+
+    def __init__(self, threadId: str, pageSize: int = MESSAGE_PAGE_SIZE):
+        self.threadId = threadId
+        self.pageSize = pageSize
+        self.lastSeenId: Optional[str] = None
+
+    def fetchNew(self, client: openai.Client) -> List[Message]:
+        """
+        Fetches the messages added to the thread since the last sync.
+
+        Args:
+        - client: The OpenAI client to use.
+
+        Returns:
+        - List[Message]: The new messages, oldest first.
+        """
+        new = []
+        with span("messages.list") as s:
+            while True:
+                params = {"thread_id": self.threadId, "order": "asc", "limit": self.pageSize}
+                if self.lastSeenId:
+                    params["after"] = self.lastSeenId
+                page = client.beta.threads.messages.list(**params)
+                new.extend(page.data)
+                if page.data:
+                    self.lastSeenId = page.data[-1].id
+                # Older clients don't expose has_more, so fall back to a short page
+                hasMore = getattr(page, "has_more", None)
+                if not page.data or hasMore is False or (
+                    hasMore is None and len(page.data) < self.pageSize
+                ):
+                    break
+            s.attributes["messages"] = len(new)
+        logger.debug(f"Fetched {len(new)} new messages")
+        return new
+
+
+def assistantReplies(messages: List[Message]) -> List[BotMessage]:
+    """
+    Turns the assistant's new thread messages into bot messages.
+
+    Every text part of every assistant message becomes its own reply; user
+    messages and non-text parts are skipped.
+
+    Args:
+    - messages: Thread messages, oldest first.
+
+    Returns:
+    - List[BotMessage]: The replies to show, in order.
+    """
+    replies = []
+    for message in messages:
+        if message.role != "assistant":
+            continue
+        for part in message.content:
+            if part.type == "text":
+                replies.append(
+                    BotMessage(
+                        type="text",
+                        payload=BotTextMessage(text=part.text.value, useMarkdown=True),
+                    )
+                )
+            else:
+                logger.debug(f"Skipping {part.type} content in message {message.id}")
+    return replies
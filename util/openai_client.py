@@ -0,0 +1,122 @@
+import os
+import threading
+import weakref
+import httpx
+import openai
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from util.logger import logger
+from util.scheduler import ScheduledTransport, scheduler
+
+load_dotenv()
+
+MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 100))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20))
+KEEPALIVE_EXPIRY = float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", 30))
+TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", 60))
+CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", 5))
+USE_HTTP2 = os.environ.get("OPENAI_HTTP2", "false").lower() == "true"
+
+
+class ConnectionStats:
+    """
+    Counts requests and how many of them reused an already open connection.
+
+    A response whose network stream has been seen before was sent over a
+    kept-alive connection. Streams are tracked weakly, so closed connections
+    are forgotten.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.streams = weakref.WeakSet()
+        self.requests = 0
+        self.opened = 0
+
+    def onResponse(self, response: httpx.Response) -> None:
+        stream = response.extensions.get("network_stream")
+        with self.lock:
+            self.requests += 1
+            if stream is None:
+                return
+            if stream not in self.streams:
+                self.opened += 1
+                self.streams.add(stream)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Returns request, connection and reuse counts."""
+        with self.lock:
+            reused = self.requests - self.opened
+            return {
+                "requests": self.requests,
+                "connectionsOpened": self.opened,
+                "connectionsReused": reused,
+                "reuseRate": reused / self.requests if self.requests else 0.0,
+            }
+
+
+connectionStats = ConnectionStats()
+_client: Optional[openai.Client] = None
+_httpClient: Optional[httpx.Client] = None
+_lock = threading.Lock()
+
+
+def makeHttpClient() -> httpx.Client:
+    """
+    Builds the pooled HTTP client shared by all OpenAI calls and image downloads.
+
+    API requests go through the process-wide rate-limit scheduler.
+
+    Returns:
+    - httpx.Client: A client with the configured pool limits, keep-alive and timeouts.
+    """
+    http2 = USE_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("OPENAI_HTTP2 is set but the h2 package is not installed")
+            http2 = False
+    transport = httpx.HTTPTransport(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+    )
+    return httpx.Client(
+        transport=ScheduledTransport(transport, scheduler),
+        timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+        follow_redirects=True,
+        event_hooks={"response": [connectionStats.onResponse]},
+    )
+
+
+def getClient() -> openai.Client:
+    """
+    Returns the process-wide OpenAI client, creating it on first use.
+
+    Streamlit re-executes the app script on every rerun, but modules under util
+    are only imported once, so every session shares this client and its connection pool.
+
+    Returns:
+    - openai.Client: The shared client.
+    """
+    global _client, _httpClient
+    if _client is None:
+        with _lock:
+            if _client is None:
+                logger.debug("Creating shared OpenAI client")
+                _httpClient = makeHttpClient()
+                _client = openai.Client(
+                    api_key=os.environ.get("OPENAI_API_KEY"),
+                    http_client=_httpClient,
+                )
+    return _client
+
+
+def getHttpClient() -> httpx.Client:
+    """Returns the pooled HTTP client behind the shared OpenAI client."""
+    getClient()
+    return _httpClient
@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+import openai
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional
+from util.pydantic_classes import BotMessage
+from util.message_sync import MessageSync
+from util.run_engine import createRun, waitForRun
+from util.scheduler import currentSession
+from util.tool_dispatch import resolveToolCalls
+from util.assistant_registry import assistantRegistry
+from util.logger import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Warmed openers kept ready per assistant; 0 turns the pool off
+OPENER_POOL_SIZE = int(os.environ.get("OPENER_POOL_SIZE", 0))
+# Runs waiting on tool outputs expire after 10 minutes, so openers are dropped before that
+OPENER_MAX_AGE = float(os.environ.get("OPENER_MAX_AGE", 480))
+OPENER_POOL_WORKERS = int(os.environ.get("OPENER_POOL_WORKERS", 4))
+OPENER_MESSAGE = os.environ.get("OPENER_MESSAGE", "Hello")
+
+
+class Opener:
+    """
+    A thread whose greeting run has already been driven to its first reply.
+
+    Nothing in it belongs to a user, so any new session can take it over.
+
+    Attributes:
+        threadId (str): The greeting's thread.
+        runId (str): The greeting's latest run.
+        status (str): The run's status: completed, requires_action or failed.
+        lastError (Any): The run's last_error if it failed.
+        botReply (List[BotMessage]): The greeting to show.
+        messageSync (MessageSync): The thread's message cursor, past the greeting.
+        pendingToolOutputs (List[Dict[str, str]]): Outputs held until the user answers.
+        createdAt (float): When the opener was ready, in time.monotonic() seconds.
+    """
+
+    __slots__ = (
+        "threadId",
+        "runId",
+        "status",
+        "lastError",
+        "botReply",
+        "messageSync",
+        "pendingToolOutputs",
+        "createdAt",
+    )
+
+    def __init__(
+        self,
+        threadId: str,
+        runId: str,
+        status: str,
+        lastError: Any,
+        botReply: List[BotMessage],
+        messageSync: MessageSync,
+        pendingToolOutputs: List[Dict[str, str]],
+    ):
+        self.threadId = threadId
+        self.runId = runId
+        self.status = status
+        self.lastError = lastError
+        self.botReply = botReply
+        self.messageSync = messageSync
+        self.pendingToolOutputs = pendingToolOutputs
+        self.createdAt = time.monotonic()
+
+
+def prepareOpener(
+    client: openai.Client,
+    assistantId: str,
+    threadId: Optional[str] = None,
+    runId: Optional[str] = None,
+) -> Opener:
+    """
+    Creates a greeting thread and run and drives the run until its first reply is ready.
+
+    An existing thread or run is reused instead of creating a new one.
+
+    Args:
+    - client: The OpenAI client to use.
+    - assistantId: The ID of the OpenAI assistant.
+    - threadId: A thread to reuse, if there already is one.
+    - runId: A run to reuse, if there already is one.
+
+    Returns:
+    - Opener: The thread, run and greeting.
+    """
+    if threadId is None:
+        thread = client.beta.threads.create(
+            messages=[{"role": "user", "content": OPENER_MESSAGE}]
+        )
+        threadId = thread.id
+    if runId is None:
+        run = createRun(client, threadId, assistantId)
+    else:
+        run = waitForRun(client, threadId, runId)
+    messageSync = MessageSync(threadId)
+    run, botReply, pendingToolOutputs = resolveToolCalls(
+        client, threadId, run, assistantRegistry.get(assistantId).tools, messageSync
+    )
+    return Opener(
+        threadId=threadId,
+        runId=run.id,
+        status=run.status,
+        lastError=run.last_error,
+        botReply=botReply,
+        messageSync=messageSync,
+        pendingToolOutputs=pendingToolOutputs,
+    )
+
+
+class OpenerPool:
+    """
+    Keeps a few greetings ready for each assistant so new sessions don't wait on a run.
+
+    Every session would otherwise send the same "Hello" to the same assistant
+    and wait for the whole run. take() hands out a ready opener at once and
+    warms a replacement in the background. An empty pool just misses, and the
+    caller prepares its own opener as before.
+
+    Attributes:
+        size (int): Openers to keep ready per assistant, 0 for none.
+        maxAge (float): Seconds after which a ready opener is thrown away.
+    """
+
+    def __init__(
+        self,
+        prepare: Callable[[str], Opener],
+        size: int = OPENER_POOL_SIZE,
+        maxAge: float = OPENER_MAX_AGE,
+    ):
+        self.prepare = prepare
+        self.size = size
+        self.maxAge = maxAge
+        self.lock = threading.Lock()
+        self.ready: Dict[str, Deque[Opener]] = {}
+        self.warming: Dict[str, int] = {}
+        self.executor = ThreadPoolExecutor(
+            max_workers=OPENER_POOL_WORKERS, thread_name_prefix="opener"
+        )
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.failed = 0
+
+    def take(self, assistantId: str) -> Optional[Opener]:
+        """
+        Hands out a ready opener and starts warming its replacement.
+
+        Args:
+        - assistantId: The assistant the session talks to.
+
+        Returns:
+        - Opener: A ready opener, or None if there is none yet.
+        """
+        if not self.size:
+            return None
+        opener = None
+        with self.lock:
+            ready = self.ready.setdefault(assistantId, deque())
+            while ready:
+                candidate = ready.popleft()
+                if time.monotonic() - candidate.createdAt < self.maxAge:
+                    opener = candidate
+                    break
+                self.expired += 1
+            if opener is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self.refill(assistantId)
+        return opener
+
+    def refill(self, assistantId: str) -> None:
+        """Starts warming openers until ready plus warming ones make up the pool size."""
+        with self.lock:
+            missing = (
+                self.size
+                - len(self.ready.get(assistantId, ()))
+                - self.warming.get(assistantId, 0)
+            )
+            if missing <= 0:
+                return
+            self.warming[assistantId] = self.warming.get(assistantId, 0) + missing
+        for _ in range(missing):
+            self.executor.submit(self.warm, assistantId)
+
+    def warm(self, assistantId: str) -> None:
+        # Queued under its own name in the rate-limit scheduler, so refills can't crowd out live sessions
+        currentSession.set("openerPool")
+        try:
+            opener = self.prepare(assistantId)
+        except Exception as e:
+            logger.warning(f"Could not warm an opener for {assistantId}: {e}")
+            opener = None
+        with self.lock:
+            self.warming[assistantId] -= 1
+            if opener is None or opener.status == "failed":
+                self.failed += 1
+            else:
+                self.ready.setdefault(assistantId, deque()).append(opener)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns how many openers are ready and warming, and hit, miss and expiry counts."""
+        with self.lock:
+            return {
+                "size": self.size,
+                "ready": sum(len(ready) for ready in self.ready.values()),
+                "warming": sum(self.warming.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "failed": self.failed,
+            }
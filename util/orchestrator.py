@@ -0,0 +1,167 @@
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+from util.pydantic_classes import Event
+from util.logger import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ORCHESTRATOR_WORKERS = int(os.environ.get("ORCHESTRATOR_WORKERS", 32))
+# How often a session checks on its turn while it runs in the background
+ORCHESTRATION_POLL_INTERVAL = float(os.environ.get("ORCHESTRATION_POLL_INTERVAL", 0.25))
+# Finished turns kept so a reloaded session collects its answer instead of asking again
+ORCHESTRATOR_RECENT_TURNS = int(os.environ.get("ORCHESTRATOR_RECENT_TURNS", 1024))
+
+
+class TurnJob:
+    """
+    One conversation turn being answered in the background.
+
+    The worker fills in the streamed text and the result, and the session
+    reads them on its next poll, so the two never share a Streamlit script run.
+
+    Attributes:
+        conversationId (str): The conversation the turn belongs to.
+        state (Dict[str, Any]): Session values the turn reads and updates, copied back when it is done.
+        status (str): queued, running, done or failed.
+        text (str): Assistant text streamed so far.
+        event (Optional[Event]): The bot's reply, once done.
+        error (Optional[Exception]): What went wrong, if it failed.
+    """
+
+    def __init__(self, conversationId: str, state: Dict[str, Any]):
+        self.conversationId = conversationId
+        self.state = state
+        self.status = "queued"
+        self.text = ""
+        self.event: Optional[Event] = None
+        self.error: Optional[Exception] = None
+        self.submittedAt = time.monotonic()
+        self.startedAt = 0.0
+        self.finishedAt = 0.0
+
+    @property
+    def done(self) -> bool:
+        """Whether the turn has finished, successfully or not."""
+        return self.status in ("done", "failed")
+
+    def onTextDelta(self, delta: str) -> None:
+        """Appends streamed assistant text, for the session to show on its next poll."""
+        self.text += delta
+
+
+class Orchestrator:
+    """
+    Answers conversation turns on a shared worker pool instead of in Streamlit script threads.
+
+    Turns of one conversation run one at a time in the order they were
+    submitted, since each continues the run the previous one left. Turns of
+    different conversations run concurrently, up to the pool size.
+
+    A turn submitted again under the same key, e.g. by a session restored
+    while its turn was still in flight, gets the job already answering it.
+    """
+
+    def __init__(self, workers: int, recentTurns: int = ORCHESTRATOR_RECENT_TURNS):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="orchestrator"
+        )
+        self.lock = threading.Lock()
+        self.queues: Dict[str, Deque[Tuple[TurnJob, Callable, contextvars.Context]]] = {}
+        self.jobs: "OrderedDict[str, TurnJob]" = OrderedDict()
+        self.recentTurns = recentTurns
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self.maxRunning = 0
+        self.queueSeconds = 0.0
+
+    def submit(
+        self,
+        conversationId: str,
+        work: Callable[[TurnJob], Event],
+        state: Optional[Dict[str, Any]] = None,
+        key: Optional[str] = None,
+    ) -> TurnJob:
+        """
+        Queues a turn behind any turn its conversation is already running.
+
+        Args:
+        - conversationId: The conversation the turn belongs to.
+        - work: Produces the bot's reply; it gets the job to stream text and update state through.
+        - state: Session values for the turn to read and update.
+        - key: Identifies the turn, usually the user event's id; a known key returns its existing job.
+
+        Returns:
+        - TurnJob: The job to poll for the result.
+        """
+        job = TurnJob(conversationId, state if state is not None else {})
+        # Runs under the submitter's context, e.g. its rate-limit session
+        context = contextvars.copy_context()
+        with self.lock:
+            if key is not None:
+                if key in self.jobs:
+                    logger.debug(f"Turn {key} was already submitted, returning its job")
+                    return self.jobs[key]
+                self.jobs[key] = job
+                while len(self.jobs) > self.recentTurns and self.jobs[next(iter(self.jobs))].done:
+                    self.jobs.popitem(last=False)
+            queue = self.queues.setdefault(conversationId, deque())
+            queue.append((job, work, context))
+            self.submitted += 1
+            first = len(queue) == 1
+        if first:
+            self.executor.submit(self.runNext, conversationId)
+        return job
+
+    def runNext(self, conversationId: str) -> None:
+        with self.lock:
+            job, work, context = self.queues[conversationId][0]
+            job.status = "running"
+            job.startedAt = time.monotonic()
+            self.queueSeconds += job.startedAt - job.submittedAt
+            self.running += 1
+            self.maxRunning = max(self.maxRunning, self.running)
+        try:
+            job.event = context.run(work, job)
+            job.status = "done"
+        except Exception as e:
+            logger.exception(f"Turn for conversation {conversationId} failed: {e}")
+            job.error = e
+            job.status = "failed"
+        job.finishedAt = time.monotonic()
+        with self.lock:
+            self.running -= 1
+            if job.status == "done":
+                self.completed += 1
+            else:
+                self.failed += 1
+            queue = self.queues[conversationId]
+            queue.popleft()
+            if not queue:
+                del self.queues[conversationId]
+        if queue:
+            self.executor.submit(self.runNext, conversationId)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns turn counts, how many run at once and how long they queue."""
+        with self.lock:
+            started = self.completed + self.failed + self.running
+            return {
+                "submitted": self.submitted,
+                "running": self.running,
+                "maxRunning": self.maxRunning,
+                "queued": sum(len(q) for q in self.queues.values()) - self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avgQueueMs": round(self.queueSeconds / started * 1000, 1) if started else 0.0,
+            }
+
+
+orchestrator = Orchestrator(ORCHESTRATOR_WORKERS)
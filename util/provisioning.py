@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import openai
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
+from util.logger import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROVISION_WORKERS = int(os.environ.get("PROVISION_WORKERS", 8))
+# Metadata keys the provisioner owns on every assistant it manages
+MANIFEST_KEY = "manifest_key"
+CONFIG_HASH = "config_hash"
+DEFAULT_MODEL = "gpt-4-1106-preview"
+
+
+class AssistantSpec(BaseModel):
+    """
+    The desired configuration of one assistant in a manifest.
+
+    Attributes:
+        key (str): Identifies the assistant across deploys; stored in its metadata.
+        name (str): The assistant's name.
+        description (str): The assistant's description.
+        instructions (str): The system instructions.
+        model (str): The model the assistant runs on.
+        tools (List[Dict[str, Any]]): Tool definitions, as sent to the API.
+        metadata (Dict[str, str]): Extra metadata to set on the assistant.
+        assistantId (Optional[str]): An existing assistant to adopt, e.g. one created before it was managed.
+    """
+
+    key: str
+    name: str = "My Bot"
+    description: str = ""
+    instructions: str = ""
+    model: str = DEFAULT_MODEL
+    tools: List[Dict[str, Any]] = Field(default_factory=list)
+    metadata: Dict[str, str] = Field(default_factory=dict)
+    assistantId: Optional[str] = None
+
+    def configHash(self) -> str:
+        """
+        Hashes everything the API stores for the assistant, so any change shows up as a new hash.
+
+        Returns:
+        - str: A hex sha256 digest.
+        """
+        config = self.model_dump(exclude={"key", "assistantId"})
+        raw = json.dumps(config, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def apiParams(self) -> Dict[str, Any]:
+        """Returns the create/update parameters, with the provisioner's metadata added."""
+        return {
+            "name": self.name,
+            "description": self.description,
+            "instructions": self.instructions,
+            "model": self.model,
+            "tools": self.tools,
+            "metadata": {
+                **self.metadata,
+                MANIFEST_KEY: self.key,
+                CONFIG_HASH: self.configHash(),
+            },
+        }
+
+
+def loadTools(path: str) -> List[Dict[str, Any]]:
+    """
+    Reads tool definitions in the format of oai_tools.json.
+
+    Bare function definitions are wrapped as function tools; entries that
+    already have a "type" are kept as they are.
+
+    Args:
+    - path: The JSON file to read.
+
+    Returns:
+    - List[Dict[str, Any]]: The tools, as sent to the API.
+    """
+    with open(path, "r") as file:
+        data = json.load(file)
+    return [t if "type" in t else {"type": "function", "function": t} for t in data]
+
+
+def loadManifest(path: str) -> List[AssistantSpec]:
+    """
+    Reads a manifest of assistants.
+
+    The manifest is a JSON object with an "assistants" list and optional
+    "defaults" that every entry starts from. Entries may give
+    "instructionsFile" and "toolsFile" instead of "instructions" and "tools";
+    those paths are relative to the manifest.
+
+    Args:
+    - path: The manifest file.
+
+    Returns:
+    - List[AssistantSpec]: One spec per assistant.
+
+    Raises:
+    - ValueError: If two entries share a key.
+    """
+    with open(path, "r") as file:
+        manifest = json.load(file)
+    root = os.path.dirname(os.path.abspath(path))
+    specs = []
+    for entry in manifest["assistants"]:
+        entry = {**manifest.get("defaults", {}), **entry}
+        if "instructionsFile" in entry:
+            with open(os.path.join(root, entry.pop("instructionsFile")), "r") as file:
+                entry.setdefault("instructions", file.read())
+        if "toolsFile" in entry:
+            entry.setdefault("tools", loadTools(os.path.join(root, entry.pop("toolsFile"))))
+        specs.append(AssistantSpec(**entry))
+    keys = [spec.key for spec in specs]
+    duplicates = sorted({key for key in keys if keys.count(key) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate assistant keys in {path}: {', '.join(duplicates)}")
+    return specs
+
+
+class ProvisionResult:
+    """
+    What provisioning did, or would do, for one assistant.
+
+    Attributes:
+        key (str): The manifest key.
+        action (str): create, update, unchanged or failed.
+        assistantId (Optional[str]): The assistant's ID, None if it is yet to be created or creating it failed.
+        error (Optional[str]): What went wrong, if it failed.
+    """
+
+    __slots__ = ("key", "action", "assistantId", "error")
+
+    def __init__(self, key: str, action: str, assistantId: Optional[str] = None, error: Optional[str] = None):
+        self.key = key
+        self.action = action
+        self.assistantId = assistantId
+        self.error = error
+
+
+def listManaged(client: openai.Client) -> Dict[str, Any]:
+    """
+    Lists the account's assistants, paging through all of them.
+
+    Args:
+    - client: The OpenAI client to use.
+
+    Returns:
+    - Dict[str, Assistant]: Assistants by ID.
+    """
+    return {a.id: a for a in client.beta.assistants.list(limit=100, order="asc")}
+
+
+def planProvisioning(specs: List[AssistantSpec], existing: Dict[str, Any]) -> List[ProvisionResult]:
+    """
+    Decides which assistants need creating or updating.
+
+    Specs are matched to existing assistants by the manifest key in their
+    metadata, or by assistantId for assistants that aren't managed yet. An
+    assistant is only updated if its stored config hash differs from the spec's.
+
+    Args:
+    - specs: The desired assistants.
+    - existing: The account's assistants by ID, from listManaged.
+
+    Returns:
+    - List[ProvisionResult]: One planned action per spec, in the same order.
+    """
+    byKey = {}
+    for assistant in existing.values():
+        key = (assistant.metadata or {}).get(MANIFEST_KEY)
+        if key is None:
+            continue
+        if key in byKey:
+            logger.warning(f"Several assistants have manifest key {key}; using {byKey[key].id}")
+            continue
+        byKey[key] = assistant
+    plan = []
+    for spec in specs:
+        assistant = byKey.get(spec.key) or existing.get(spec.assistantId)
+        if assistant is None:
+            plan.append(ProvisionResult(spec.key, "create"))
+        elif (assistant.metadata or {}).get(CONFIG_HASH) == spec.configHash():
+            plan.append(ProvisionResult(spec.key, "unchanged", assistant.id))
+        else:
+            plan.append(ProvisionResult(spec.key, "update", assistant.id))
+    return plan
+
+
+def applyAction(client: openai.Client, spec: AssistantSpec, planned: ProvisionResult) -> ProvisionResult:
+    """Carries out one planned action, turning API errors into a failed result."""
+    try:
+        if planned.action == "create":
+            assistant = client.beta.assistants.create(**spec.apiParams())
+        elif planned.action == "update":
+            assistant = client.beta.assistants.update(planned.assistantId, **spec.apiParams())
+        else:
+            return planned
+    except openai.OpenAIError as e:
+        logger.error(f"Could not {planned.action} assistant {spec.key}: {e}")
+        return ProvisionResult(spec.key, "failed", planned.assistantId, str(e))
+    logger.info(f"{planned.action.capitalize()}d assistant {spec.key}: {assistant.id}")
+    return ProvisionResult(spec.key, planned.action, assistant.id)
+
+
+def provision(
+    client: openai.Client,
+    specs: List[AssistantSpec],
+    workers: int = PROVISION_WORKERS,
+    dryRun: bool = False,
+) -> List[ProvisionResult]:
+    """
+    Brings the account's assistants in line with a manifest.
+
+    Existing assistants are listed once, and only new or changed ones are
+    written, several at a time, so deploying an unchanged manifest makes no
+    writes at all. Assistants that aren't in the manifest are left alone.
+
+    Args:
+    - client: The OpenAI client to use.
+    - specs: The desired assistants.
+    - workers: How many creates and updates to run at once.
+    - dryRun: Only plan, without writing anything.
+
+    Returns:
+    - List[ProvisionResult]: What happened to each spec, in the same order.
+    """
+    plan = planProvisioning(specs, listManaged(client))
+    if dryRun:
+        return plan
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="provision") as executor:
+        return list(executor.map(lambda args: applyAction(client, *args), zip(specs, plan)))
@@ -1,11 +1,59 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationInfo, ValidatorFunctionWrapHandler, field_validator
 from enum import Enum
 from datetime import datetime, timezone
 from nanoid import generate
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Optional, Union
 
 
-class Choice(BaseModel):
+class TrustedModel(BaseModel):
+    """
+    A BaseModel that can also be built without validation, from values the app made itself.
+    """
+
+    @classmethod
+    def trusted(cls, **values: Any):
+        """
+        Builds an instance without validating it, like model_construct but cheaper.
+
+        Only use it for values that already have the field types (enums, not
+        strings; models, not dicts), e.g. ones the app built or decoded itself.
+        User input and API data should go through the normal constructor.
+
+        Args:
+        - values: Field values; missing fields get their defaults.
+
+        Returns:
+        - The new instance.
+        """
+        names = trustedFields.get(cls)
+        if names is None:
+            names = trustedFields[cls] = tuple(cls.model_fields)
+        # Fields are dumped in __dict__ order, so it has to follow the field order
+        if tuple(values) == names:
+            fields = values
+        else:
+            modelFields = cls.model_fields
+            fields = {
+                name: values[name]
+                if name in values
+                else modelFields[name].get_default(call_default_factory=True)
+                for name in names
+            }
+        instance = newInstance(cls)
+        setField(instance, "__dict__", fields)
+        setField(instance, "__pydantic_fields_set__", set(values))
+        setField(instance, "__pydantic_extra__", None)
+        setField(instance, "__pydantic_private__", None)
+        return instance
+
+
+newInstance = object.__new__
+setField = object.__setattr__
+# Each model's field names in order, looked up once rather than on every trusted() call
+trustedFields: Dict[type, tuple] = {}
+
+
+class Choice(TrustedModel):
     """
     Represents a single choice item with a label for display and an actual value.
 
@@ -18,13 +66,14 @@ class Choice(BaseModel):
     value: str = Field("", description="Actual value of the choice")
 
 
-class BotButtonMessage(BaseModel):
+class BotButtonMessage(TrustedModel):
     """
     Represents a message that contains buttons for the user to choose from.
 
     Attributes:
         text (str): Text to display above the buttons.
         choices (List[Choice]): List of choices for agent reply.
+        toolCallId (str): ID of the tool call a click answers, if the buttons came from one.
     """
 
     text: str = Field("", description="Text to show to the user above the buttons")
@@ -32,9 +81,10 @@ class BotButtonMessage(BaseModel):
     active: bool = Field(
         True, description="Whether or not the button should be clickable"
     )
+    toolCallId: str = Field("", description="ID of the tool call a click answers")
 
 
-class BotDropdownMessage(BaseModel):
+class BotDropdownMessage(TrustedModel):
     """
     Represents a message that contains a dropdown menu for the user.
 
@@ -50,7 +100,7 @@ class BotDropdownMessage(BaseModel):
     )
 
 
-class BotHTMLMessage(BaseModel):
+class BotHTMLMessage(TrustedModel):
     """
     Represents a message that contains HTML content.
 
@@ -61,18 +111,28 @@ class BotHTMLMessage(BaseModel):
     html: str = Field("", description="A string of HTML to be rendered for the user")
 
 
-class BotImageMessage(BaseModel):
+class BotImageMessage(TrustedModel):
     """
     Represents a message that contains an image.
 
     Attributes:
         url (str): The hosted URL of the image.
+        imageId (str): ID of the background job generating the image, empty once it is done.
+        cacheKey (str): Key of the image bytes in the local image cache, if they were cached.
+        thumbnail (str): Name of the chat-width thumbnail in the local image store.
+        original (str): Name of the full-size image in the local image store.
     """
 
     url: str = Field("", description="The image's hosted URL")
+    cacheKey: str = Field("", description="Key of the image in the local image cache")
+    imageId: str = Field(
+        "", description="ID of the background job while the image is being generated"
+    )
+    thumbnail: str = Field("", description="Name of the thumbnail in the local image store")
+    original: str = Field("", description="Name of the full-size image in the local image store")
 
 
-class BotTextMessage(BaseModel):
+class BotTextMessage(TrustedModel):
     """
     Represents a basic text message.
 
@@ -108,12 +168,23 @@ BotPayload = Union[
     BotButtonMessage,
     BotDropdownMessage,
 ]
+# The payload class for each message type
+BOT_PAYLOAD_TYPES = {
+    BotMessageTypes.text: BotTextMessage,
+    BotMessageTypes.image: BotImageMessage,
+    BotMessageTypes.html: BotHTMLMessage,
+    BotMessageTypes.button: BotButtonMessage,
+    BotMessageTypes.dropdown: BotDropdownMessage,
+}
 
 
-class BotMessage(BaseModel):
+class BotMessage(TrustedModel):
     """
     Represents the main structure of a bot message.
 
+    The payload is validated as the class its type names, rather than by
+    trying every BotPayload member in turn.
+
     Attributes:
         type (BotMessageTypes): Type of the message being sent.
         payload (BotPayload): Actual message content/data.
@@ -124,6 +195,36 @@ class BotMessage(BaseModel):
     )
     payload: BotPayload = Field("Hello World", description="The message being send")
 
+    @field_validator("payload", mode="wrap")
+    @classmethod
+    def validatePayloadByType(
+        cls, value: Any, handler: ValidatorFunctionWrapHandler, info: ValidationInfo
+    ) -> BotPayload:
+        payloadType = BOT_PAYLOAD_TYPES.get(info.data.get("type"))
+        if payloadType is None:
+            # The type itself was invalid, so fall back to the plain union
+            return handler(value)
+        if type(value) is payloadType:
+            return value
+        return payloadType.model_validate(value)
+
+
+class ToolResult(TrustedModel):
+    """
+    The result of handling one tool call from a run.
+
+    Attributes:
+        toolCallId (str): ID of the tool call this answers.
+        messages (List[BotMessage]): Messages to show the user.
+        output (Optional[str]): Output to submit to the run, or None if the call waits for the user's reply.
+    """
+
+    toolCallId: str = Field("", description="ID of the tool call this answers")
+    messages: List[BotMessage] = Field([], description="Messages to show the user")
+    output: Optional[str] = Field(
+        None, description="Output to submit, None while waiting for the user's reply"
+    )
+
 
 class Directions(Enum):
     """
@@ -134,7 +235,7 @@ class Directions(Enum):
     outgoing = "outgoing"
 
 
-class Event(BaseModel):
+class Event(TrustedModel):
     """
     The base object that gets passed around all the services, capturing event details and context.
 
@@ -185,6 +286,26 @@ class Event(BaseModel):
     )
     botReply: List[BotMessage] = Field([], description="Agent's replies to the user")
 
+    def replyWith(self, botReply: List[BotMessage]) -> "Event":
+        """
+        Builds the outgoing event answering this one, with the same IDs and payload.
+
+        Args:
+        - botReply: The bot's replies, already built as BotMessages.
+
+        Returns:
+        - Event: The reply event, built without re-validating this event's fields.
+        """
+        return Event.trusted(
+            userId=self.userId,
+            conversationId=self.conversationId,
+            id=self.id,
+            sentOn=self.sentOn,
+            direction=Directions.outgoing,
+            payload=dict(self.payload),
+            botReply=botReply,
+        )
+
     class Config:
         """Configuration for JSON serialization."""
 
@@ -0,0 +1,238 @@
+import os
+import time
+import openai
+from typing import Callable, Iterable, Optional
+from openai.types.beta.threads import Run
+from util.logger import logger
+from util.run_tracker import checkpoint
+from util.scheduler import MAX_RETRIES, backoffDelay, scheduler
+from util.tracing import span
+
+# Statuses where the run is still being worked on by the API
+ACTIVE_STATUSES = ("queued", "in_progress", "cancelling")
+# Statuses where the run is over and the thread takes new messages
+ENDED_STATUSES = ("completed", "cancelled", "expired", "incomplete", "failed")
+
+# Streamed events that carry a new snapshot of the run object
+RUN_EVENTS = (
+    "thread.run.created",
+    "thread.run.queued",
+    "thread.run.in_progress",
+    "thread.run.requires_action",
+    "thread.run.completed",
+    "thread.run.incomplete",
+    "thread.run.failed",
+    "thread.run.cancelling",
+    "thread.run.cancelled",
+    "thread.run.expired",
+)
+
+# Streaming needs openai>=1.14; older clients always poll
+USE_STREAMING = os.environ.get("OPENAI_RUN_STREAMING", "true").lower() != "false"
+POLL_INITIAL_DELAY = float(os.environ.get("OPENAI_POLL_INITIAL_DELAY", 0.1))
+POLL_MAX_DELAY = float(os.environ.get("OPENAI_POLL_MAX_DELAY", 1.0))
+POLL_BACKOFF = 1.5
+
+
+def waitForRun(client: openai.Client, threadId: str, runId: str) -> Run:
+    """
+    Polls a run until it leaves the queued/in_progress states.
+
+    The delay between polls starts small and grows geometrically up to
+    POLL_MAX_DELAY, so short runs return quickly without hammering the API on long ones.
+
+    Args:
+    - client: The OpenAI client to use.
+    - threadId: ID of the thread the run belongs to.
+    - runId: ID of the run to wait for.
+
+    Returns:
+    - Run: The run object once it needs action or has finished.
+    """
+    with span("run.poll") as s:
+        run = client.beta.threads.runs.retrieve(run_id=runId, thread_id=threadId)
+        delay = POLL_INITIAL_DELAY
+        polls = 1
+        while run.status in ACTIVE_STATUSES:
+            logger.debug(
+                f"Run is {run.status}, polling again in {delay:.2f}s",
+                extra={"sample": "poll"},
+            )
+            # A superseded turn stops polling here instead of waiting the run out
+            checkpoint()
+            time.sleep(delay)
+            delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+            run = client.beta.threads.runs.retrieve(run_id=runId, thread_id=threadId)
+            polls += 1
+        s.attributes["polls"] = polls
+    logger.debug(f"Current run status is {run.status}")
+    return run
+
+
+def isRateLimited(run: Optional[Run]) -> bool:
+    """Whether a run failed because the account hit its rate limit."""
+    return (
+        run is not None
+        and run.status == "failed"
+        and run.last_error is not None
+        and run.last_error.code == "rate_limit_exceeded"
+    )
+
+
+def retryRateLimited(
+    client: openai.Client,
+    threadId: str,
+    run: Run,
+    onTextDelta: Optional[Callable[[str], None]] = None,
+) -> Run:
+    """
+    Starts a fresh run for a run that failed with rate_limit_exceeded.
+
+    A failed run can't be resumed, but the thread keeps its messages and tool
+    outputs, so a new run picks up where it stopped. Each attempt pauses the
+    scheduler for a jittered backoff first, so other sessions back off too.
+
+    Args:
+    - client: The OpenAI client to use.
+    - threadId: ID of the thread the run belongs to.
+    - run: The finished run.
+    - onTextDelta: Optional callback that receives assistant text as it streams in.
+
+    Returns:
+    - Run: The latest run, which may still have failed once the retries run out.
+    """
+    attempt = 0
+    while isRateLimited(run) and attempt < MAX_RETRIES:
+        delay = backoffDelay(attempt)
+        logger.warning(f"Run {run.id} was rate limited, retrying in {delay:.2f}s")
+        scheduler.pause(delay)
+        with span("run.retry", attempt=attempt):
+            run = _createRun(client, threadId, run.assistant_id, onTextDelta)
+        attempt += 1
+    return run
+
+
+def consumeStream(
+    manager, onTextDelta: Optional[Callable[[str], None]] = None
+) -> Optional[Run]:
+    """
+    Reads an Assistants event stream to the end and returns the last run snapshot.
+
+    The stream stops on its own once the run needs action or reaches a final state.
+
+    Args:
+    - manager: An AssistantStreamManager returned by runs.stream or submit_tool_outputs_stream.
+    - onTextDelta: Optional callback that receives each chunk of assistant text as it arrives.
+
+    Returns:
+    - Run: The most recent run object seen on the stream, or None if there was none.
+    """
+    run = None
+    with span("run.stream") as s, manager as stream:
+        startedAt = time.perf_counter()
+        for event in stream:
+            checkpoint()
+            if event.event in RUN_EVENTS:
+                run = event.data
+            elif event.event == "thread.message.delta":
+                if "firstToken" not in s.attributes:
+                    s.attributes["firstToken"] = time.perf_counter() - startedAt
+                if onTextDelta is None:
+                    continue
+                for part in event.data.delta.content or []:
+                    if part.type == "text" and part.text and part.text.value:
+                        onTextDelta(part.text.value)
+    return run
+
+
+def createRun(
+    client: openai.Client,
+    threadId: str,
+    assistantId: str,
+    onTextDelta: Optional[Callable[[str], None]] = None,
+) -> Run:
+    """
+    Starts a new run on a thread and drives it until it needs action or finishes.
+
+    Streams the run events when possible and falls back to backoff polling
+    otherwise. Runs that fail with rate_limit_exceeded are retried.
+
+    Args:
+    - client: The OpenAI client to use.
+    - threadId: ID of the thread to run.
+    - assistantId: ID of the assistant that should answer.
+    - onTextDelta: Optional callback that receives assistant text as it streams in.
+
+    Returns:
+    - Run: The run object once it needs action or has finished.
+    """
+    with span("run.create"):
+        run = _createRun(client, threadId, assistantId, onTextDelta)
+    return retryRateLimited(client, threadId, run, onTextDelta)
+
+
+def _createRun(client, threadId, assistantId, onTextDelta) -> Run:
+    if USE_STREAMING and hasattr(client.beta.threads.runs, "stream"):
+        try:
+            run = consumeStream(
+                client.beta.threads.runs.stream(
+                    thread_id=threadId, assistant_id=assistantId
+                ),
+                onTextDelta,
+            )
+            if run is not None and run.status not in ACTIVE_STATUSES:
+                return run
+            if run is not None:
+                return waitForRun(client, threadId, run.id)
+        except openai.APIStatusError as e:
+            logger.warning(f"Run streaming failed, falling back to polling: {e}")
+    run = client.beta.threads.runs.create(thread_id=threadId, assistant_id=assistantId)
+    return waitForRun(client, threadId, run.id)
+
+
+def submitToolOutputs(
+    client: openai.Client,
+    threadId: str,
+    runId: str,
+    toolOutputs: Iterable[dict],
+    onTextDelta: Optional[Callable[[str], None]] = None,
+) -> Run:
+    """
+    Submits tool outputs for a run and drives it until it needs action or finishes.
+
+    If the run then fails with rate_limit_exceeded, a new run is started, so
+    the returned run's ID may differ from `runId`.
+
+    Args:
+    - client: The OpenAI client to use.
+    - threadId: ID of the thread the run belongs to.
+    - runId: ID of the run waiting on the tool outputs.
+    - toolOutputs: A list of {"tool_call_id", "output"} dicts.
+    - onTextDelta: Optional callback that receives assistant text as it streams in.
+
+    Returns:
+    - Run: The run object once it needs action or has finished.
+    """
+    with span("run.submit_tool_outputs"):
+        run = _submitToolOutputs(client, threadId, runId, list(toolOutputs), onTextDelta)
+    return retryRateLimited(client, threadId, run, onTextDelta)
+
+
+def _submitToolOutputs(client, threadId, runId, toolOutputs, onTextDelta) -> Run:
+    if USE_STREAMING and hasattr(client.beta.threads.runs, "submit_tool_outputs_stream"):
+        try:
+            run = consumeStream(
+                client.beta.threads.runs.submit_tool_outputs_stream(
+                    run_id=runId, thread_id=threadId, tool_outputs=toolOutputs
+                ),
+                onTextDelta,
+            )
+            if run is not None and run.status not in ACTIVE_STATUSES:
+                return run
+            return waitForRun(client, threadId, runId)
+        except openai.APIStatusError as e:
+            logger.warning(f"Tool output streaming failed, falling back to polling: {e}")
+    client.beta.threads.runs.submit_tool_outputs(
+        run_id=runId, thread_id=threadId, tool_outputs=toolOutputs
+    )
+    return waitForRun(client, threadId, runId)
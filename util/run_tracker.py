@@ -0,0 +1,216 @@
+import contextvars
+import os
+import threading
+import time
+import openai
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+from openai.types.beta.threads import Run
+from util.logger import logger
+from util.tracing import span
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Minimum seconds between heartbeats while a turn waits on its run
+RUN_CHECKPOINT_INTERVAL = float(os.environ.get("RUN_CHECKPOINT_INTERVAL", 0.25))
+# Statuses in which a run still holds its thread, so it has to be cancelled before anything else can happen
+HOLDING_STATUSES = ("queued", "in_progress", "requires_action")
+
+
+class RunSuperseded(Exception):
+    """Raised in a turn whose run was cancelled because newer input took over its thread."""
+
+
+class RunLease:
+    """
+    One turn's claim on a thread.
+
+    Attributes:
+        threadId (str): The thread the turn runs on.
+        eventId (str): ID of the user event the turn answers.
+        delivered (bool): Whether the user's input may already have reached the thread.
+        resumeRunId (Optional[str]): A run left by an earlier turn, to wait on before anything else.
+        superseded (bool): Set once newer input has taken the thread over.
+        released (bool): Set once the turn has finished, one way or another.
+    """
+
+    __slots__ = (
+        "threadId",
+        "eventId",
+        "delivered",
+        "resumeRunId",
+        "superseded",
+        "released",
+        "heartbeat",
+        "lastBeat",
+    )
+
+    def __init__(self, threadId: str, eventId: str, heartbeat: Optional[Callable[[], None]] = None):
+        self.threadId = threadId
+        self.eventId = eventId
+        self.delivered = False
+        self.resumeRunId: Optional[str] = None
+        self.superseded = False
+        self.released = False
+        self.heartbeat = heartbeat
+        self.lastBeat = time.monotonic()
+
+    def checkpoint(self) -> None:
+        """
+        Stops the turn if it was superseded and otherwise sends a throttled heartbeat.
+
+        In a Streamlit script, the heartbeat touches an element, which is where
+        Streamlit stops a script run that the user has already moved on from.
+
+        Raises:
+        - RunSuperseded: If newer input has taken the thread over.
+        """
+        if self.superseded:
+            raise RunSuperseded(f"Turn for {self.eventId} was superseded on thread {self.threadId}")
+        if self.heartbeat is not None and time.monotonic() - self.lastBeat >= RUN_CHECKPOINT_INTERVAL:
+            self.lastBeat = time.monotonic()
+            self.heartbeat()
+
+
+# The lease of the turn running in the current context, checked by the run engine while it waits
+currentLease: contextvars.ContextVar[Optional[RunLease]] = contextvars.ContextVar(
+    "currentLease", default=None
+)
+
+
+def checkpoint() -> None:
+    """Runs the current turn's lease checkpoint, if the caller is inside a turn."""
+    lease = currentLease.get()
+    if lease is not None:
+        lease.checkpoint()
+
+
+class RunTracker:
+    """
+    Makes sure each thread has at most one turn, and so at most one run, in flight.
+
+    A turn that finishes, or fails with an ordinary exception, releases its
+    lease. A turn that is stopped from outside, e.g. when Streamlit abandons a
+    script run because the user clicked or typed, leaves its lease behind. The
+    next turn on the thread then looks at the thread's latest run. If the new
+    turn answers the same input, it picks that run up instead of asking again.
+    Otherwise the old turn is superseded: its run is cancelled, and if it is
+    still running somewhere it stops at its next checkpoint and its result is
+    dropped.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.leases: Dict[str, RunLease] = {}
+        self.counters = {"turns": 0, "resumed": 0, "superseded": 0, "cancelled": 0}
+
+    def acquire(
+        self,
+        client: openai.Client,
+        threadId: str,
+        eventId: str,
+        heartbeat: Optional[Callable[[], None]] = None,
+    ) -> RunLease:
+        """
+        Gives a turn the thread, resuming or superseding whatever turn held it before.
+
+        Args:
+        - client: The OpenAI client to use.
+        - threadId: The thread the turn runs on.
+        - eventId: ID of the user event the turn answers.
+        - heartbeat: Called every RUN_CHECKPOINT_INTERVAL seconds while the turn waits.
+
+        Returns:
+        - RunLease: The turn's lease. Its resumeRunId, if set, is the run to wait on first.
+        """
+        lease = RunLease(threadId, eventId, heartbeat)
+        with self.lock:
+            previous = self.leases.get(threadId)
+            self.leases[threadId] = lease
+            self.counters["turns"] += 1
+        if previous is None or previous.released:
+            return lease
+        latest = self.latestRun(client, threadId)
+        lease.resumeRunId = latest.id if latest is not None else None
+        if previous.eventId == eventId and previous.delivered:
+            # The same input again, e.g. after a rerun stopped the script: wait for its answer instead of asking twice
+            logger.debug(f"Resuming the run on thread {threadId}")
+            lease.delivered = True
+            with self.lock:
+                self.counters["resumed"] += 1
+            return lease
+        previous.superseded = True
+        with self.lock:
+            self.counters["superseded"] += 1
+        # An undelivered turn left the thread as it found it, e.g. waiting on the user's button click
+        if previous.delivered and latest is not None and latest.status in HOLDING_STATUSES:
+            self.cancel(client, threadId, latest.id)
+        return lease
+
+    def latestRun(self, client: openai.Client, threadId: str) -> Optional[Run]:
+        runs = client.beta.threads.runs.list(thread_id=threadId, limit=1, order="desc")
+        return runs.data[0] if runs.data else None
+
+    def cancel(self, client: openai.Client, threadId: str, runId: str) -> None:
+        """Asks the API to cancel a run; a run that has already stopped is left as it is."""
+        logger.info(f"Cancelling superseded run {runId} on thread {threadId}")
+        try:
+            with span("run.cancel"):
+                client.beta.threads.runs.cancel(run_id=runId, thread_id=threadId)
+        except openai.BadRequestError as e:
+            logger.debug(f"Run {runId} could not be cancelled: {e}")
+            return
+        with self.lock:
+            self.counters["cancelled"] += 1
+
+    def release(self, lease: RunLease) -> None:
+        """Marks a turn as finished, so the next turn on its thread starts fresh."""
+        with self.lock:
+            lease.released = True
+            if self.leases.get(lease.threadId) is lease:
+                del self.leases[lease.threadId]
+
+    @contextmanager
+    def claim(
+        self,
+        client: openai.Client,
+        threadId: str,
+        eventId: str,
+        heartbeat: Optional[Callable[[], None]] = None,
+    ) -> Iterator[RunLease]:
+        """
+        Holds a lease for the duration of a turn and makes it the current one.
+
+        The lease is released when the block finishes or raises an Exception,
+        but not when it is stopped by a BaseException such as Streamlit's
+        rerun, so the next turn knows to clean up after it.
+
+        Args:
+        - client: The OpenAI client to use.
+        - threadId: The thread the turn runs on.
+        - eventId: ID of the user event the turn answers.
+        - heartbeat: Called every RUN_CHECKPOINT_INTERVAL seconds while the turn waits.
+
+        Returns:
+        - Iterator[RunLease]: The lease, for the with block.
+        """
+        lease = self.acquire(client, threadId, eventId, heartbeat)
+        token = currentLease.set(lease)
+        try:
+            yield lease
+        except Exception:
+            self.release(lease)
+            raise
+        else:
+            self.release(lease)
+        finally:
+            currentLease.reset(token)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns how many turns ran, and how many resumed, superseded and cancelled earlier runs."""
+        with self.lock:
+            return {**self.counters, "inFlight": len(self.leases)}
+
+
+runTracker = RunTracker()
@@ -0,0 +1,229 @@
+import contextvars
+import os
+import random
+import threading
+import time
+import httpx
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+from util.logger import logger
+
+# Budgets per minute; 0 means unlimited
+REQUESTS_PER_MINUTE = float(os.environ.get("OPENAI_RPM", 0))
+TOKENS_PER_MINUTE = float(os.environ.get("OPENAI_TPM", 0))
+# Runs don't say how many tokens they will use up front, so each one reserves this many
+RUN_TOKEN_ESTIMATE = int(os.environ.get("OPENAI_RUN_TOKEN_ESTIMATE", 1000))
+MAX_RETRIES = int(os.environ.get("OPENAI_RATE_LIMIT_RETRIES", 5))
+BACKOFF_BASE = float(os.environ.get("OPENAI_BACKOFF_BASE", 0.5))
+BACKOFF_MAX = float(os.environ.get("OPENAI_BACKOFF_MAX", 20))
+
+# The session a request is made for, used to queue sessions fairly
+currentSession: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "currentSession", default="global"
+)
+
+
+def backoffDelay(attempt: int, floor: float = 0.0) -> float:
+    """
+    Returns a jittered exponential backoff delay for a retry.
+
+    Args:
+    - attempt: How many retries came before this one, starting at 0.
+    - floor: Minimum delay, e.g. from a Retry-After header.
+
+    Returns:
+    - float: Seconds to wait, uniformly spread up to the exponential cap.
+    """
+    cap = min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt)
+    return max(floor, random.uniform(0, cap))
+
+
+class TokenBucket:
+    """
+    A bucket holding up to one minute of budget, refilled continuously.
+
+    Not thread-safe on its own; the Scheduler guards it with its lock.
+
+    Attributes:
+        perMinute (float): Budget added per minute, 0 for unlimited.
+        level (float): Budget currently available.
+    """
+
+    def __init__(self, perMinute: float):
+        self.perMinute = perMinute
+        self.level = perMinute
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(
+            self.perMinute, self.level + (now - self.updated) * self.perMinute / 60
+        )
+        self.updated = now
+
+    def wait(self, amount: float) -> float:
+        """Returns how many seconds until `amount` is available."""
+        if not self.perMinute:
+            return 0.0
+        self.refill()
+        # A request bigger than the whole bucket only waits for a full one
+        missing = min(amount, self.perMinute) - self.level
+        return max(missing, 0) * 60 / self.perMinute
+
+    def take(self, amount: float) -> None:
+        if self.perMinute:
+            self.level -= amount
+
+
+class Scheduler:
+    """
+    Admits OpenAI requests within per-minute request and token budgets.
+
+    Waiting requests are queued per session and admitted round-robin, so one
+    busy session can't starve the others. A rate-limit response pauses every
+    session, not only the one that hit it.
+    """
+
+    def __init__(self, requestsPerMinute: float, tokensPerMinute: float):
+        self.requests = TokenBucket(requestsPerMinute)
+        self.tokens = TokenBucket(tokensPerMinute)
+        self.condition = threading.Condition()
+        self.queues: "OrderedDict[str, Deque[object]]" = OrderedDict()
+        self.pausedUntil = 0.0
+        self.depth = 0
+        self.maxDepth = 0
+        self.admitted = 0
+        self.waitSeconds = 0.0
+        self.retries = 0
+        self.rateLimited = 0
+
+    def acquire(self, tokens: int = 0, session: Optional[str] = None) -> None:
+        """
+        Blocks until it is this request's turn and the budgets allow it.
+
+        Args:
+        - tokens: Estimated tokens the request will use.
+        - session: The session to queue under, by default the current one.
+        """
+        session = session or currentSession.get()
+        ticket = object()
+        start = time.monotonic()
+        with self.condition:
+            self.queues.setdefault(session, deque()).append(ticket)
+            self.depth += 1
+            self.maxDepth = max(self.maxDepth, self.depth)
+            while True:
+                head = next(iter(self.queues.values()))[0]
+                if head is ticket:
+                    delay = max(
+                        self.pausedUntil - time.monotonic(),
+                        self.requests.wait(1),
+                        self.tokens.wait(tokens),
+                    )
+                    if delay <= 0:
+                        break
+                    self.condition.wait(delay)
+                else:
+                    self.condition.wait()
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            # Send this session to the back of the line
+            queue = self.queues.pop(session)
+            queue.popleft()
+            if queue:
+                self.queues[session] = queue
+            self.depth -= 1
+            self.admitted += 1
+            self.waitSeconds += time.monotonic() - start
+            self.condition.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Holds back every queued request for the given number of seconds."""
+        with self.condition:
+            self.pausedUntil = max(self.pausedUntil, time.monotonic() + seconds)
+            self.rateLimited += 1
+            self.condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns queue depth, admission and rate-limit counters."""
+        with self.condition:
+            return {
+                "queueDepth": self.depth,
+                "maxQueueDepth": self.maxDepth,
+                "sessionsWaiting": len(self.queues),
+                "admitted": self.admitted,
+                "avgWaitMs": round(self.waitSeconds / self.admitted * 1000, 1)
+                if self.admitted
+                else 0.0,
+                "rateLimited": self.rateLimited,
+                "retries": self.retries,
+            }
+
+
+def retryAfter(response: httpx.Response) -> float:
+    """Reads the server's requested delay from a 429 response, or 0 if it gave none."""
+    for header, scale in (("retry-after-ms", 1000), ("retry-after", 1)):
+        try:
+            return float(response.headers[header]) / scale
+        except (KeyError, ValueError):
+            continue
+    return 0.0
+
+
+def isQuotaExhausted(response: httpx.Response) -> bool:
+    """Whether a 429 says the account is out of credit, which waiting won't fix."""
+    try:
+        return response.json()["error"]["code"] == "insufficient_quota"
+    except (ValueError, KeyError, TypeError):
+        return False
+
+
+class ScheduledTransport(httpx.BaseTransport):
+    """
+    An httpx transport that sends OpenAI API requests through the scheduler.
+
+    Only requests carrying an API key are scheduled, so image downloads from
+    the CDN go straight out. Runs reserve RUN_TOKEN_ESTIMATE tokens. A 429 is
+    retried with jittered backoff after pausing the whole scheduler, except
+    for insufficient_quota. This is the only layer that retries 429s: the one
+    finally returned is marked x-should-retry: false, so the OpenAI client's
+    own retries, which still cover timeouts and 5xx, don't start over.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, scheduler: Scheduler):
+        self.transport = transport
+        self.scheduler = scheduler
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if "authorization" not in request.headers:
+            return self.transport.handle_request(request)
+        tokens = 0
+        if request.method == "POST" and request.url.path.endswith(
+            ("/runs", "/submit_tool_outputs")
+        ):
+            tokens = RUN_TOKEN_ESTIMATE
+        for attempt in range(MAX_RETRIES + 1):
+            self.scheduler.acquire(tokens)
+            response = self.transport.handle_request(request)
+            if response.status_code != 429:
+                return response
+            response.read()
+            if isQuotaExhausted(response):
+                logger.error(f"OpenAI quota exhausted on {request.url.path}")
+            elif attempt < MAX_RETRIES:
+                response.close()
+                delay = backoffDelay(attempt, retryAfter(response))
+                logger.warning(f"Rate limited on {request.url.path}, retrying in {delay:.2f}s")
+                self.scheduler.pause(delay)
+                with self.scheduler.condition:
+                    self.scheduler.retries += 1
+                continue
+            # Retrying ends here, so the OpenAI client must not start over
+            response.headers["x-should-retry"] = "false"
+            return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+scheduler = Scheduler(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
@@ -0,0 +1,256 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+from nanoid import generate
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from util import event_codec
+from util.conversation_store import NullConversationStore, conversationStore
+from util.logger import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds without a rerun after which a session's history is dropped from memory
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", 1800))
+# Estimated bytes all sessions together may hold; past it, the longest idle sessions are dropped first
+SESSION_MEMORY_BUDGET = int(os.environ.get("SESSION_MEMORY_BUDGET", 512 * 1024 * 1024))
+# Sessions active more recently than this are never dropped, however tight the budget
+SESSION_MIN_IDLE = float(os.environ.get("SESSION_MIN_IDLE", 120))
+# Minimum seconds between sweeps for idle sessions
+SESSION_SWEEP_INTERVAL = float(os.environ.get("SESSION_SWEEP_INTERVAL", 30))
+# A session's history, render cache and message sync take about this many times the history's event_codec size
+SESSION_MEMORY_FACTOR = float(os.environ.get("SESSION_MEMORY_FACTOR", 30))
+# Session value holding the manager's key for the session, which is never dropped
+SESSION_KEY = "sessionManagerKey"
+
+
+def rssBytes() -> Optional[int]:
+    """Returns the process's current resident set size, or None where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class SessionEntry:
+    """
+    What the session manager knows about one browser session.
+
+    Attributes:
+        sessionId (str): Streamlit's ID for the session, to notice when it closes.
+        conversationId (str): The conversation the session shows.
+        state (Any): The session's state, or None once its values were dropped.
+        keys (Sequence[str]): Session values that can be dropped and restored from the conversation store.
+        sizes (List[int]): Encoded size of each message in the history.
+        lastSeen (float): When the session last ran, in time.monotonic() seconds.
+        evictable (bool): Whether the session was between turns when it last ran.
+    """
+
+    __slots__ = ("sessionId", "conversationId", "state", "keys", "sizes", "lastSeen", "evictable")
+
+    def __init__(self, sessionId: str, conversationId: str, state: Any):
+        self.sessionId = sessionId
+        self.conversationId = conversationId
+        self.state = state
+        self.keys: Sequence[str] = ()
+        self.sizes: List[int] = []
+        self.lastSeen = time.monotonic()
+        self.evictable = False
+
+    @property
+    def resident(self) -> bool:
+        return self.state is not None
+
+    @property
+    def estimatedBytes(self) -> int:
+        return int(sum(self.sizes) * SESSION_MEMORY_FACTOR) if self.resident else 0
+
+
+class SessionManager:
+    """
+    Process-wide accounting of session memory, dropping idle sessions' histories to stay in budget.
+
+    Every session reports in once per script run, after its conversation was
+    written to the conversation store. Its memory is estimated from the
+    encoded size of its history. Sessions idle longer than the TTL, and then
+    the longest idle ones while the estimate is over budget, have the values
+    listed by the app dropped from their session state. The store already
+    holds a snapshot of everything dropped, so the app rehydrates the session
+    from there the next time it runs. With persistence turned off
+    (CONVERSATION_STORE=none) nothing is dropped, and sessions are only counted.
+
+    Attributes:
+        idleTtl (float): Seconds without a rerun after which a session is dropped.
+        budget (int): Estimated bytes all sessions may hold.
+        minIdle (float): Seconds a session must be idle before the budget can drop it.
+        sweepInterval (float): Minimum seconds between sweeps.
+        persistent (bool): Whether dropped sessions can be restored, so may be dropped at all.
+    """
+
+    def __init__(
+        self,
+        idleTtl: float = SESSION_IDLE_TTL,
+        budget: int = SESSION_MEMORY_BUDGET,
+        minIdle: float = SESSION_MIN_IDLE,
+        sweepInterval: float = SESSION_SWEEP_INTERVAL,
+        persistent: bool = True,
+    ):
+        self.idleTtl = idleTtl
+        self.budget = budget
+        self.minIdle = minIdle
+        self.sweepInterval = sweepInterval
+        self.persistent = persistent
+        self.lock = threading.Lock()
+        self.entries: Dict[str, SessionEntry] = {}
+        self.lastSweep = time.monotonic()
+        self.counters = {"idleEvictions": 0, "budgetEvictions": 0, "rehydrated": 0, "closed": 0}
+
+    def currentKey(self) -> Optional[str]:
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is None:
+            return None
+        if SESSION_KEY not in ctx.session_state:
+            ctx.session_state[SESSION_KEY] = generate(size=12)
+        return ctx.session_state[SESSION_KEY]
+
+    def enter(self) -> None:
+        """
+        Marks the current session as active; call it before the script reads its session values.
+
+        A sweep that is dropping the session's values finishes first, so the
+        script sees them either all there or all gone.
+        """
+        key = self.currentKey()
+        if key is None:
+            return
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+            entry.lastSeen = time.monotonic()
+            # Until it reports in again, the session is mid-run
+            entry.evictable = False
+
+    def touch(
+        self,
+        conversationId: str,
+        messages: List[Dict[str, Any]],
+        evictable: bool,
+        keys: Sequence[str],
+    ) -> None:
+        """
+        Records the current session's size and activity, and sweeps if a sweep is due.
+
+        Only the last few messages can change, so only new messages and the
+        last two known ones are measured again.
+
+        Args:
+        - conversationId: The conversation the session shows.
+        - messages: The session's {"role", "content"} history.
+        - evictable: Whether the session is between turns, with everything written to the conversation store.
+        - keys: Session values that can be dropped and rebuilt from the conversation store.
+        """
+        key = self.currentKey()
+        if key is None:
+            return
+        ctx = get_script_run_ctx(suppress_warning=True)
+        entry = self.entries.get(key)
+        known = len(entry.sizes) if entry is not None and entry.resident else 0
+        start = max(min(known, len(messages)) - 2, 0)
+        measured = [len(event_codec.dumps(m["content"])) for m in messages[start:]]
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = SessionEntry(ctx.session_id, conversationId, ctx.session_state)
+            elif not entry.resident:
+                self.counters["rehydrated"] += 1
+            entry.sessionId = ctx.session_id
+            entry.conversationId = conversationId
+            # Each script run has its own wrapper around the session's state; keep the latest
+            entry.state = ctx.session_state
+            entry.keys = keys
+            entry.sizes[start:] = measured
+            entry.lastSeen = time.monotonic()
+            entry.evictable = evictable
+        if time.monotonic() - self.lastSweep >= self.sweepInterval:
+            self.sweep(exclude=key)
+
+    def isActive(self, entry: SessionEntry) -> bool:
+        if not Runtime.exists():
+            return True
+        return bool(Runtime.instance().is_active_session(entry.sessionId))
+
+    def evict(self, entry: SessionEntry) -> None:
+        """Drops an idle session's values from its session state; call with the lock held."""
+        state = entry.state
+        for key in entry.keys:
+            if key in state:
+                del state[key]
+        entry.state = None
+        entry.sizes = []
+
+    def sweep(self, exclude: Optional[str] = None) -> int:
+        """
+        Forgets closed sessions and drops idle ones, past the TTL or over the budget.
+
+        Args:
+        - exclude: Key of a session that must stay, e.g. the one whose script run is sweeping.
+
+        Returns:
+        - int: How many sessions were dropped.
+        """
+        now = time.monotonic()
+        evicted = 0
+        with self.lock:
+            self.lastSweep = now
+            for key, entry in list(self.entries.items()):
+                if not self.isActive(entry):
+                    del self.entries[key]
+                    self.counters["closed"] += 1
+            if not self.persistent:
+                return 0
+            idle = sorted(
+                (
+                    e
+                    for key, e in self.entries.items()
+                    if e.resident and e.evictable and key != exclude
+                ),
+                key=lambda e: e.lastSeen,
+            )
+            total = sum(e.estimatedBytes for e in self.entries.values())
+            for entry in idle:
+                idleFor = now - entry.lastSeen
+                if idleFor >= self.idleTtl:
+                    self.counters["idleEvictions"] += 1
+                elif total > self.budget and idleFor >= self.minIdle:
+                    self.counters["budgetEvictions"] += 1
+                else:
+                    continue
+                total -= entry.estimatedBytes
+                self.evict(entry)
+                evicted += 1
+        if evicted:
+            logger.info(f"Dropped {evicted} idle sessions from memory, about {total} bytes left")
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns session counts, estimated session memory and the process's resident memory."""
+        with self.lock:
+            resident = [e for e in self.entries.values() if e.resident]
+            estimated = [e.estimatedBytes for e in resident]
+            return {
+                "sessions": len(self.entries),
+                "resident": len(resident),
+                "evicted": len(self.entries) - len(resident),
+                "estimatedBytes": sum(estimated),
+                "largestSession": max(estimated, default=0),
+                "budget": self.budget,
+                "rssBytes": rssBytes(),
+                **self.counters,
+            }
+
+
+sessionManager = SessionManager(persistent=not isinstance(conversationStore, NullConversationStore))
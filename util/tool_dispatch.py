@@ -0,0 +1,225 @@
+import contextvars
+import json
+import os
+import time
+import openai
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from openai.types.beta.threads import Run
+from util.message_sync import MessageSync, assistantReplies
+from util.pydantic_classes import BotMessage, BotMessageTypes, ToolResult
+from util.run_engine import submitToolOutputs
+from util.tool_registry import ToolArgumentError, ToolRegistry, UnknownToolError
+from util.logger import logger
+from util.tracing import span
+
+# Tool calls from every session share this pool, so a burst can't spawn unbounded threads
+executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("TOOL_WORKERS", 8)),
+    thread_name_prefix="tool-call",
+)
+TOOL_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT", 30))
+
+
+def errorOutput(status: int, message: str) -> str:
+    """Builds the tool output reported to the assistant when a tool call fails."""
+    return json.dumps({"status": status, "error": message})
+
+
+def runToolCall(toolCall, registry: ToolRegistry) -> ToolResult:
+    """
+    Runs the handler for one tool call.
+
+    Args:
+    - toolCall: The tool call from the run's required action.
+    - registry: The registry holding the tool's handler.
+
+    Returns:
+    - ToolResult: The handler's result, or an error output if it could not run.
+    """
+    name = toolCall.function.name
+    with span("tool.call", tool=name):
+        try:
+            return registry.dispatch(name, toolCall.function.arguments)
+        except UnknownToolError as e:
+            logger.error(str(e))
+            return ToolResult(output=errorOutput(404, f"Unknown tool {name}"))
+        except ToolArgumentError as e:
+            # Told to the assistant so it can retry with fixed arguments
+            logger.warning(f"Invalid arguments for {name}: {e}")
+            return ToolResult(output=errorOutput(400, str(e)))
+
+
+def startedToolCall(started: List[float], toolCall, registry: ToolRegistry) -> ToolResult:
+    """Runs a tool call on the pool, noting when a worker picked it up."""
+    started.append(time.monotonic())
+    return runToolCall(toolCall, registry)
+
+
+def awaitToolCall(future: Future, started: List[float], submittedAt: float, timeout: float) -> ToolResult:
+    """
+    Waits for one tool call, giving its handler `timeout` seconds from when it started.
+
+    Time spent queued behind other sessions' calls doesn't count against the
+    handler, but a call that is still queued after `timeout` seconds is
+    cancelled, so a saturated pool can't stall the turn.
+
+    Args:
+    - future: The submitted call.
+    - started: Filled with the call's start time once a worker picks it up.
+    - submittedAt: When the call was submitted, in time.monotonic() seconds.
+    - timeout: Seconds the handler may run, and the call may wait for a worker.
+
+    Returns:
+    - ToolResult: The handler's result.
+
+    Raises:
+    - TimeoutError: If the call didn't start or didn't finish in time.
+    """
+    try:
+        return future.result(timeout=max(submittedAt + timeout - time.monotonic(), 0))
+    except TimeoutError:
+        if future.cancel():
+            raise
+    # A worker has it, so the handler's time runs from when it started
+    startedAt = started[0] if started else time.monotonic()
+    return future.result(timeout=max(startedAt + timeout - time.monotonic(), 0))
+
+
+def dispatchToolCalls(toolCalls: List[Any], registry: ToolRegistry) -> List[ToolResult]:
+    """
+    Runs a run's tool calls concurrently and collects their results in call order.
+
+    Each call gets its own timeout (TOOL_TIMEOUT unless the tool was registered
+    with one), counted from when its handler starts. A call that times out,
+    waits that long for a worker, or raises is answered with an error output
+    instead, so one bad tool never stalls or sinks the whole turn. Timed out
+    handlers keep running in the background; their results are discarded.
+    Buttons a call shows are tagged with its ID, so a click answers that call.
+
+    Args:
+    - toolCalls: The tool calls from the run's required action.
+    - registry: The registry holding the tool handlers.
+
+    Returns:
+    - List[ToolResult]: One result per tool call.
+    """
+    submittedAt = time.monotonic()
+    calls = []
+    for call in toolCalls:
+        started = []
+        future = executor.submit(contextvars.copy_context().run, startedToolCall, started, call, registry)
+        calls.append((call, future, started))
+    results = []
+    for call, future, started in calls:
+        name = call.function.name
+        try:
+            result = awaitToolCall(future, started, submittedAt, registry.timeout(name) or TOOL_TIMEOUT)
+        except TimeoutError:
+            if future.cancelled():
+                logger.error(f"Tool {name} never got a worker")
+                result = ToolResult(output=errorOutput(503, f"{name} could not be run, the server is busy"))
+            else:
+                logger.error(f"Tool {name} timed out")
+                result = ToolResult(output=errorOutput(504, f"{name} timed out"))
+        except Exception as e:
+            logger.error(f"Tool {name} failed: {e}")
+            result = ToolResult(output=errorOutput(500, str(e)))
+        result.toolCallId = call.id
+        for message in result.messages:
+            if message.type == BotMessageTypes.button:
+                message.payload.toolCallId = call.id
+        results.append(result)
+    return results
+
+
+def replyText(userInput: Dict[str, Any]) -> str:
+    """The user's reply as the assistant sees it, without the app's bookkeeping."""
+    return str({key: value for key, value in userInput.items() if key != "toolCallId"})
+
+
+def replyOutputs(
+    toolCalls: List[Any],
+    outputs: List[Dict[str, str]],
+    userInput: Dict[str, Any],
+) -> List[Dict[str, str]]:
+    """
+    Completes a round's tool outputs with the user's reply.
+
+    A button click answers the call whose buttons were clicked. Typed input,
+    or a click on buttons that name no open call, answers every open call. The
+    API needs an output for every call, so calls the reply wasn't meant for
+    are told that the user answered another one.
+
+    Args:
+    - toolCalls: The tool calls from the run's required action.
+    - outputs: Outputs of the calls that already ran.
+    - userInput: The user's reply, as in the user event's payload.
+
+    Returns:
+    - List[Dict[str, str]]: An output for every call.
+    """
+    answered = {output["tool_call_id"] for output in outputs}
+    openIds = [call.id for call in toolCalls if call.id not in answered]
+    target = userInput.get("toolCallId")
+    reply = replyText(userInput)
+    return outputs + [
+        {
+            "tool_call_id": callId,
+            "output": reply
+            if target not in openIds or callId == target
+            else errorOutput(409, "The user answered another question instead"),
+        }
+        for callId in openIds
+    ]
+
+
+def resolveToolCalls(
+    client: openai.Client,
+    threadId: str,
+    run: Run,
+    registry: ToolRegistry,
+    messageSync: MessageSync,
+    onTextDelta: Optional[Callable[[str], None]] = None,
+) -> Tuple[Run, List[BotMessage], List[Dict[str, str]]]:
+    """
+    Handles a run's tool calls until it no longer needs them or one waits on the user.
+
+    All outputs for a round are sent back in one submit_tool_outputs call. The
+    API only accepts a complete set of outputs, so when a call waits for the
+    user's reply (output None) the outputs that are ready are returned instead
+    and must be submitted together with that reply.
+
+    The thread is synced before each round and once the run completes, so
+    the messages come out in the order the assistant wrote them: text written
+    before a round of tool calls goes ahead of what those calls show.
+
+    Args:
+    - client: The OpenAI client to use.
+    - threadId: The ID of the run's thread.
+    - run: The run, possibly in the requires_action state.
+    - registry: The registry holding the tool handlers.
+    - messageSync: The thread's message cursor, to fetch the assistant's text with.
+    - onTextDelta: Optional callback that receives reply text streamed after the outputs are submitted.
+
+    Returns:
+    - Tuple: The latest run, the messages to show and the tool outputs held back for the user's reply.
+    """
+    replies = []
+    while run.status == "requires_action":
+        replies.extend(assistantReplies(messageSync.fetchNew(client)))
+        toolCalls = run.required_action.submit_tool_outputs.tool_calls
+        with span("tools", calls=len(toolCalls)):
+            results = dispatchToolCalls(toolCalls, registry)
+        outputs = []
+        for result in results:
+            replies.extend(result.messages)
+            if result.output is not None:
+                outputs.append({"tool_call_id": result.toolCallId, "output": result.output})
+        if len(outputs) < len(results):
+            logger.debug(f"Holding {len(outputs)} tool outputs for the user's reply")
+            return run, replies, outputs
+        run = submitToolOutputs(client, threadId, run.id, outputs, onTextDelta)
+    if run.status == "completed":
+        replies.extend(assistantReplies(messageSync.fetchNew(client)))
+    return run, replies, []
@@ -0,0 +1,52 @@
+from typing import Any, Dict
+from util.pydantic_classes import BotButtonMessage, BotMessage, Choice, ToolResult
+from util.generate_image import generateImageAsync
+from util.tool_registry import toolRegistry
+from util.logger import logger
+
+
+@toolRegistry.register("show_buttons")
+def showButtons(args: Dict[str, Any]) -> ToolResult:
+    """
+    Handles show_buttons by showing the choices; the user's pick becomes the tool output.
+
+    Args:
+    - args: The tool call arguments, with the prompt text and the choices.
+
+    Returns:
+    - ToolResult: A button message, with no output until the user answers.
+    """
+    logger.debug("Showing buttons...")
+    return ToolResult(
+        messages=[
+            BotMessage(
+                type="button",
+                payload=BotButtonMessage(
+                    text=args["text"],
+                    choices=[
+                        Choice(label=n["label"], value=n["value"])
+                        for n in args["choices"]
+                    ],
+                    active=True,
+                ),
+            )
+        ]
+    )
+
+
+@toolRegistry.register("generate_image")
+def generateImageTool(args: Dict[str, Any]) -> ToolResult:
+    """
+    Handles generate_image by starting the image in the background.
+
+    Args:
+    - args: The tool call arguments, with the image prompt.
+
+    Returns:
+    - ToolResult: A placeholder image message and an output telling the API the image is on its way.
+    """
+    logger.debug("Generating image...")
+    return ToolResult(
+        messages=[BotMessage(type="image", payload=generateImageAsync(args["prompt"]))],
+        output='{"status":200}',
+    )
@@ -0,0 +1,199 @@
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional
+from util.pydantic_classes import ToolResult
+from util.logger import logger
+
+ToolHandler = Callable[[Dict[str, Any]], ToolResult]
+Validator = Callable[[Any], None]
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Relative paths are taken from the app directory, so the app can be started from anywhere
+TOOLS_FILE = os.path.join(APP_DIR, os.environ.get("TOOLS_FILE", "oai_tools.json"))
+
+TYPE_CHECKS = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+class ToolArgumentError(ValueError):
+    """Raised when a tool call's arguments don't match the tool's schema."""
+
+
+class UnknownToolError(KeyError):
+    """Raised when a tool call names a tool that isn't defined or has no handler."""
+
+
+def compileSchema(schema: Dict[str, Any], path: str = "arguments") -> Validator:
+    """
+    Compiles a JSON schema into a validator function.
+
+    Only the keywords used by function tools are supported (type, properties,
+    required, items and enum); anything else is ignored. All the schema
+    lookups happen here, once, so validating a call is just a few checks.
+
+    Args:
+    - schema: The JSON schema to compile.
+    - path: Where the schema sits in the arguments, used in error messages.
+
+    Returns:
+    - Validator: A function that raises ToolArgumentError for invalid values.
+    """
+    kind = schema.get("type")
+    isType = TYPE_CHECKS.get(kind)
+    enum = schema.get("enum")
+    required = tuple(schema.get("required", ()))
+    properties = [
+        (key, compileSchema(value, f"{path}.{key}"))
+        for key, value in schema.get("properties", {}).items()
+    ]
+    items = compileSchema(schema["items"], f"{path}[]") if "items" in schema else None
+
+    def validate(value: Any) -> None:
+        if isType is not None and not isType(value):
+            raise ToolArgumentError(f"{path} must be of type {kind}")
+        if enum is not None and value not in enum:
+            raise ToolArgumentError(f"{path} must be one of {enum}")
+        if isinstance(value, dict):
+            for key in required:
+                if key not in value:
+                    raise ToolArgumentError(f"{path}.{key} is required")
+            for key, check in properties:
+                if key in value:
+                    check(value[key])
+        elif items is not None and isinstance(value, list):
+            for item in value:
+                items(item)
+
+    return validate
+
+
+class Tool:
+    """
+    A function tool the assistant can call.
+
+    Attributes:
+        name (str): The function name from the tool schema.
+        schema (Dict[str, Any]): The function definition from the tools file.
+        validate (Validator): The compiled validator for the call arguments.
+        handler (Optional[ToolHandler]): The function that handles calls, once registered.
+        timeout (Optional[float]): Seconds a call may take before it is abandoned.
+    """
+
+    __slots__ = ("name", "schema", "validate", "handler", "timeout")
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.name = schema["name"]
+        self.schema = schema
+        self.validate = compileSchema(schema.get("parameters", {}))
+        self.handler: Optional[ToolHandler] = None
+        self.timeout: Optional[float] = None
+
+
+class ToolRegistry:
+    """
+    Maps tool names to their schemas, compiled validators and handlers.
+
+    Schemas are loaded and compiled once when the registry is built. Handlers
+    are attached with `register`, and `dispatch` looks the tool up by name in
+    a dict, so adding a tool never adds branches to the per-call path.
+    """
+
+    def __init__(self, schemas: List[Dict[str, Any]]):
+        self.tools: Dict[str, Tool] = {schema["name"]: Tool(schema) for schema in schemas}
+
+    @classmethod
+    def fromFile(cls, path: str) -> "ToolRegistry":
+        """
+        Builds a registry from a tools file in the oai_tools.json format.
+
+        Args:
+        - path: Path to a JSON list of function definitions.
+
+        Returns:
+        - ToolRegistry: A registry with every tool in the file and no handlers yet.
+        """
+        with open(path, "r") as file:
+            return cls(json.load(file))
+
+    def forSchemas(self, schemas: List[Dict[str, Any]]) -> "ToolRegistry":
+        """
+        Builds a registry for another set of tools that reuses this one's handlers.
+
+        Tools without a handler here get none, so calls to them fail like calls to unknown tools.
+
+        Args:
+        - schemas: Function definitions, e.g. the tools an assistant was created with.
+
+        Returns:
+        - ToolRegistry: A registry with those tools and the matching handlers and timeouts.
+        """
+        registry = ToolRegistry(schemas)
+        for name, tool in registry.tools.items():
+            if name in self.tools:
+                tool.handler = self.tools[name].handler
+                tool.timeout = self.tools[name].timeout
+        return registry
+
+    def register(
+        self, name: str, timeout: Optional[float] = None
+    ) -> Callable[[ToolHandler], ToolHandler]:
+        """
+        Decorator that attaches a handler to a tool from the tools file.
+
+        Args:
+        - name: The tool's function name.
+        - timeout: Optional seconds a call may take, overriding TOOL_TIMEOUT.
+
+        Returns:
+        - Callable: The decorator, which returns the handler unchanged.
+        """
+        if name not in self.tools:
+            raise KeyError(f"Tool {name} is not defined in the tools file")
+
+        def decorator(handler: ToolHandler) -> ToolHandler:
+            self.tools[name].handler = handler
+            self.tools[name].timeout = timeout
+            return handler
+
+        return decorator
+
+    def timeout(self, name: str) -> Optional[float]:
+        """Returns the tool's timeout, or None to use the default."""
+        tool = self.tools.get(name)
+        return tool.timeout if tool else None
+
+    def dispatch(self, name: str, arguments: str) -> ToolResult:
+        """
+        Validates a tool call's arguments and runs its handler.
+
+        Args:
+        - name: The called function's name.
+        - arguments: The call's arguments as a JSON string.
+
+        Returns:
+        - ToolResult: The handler's result.
+
+        Raises:
+        - UnknownToolError: If the tool is unknown or has no handler.
+        - ToolArgumentError: If the arguments don't match the schema.
+        """
+        tool = self.tools.get(name)
+        if tool is None or tool.handler is None:
+            raise UnknownToolError(f"No handler for tool {name}")
+        try:
+            args = json.loads(arguments)
+        except json.JSONDecodeError as e:
+            raise ToolArgumentError(f"arguments are not valid JSON: {e}")
+        tool.validate(args)
+        return tool.handler(args)
+
+
+toolRegistry = ToolRegistry.fromFile(TOOLS_FILE)
+logger.debug(f"Loaded tools: {', '.join(toolRegistry.tools)}")
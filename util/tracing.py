@@ -0,0 +1,198 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from nanoid import generate
+from pydantic import BaseModel, Field
+from dotenv import load_dotenv
+from util.logger import logger
+
+load_dotenv()
+
+
+class Span(BaseModel):
+    """
+    A timed phase of a turn.
+
+    Attributes:
+        name (str): The phase being timed, e.g. run.create.
+        traceId (str): Shared by every span of the same turn.
+        spanId (str): A unique identifier for this span.
+        parentId (Optional[str]): The enclosing span, if any.
+        start (float): Unix timestamp when the span started.
+        duration (float): Seconds the span took.
+        attributes (Dict[str, Any]): Extra details about the span.
+    """
+
+    name: str
+    traceId: str
+    spanId: str = Field(default_factory=lambda: generate(size=16))
+    parentId: Optional[str] = None
+    start: float = Field(default_factory=time.time)
+    duration: float = 0.0
+    attributes: Dict[str, Any] = Field({})
+
+
+class SpanExporter:
+    """Base class for span exporters. Subclasses receive every finished span."""
+
+    def export(self, span: Span) -> None:
+        raise NotImplementedError
+
+
+class RingBufferExporter(SpanExporter):
+    """Keeps the most recent spans in memory and summarizes them per phase."""
+
+    def __init__(self, maxSpans: int = 2000):
+        self.spans = deque(maxlen=maxSpans)
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        Summarizes the buffered spans.
+
+        Returns:
+        - List[Dict]: One row per phase with its count and p50/p95 in milliseconds.
+        """
+        durations: Dict[str, List[float]] = {}
+        for span in list(self.spans):
+            durations.setdefault(span.name, []).append(span.duration)
+        rows = []
+        for name, values in sorted(durations.items()):
+            values.sort()
+            rows.append(
+                {
+                    "phase": name,
+                    "count": len(values),
+                    "p50 (ms)": round(percentile(values, 50) * 1000, 1),
+                    "p95 (ms)": round(percentile(values, 95) * 1000, 1),
+                }
+            )
+        return rows
+
+
+class JsonlExporter(SpanExporter):
+    """Appends each span to a JSON lines file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = span.model_dump_json() + "\n"
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+
+class OpenTelemetryExporter(SpanExporter):
+    """
+    Re-emits spans through the OpenTelemetry API.
+
+    Requires the opentelemetry-api package; the SDK and exporter configured
+    for the process decide where the spans end up.
+    """
+
+    def __init__(self):
+        from opentelemetry import trace
+
+        self.tracer = trace.get_tracer("streamlit-frontend")
+
+    def export(self, span: Span) -> None:
+        startNs = int(span.start * 1e9)
+        otelSpan = self.tracer.start_span(
+            span.name,
+            start_time=startNs,
+            attributes={
+                "traceId": span.traceId,
+                "parentId": span.parentId or "",
+                **{k: str(v) for k, v in span.attributes.items()},
+            },
+        )
+        otelSpan.end(end_time=startNs + int(span.duration * 1e9))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, round(pct / 100 * len(values) + 0.5) - 1))
+    return values[rank]
+
+
+class Tracer:
+    """Hands finished spans to every configured exporter."""
+
+    def __init__(self, exporters: List[SpanExporter]):
+        self.exporters = exporters
+
+    def export(self, span: Span) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.warning(f"Span exporter {type(exporter).__name__} failed: {e}")
+
+
+def makeExporters() -> List[SpanExporter]:
+    """Builds the exporters named in TRACE_EXPORTERS (memory, jsonl, otel)."""
+    exporters = []
+    for name in os.environ.get("TRACE_EXPORTERS", "memory").split(","):
+        name = name.strip().lower()
+        if name == "memory":
+            exporters.append(memoryExporter)
+        elif name == "jsonl":
+            exporters.append(JsonlExporter(os.environ.get("TRACE_FILE", "traces.jsonl")))
+        elif name == "otel":
+            try:
+                exporters.append(OpenTelemetryExporter())
+            except ImportError:
+                logger.warning("TRACE_EXPORTERS includes otel but opentelemetry-api is not installed")
+        elif name:
+            logger.warning(f"Unknown span exporter {name}")
+    return exporters
+
+
+memoryExporter = RingBufferExporter(int(os.environ.get("TRACE_BUFFER_SIZE", 2000)))
+tracer = Tracer(makeExporters())
+_currentSpan: ContextVar[Optional[Span]] = ContextVar("currentSpan", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Times the enclosed block and exports it as a span.
+
+    Spans opened inside another span share its traceId, so all phases of a turn
+    can be grouped together. Exceptions are recorded and re-raised.
+
+    Args:
+    - name: The phase being timed.
+    - attributes: Extra details to attach to the span.
+
+    Yields:
+    - Span: The open span, so callers can add attributes.
+    """
+    parent = _currentSpan.get()
+    current = Span(
+        name=name,
+        traceId=parent.traceId if parent else generate(size=16),
+        parentId=parent.spanId if parent else None,
+        attributes=attributes,
+    )
+    token = _currentSpan.set(current)
+    startedAt = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - startedAt
+        _currentSpan.reset(token)
+        tracer.export(current)